@@ -0,0 +1,381 @@
+import argparse
+import gzip
+import json
+import math
+import os
+import sys
+import time
+import bson
+from bson import json_util
+from bson.json_util import CANONICAL_JSON_OPTIONS, RELAXED_JSON_OPTIONS
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "scripts"))
+from offline_helpers import percentile
+
+# Capacity plan for migrating Kafka connectors to Atlas Stream Processing, per connector and
+# topic, before cutover. For each connector config (the same files /kafka-to-asp converts) and
+# a sample of its topic's messages it:
+#
+#   1. measures the message size distribution and the per-message serialization cost on this
+#      machine: Kafka JSON -> BSON for sinks ($source Kafka -> $merge), BSON -> the $emit
+#      outputFormat (plus compression) for sources (change stream -> $emit)
+#   2. projects the vCPU needed at the expected rate and the smallest SP tier that covers it
+#   3. for sinks, picks the $merge parallelism that keeps the writers below the target
+#      utilization (an M/M/c queue of batch writes)
+#   4. prints the throughput/latency envelope: the maximum sustainable rate on that tier and
+#      estimated p50/p99 latency at the expected rate
+#
+# Samples come from --sample FILE, --samples-dir DIR/<topic>.ndjson or, with --kafka-bootstrap,
+# the topic itself (a running connector's topic or a local Kafka stand-in). Expected rates come
+# from --rate (all topics) or --rates FILE ({"topic or connector name": messages/sec}).
+#
+#   python3 estimate_throughput.py samples/sink-basic.json --sample inventory.ndjson --rate 5000
+#   python3 estimate_throughput.py configs/*.json --samples-dir samples/ --rates rates.json --output plan.json
+#
+# The model is deliberately simple. The measured cost is scaled by --cpu-factor to cover what a
+# processor does besides serialization; calibrate it once against a running processor.
+
+# vCPUs and memory per SP tier. Adjust if the published tier sizes change.
+SP_TIERS = [
+    ("SP2", 0.25, 536870912),
+    ("SP5", 0.5, 1073741824),
+    ("SP10", 1, 2147483648),
+    ("SP30", 2, 8589934592),
+    ("SP50", 8, 34359738368),
+]
+TARGET_UTILIZATION = 0.70
+MAX_MERGE_PARALLELISM = 16
+BSON_MAX_SIZE = 16 * 1024 * 1024
+
+OUTPUT_FORMATS = {"DefaultJson": CANONICAL_JSON_OPTIONS, "ExtendedJson": CANONICAL_JSON_OPTIONS,
+                  "SimplifiedJson": RELAXED_JSON_OPTIONS}
+
+
+def load_connectors(paths):
+    """Reads connector configs; a file may hold one config or a JSON array of them."""
+    connectors = []
+    for path in paths:
+        with open(path) as f:
+            loaded = json.load(f)
+        connectors.extend(loaded if isinstance(loaded, list) else [loaded])
+    return connectors
+
+
+def connector_topics(connector):
+    """The Kafka topics a connector reads (sink) or writes (source), named as in /kafka-to-asp."""
+    if connector["connector.class"] == "MongoDbAtlasSink":
+        return [topic.strip() for topic in connector["topics"].split(",") if topic.strip()]
+    separator = connector.get("topic.separator", ".")
+    parts = [connector["topic.prefix"], connector["database"]]
+    parts += [connector[key] for key in ("collection", "topic.suffix") if connector.get(key)]
+    return [separator.join(parts)]
+
+
+def read_sample_file(path, limit):
+    """Returns up to `limit` raw messages, one per non-empty line (NDJSON / Extended JSON)."""
+    messages = []
+    with open(path, "rb") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                messages.append(line)
+                if len(messages) >= limit:
+                    break
+    return messages
+
+
+def read_sample_kafka(bootstrap_servers, topic, limit, timeout):
+    """Reads up to `limit` message values from the start of a topic."""
+    from confluent_kafka import Consumer
+
+    consumer = Consumer({"bootstrap.servers": bootstrap_servers, "group.id": f"asp-estimator-{os.getpid()}",
+                         "auto.offset.reset": "earliest", "enable.auto.commit": False})
+    consumer.subscribe([topic])
+    messages = []
+    deadline = time.monotonic() + timeout
+    try:
+        while len(messages) < limit and time.monotonic() < deadline:
+            message = consumer.poll(1.0)
+            if message is None or message.error() or message.value() is None:
+                continue
+            messages.append(message.value())
+    finally:
+        consumer.close()
+    return messages
+
+
+def find_sample(topic, connector, args):
+    if args.sample:
+        return read_sample_file(args.sample, args.sample_count)
+    if args.samples_dir:
+        for name in (topic, connector["name"]):
+            for extension in (".ndjson", ".jsonl", ".json"):
+                path = os.path.join(args.samples_dir, name + extension)
+                if os.path.exists(path):
+                    return read_sample_file(path, args.sample_count)
+    if args.kafka_bootstrap:
+        return read_sample_kafka(args.kafka_bootstrap, topic, args.sample_count, args.kafka_timeout)
+    return []
+
+
+def compressor(name):
+    """Returns a compress(bytes) function for a producer compression.type, or None if unavailable here."""
+    if name in (None, "none"):
+        return None
+    if name == "gzip":
+        return lambda data: gzip.compress(data, compresslevel=6)
+    try:
+        if name == "lz4":
+            import lz4.frame
+            return lz4.frame.compress
+        if name == "snappy":
+            import snappy
+            return snappy.compress
+        if name == "zstd":
+            import zstandard
+            return zstandard.ZstdCompressor().compress
+    except ImportError:
+        pass
+    print(f"Note: no Python module for {name} compression here; its cost is not included.")
+    return None
+
+
+def measure(connector, messages, repeat):
+    """Returns size statistics and the per-message serialization cost (seconds) for a sample.
+
+    The fastest of `repeat` passes is used, which is the least disturbed by other work on this machine.
+    """
+    sink = connector["connector.class"] == "MongoDbAtlasSink"
+    documents, valid, bson_docs = [], [], []
+    for raw in messages:
+        # Only JSON objects become documents; scalars, arrays and unencodable values are invalid
+        try:
+            document = json_util.loads(raw)
+            if not isinstance(document, dict):
+                continue
+            data = bson.encode(document)
+        except (ValueError, TypeError, bson.errors.BSONError):
+            continue
+        documents.append(document)
+        valid.append(raw)
+        bson_docs.append(data)
+    if not documents:
+        return None
+
+    if sink:
+        # Kafka message (JSON) -> document -> BSON for the $merge write
+        wire_sizes = [len(raw) for raw in messages]
+
+        def convert():
+            for raw in valid:
+                bson.encode(json_util.loads(raw))
+    else:
+        # Change stream BSON -> $emit outputFormat, compressed in producer batches
+        json_options = OUTPUT_FORMATS.get(connector.get("output.json.format"), RELAXED_JSON_OPTIONS)
+        compress = compressor(connector.get("producer.override.compression.type"))
+        wire_sizes = [len(json_util.dumps(document, json_options=json_options)) for document in documents]
+
+        def convert():
+            batch = []
+            for data in bson_docs:
+                message = json_util.dumps(bson.decode(data), json_options=json_options).encode()
+                if not compress:
+                    continue
+                batch.append(message)
+                if len(batch) == 100:
+                    compress(b"".join(batch))
+                    batch = []
+            if compress and batch:
+                compress(b"".join(batch))
+
+    best = math.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        convert()
+        best = min(best, time.perf_counter() - start)
+
+    bson_sizes = [len(data) for data in bson_docs]
+    return {
+        "messages": len(messages),
+        "invalid": len(messages) - len(valid),
+        "size_p50": percentile(wire_sizes, 50),
+        "size_p95": percentile(wire_sizes, 95),
+        "size_p99": percentile(wire_sizes, 99),
+        "size_max": max(wire_sizes),
+        "size_mean": sum(wire_sizes) / len(wire_sizes),
+        "bson_max": max(bson_sizes),
+        "over_bson_limit": sum(size > BSON_MAX_SIZE for size in bson_sizes),
+        "cost": best / len(valid),
+    }
+
+
+def erlang_c(arrival_rate, service_time, servers):
+    """Probability that a batch has to wait for a free writer in an M/M/c queue (1.0 if overloaded)."""
+    load = arrival_rate * service_time
+    if load >= servers:
+        return 1.0
+    term = total = 1.0
+    for k in range(1, servers):
+        term *= load / k
+        total += term
+    term *= load / servers
+    waiting = term / (1 - load / servers)
+    return waiting / (total + waiting)
+
+
+def merge_wait(arrival_rate, service_time, servers, probability):
+    """Queueing delay exceeded with the given probability, from P(W > t) = C * exp(-(c*mu - lambda) * t)."""
+    waiting = erlang_c(arrival_rate, service_time, servers)
+    if waiting >= 1.0:
+        return math.inf
+    if waiting <= probability:
+        return 0.0
+    return math.log(waiting / probability) / (servers / service_time - arrival_rate)
+
+
+def plan_merge(rate, args):
+    """Picks the smallest $merge parallelism that keeps the batch writers at or below the target utilization."""
+    batch = max(1, min(args.batch_size, math.ceil(rate * args.write_latency_ms / 1000)))
+    service_time = args.write_latency_ms / 1000 + batch * args.per_doc_write_us / 1e6
+    batch_rate = rate / batch
+    for parallelism in range(1, MAX_MERGE_PARALLELISM + 1):
+        if batch_rate * service_time / parallelism <= TARGET_UTILIZATION:
+            break
+    return {
+        "parallelism": parallelism,
+        "batch": batch,
+        "service_time": service_time,
+        "utilization": batch_rate * service_time / parallelism,
+        "capacity": parallelism * args.batch_size / (args.write_latency_ms / 1000 + args.batch_size * args.per_doc_write_us / 1e6),
+        "wait_p50": merge_wait(batch_rate, service_time, parallelism, 0.50),
+        "wait_p99": merge_wait(batch_rate, service_time, parallelism, 0.01),
+    }
+
+
+def plan_connector(connector, measurements, rates, args):
+    """Combines the topic measurements of one connector (one processor) into a tier and envelope."""
+    rate = sum(rates.values())
+    # Rate-weighted cost per message over the connector's topics
+    cost = sum(measurements[topic]["cost"] * rates[topic] for topic in measurements) / rate * args.cpu_factor
+    vcpu_needed = rate * cost
+    tier = next((tier for tier in SP_TIERS if vcpu_needed <= tier[1] * TARGET_UTILIZATION), None)
+    plan = {
+        "name": connector["name"],
+        "type": "sink" if connector["connector.class"] == "MongoDbAtlasSink" else "source",
+        "topics": {topic: dict(measurements[topic], rate=rates[topic]) for topic in measurements},
+        "rate": rate,
+        "bytes_per_sec": sum(measurements[topic]["size_mean"] * rates[topic] for topic in measurements),
+        "cost": cost,
+        "vcpu_needed": vcpu_needed,
+        "tier": tier[0] if tier else None,
+    }
+    tier_capacity = (tier or SP_TIERS[-1])[1] / cost
+    latency_p50 = latency_p99 = cost
+    if plan["type"] == "sink":
+        merge = plan_merge(rate, args)
+        plan["merge"] = merge
+        plan["max_rate"] = min(tier_capacity, merge["capacity"])
+        latency_p50 += merge["service_time"] + merge["wait_p50"]
+        latency_p99 += merge["service_time"] + merge["wait_p99"]
+        if merge["utilization"] > TARGET_UTILIZATION:
+            plan["tier"] = None
+    else:
+        plan["max_rate"] = tier_capacity
+        latency_p50 += args.emit_latency_ms / 1000
+        latency_p99 += args.emit_latency_ms / 1000
+    plan["latency_p50"] = latency_p50
+    plan["latency_p99"] = latency_p99
+    return plan
+
+
+def print_plan(plan):
+    print("-------------------------------------------------")
+    print(f"{plan['name']} ({plan['type']})")
+    for topic, m in plan["topics"].items():
+        print(f"  {topic}: {m['messages']} sampled, size p50={m['size_p50']:,} p95={m['size_p95']:,} "
+              f"p99={m['size_p99']:,} max={m['size_max']:,} bytes, serialization {m['cost'] * 1e6:.1f} us/msg, "
+              f"{m['rate']:,.0f} msg/s expected")
+        if m["invalid"]:
+            print(f"    {m['invalid']} messages were not JSON objects and were only counted for size")
+        if m["over_bson_limit"]:
+            print(f"    {m['over_bson_limit']} messages exceed the 16 MB BSON limit and cannot be written")
+    print(f"  Throughput needed: {plan['rate']:,.0f} msg/s, {plan['bytes_per_sec'] / 1e6:,.2f} MB/s, "
+          f"{plan['vcpu_needed']:.2f} vCPU")
+    if "merge" in plan:
+        merge = plan["merge"]
+        print(f"  $merge: parallelism {merge['parallelism']}, batches of ~{merge['batch']}, "
+              f"{merge['utilization'] * 100:.0f}% writer utilization")
+    if plan["tier"]:
+        print(f"  Recommended tier: {plan['tier']}")
+    else:
+        print(f"  No tier covers this rate at {TARGET_UTILIZATION * 100:.0f}% utilization; split the topic "
+              f"across several processors")
+    print(f"  Envelope: up to {plan['max_rate']:,.0f} msg/s; latency at the expected rate "
+          f"p50~{plan['latency_p50'] * 1000:.1f} ms p99~{plan['latency_p99'] * 1000:.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Estimate the ASP tier and $merge parallelism for Kafka connector migrations.")
+    parser.add_argument("connectors", nargs="+", help="Connector config JSON files (an object or an array of objects).")
+    parser.add_argument("--sample", help="NDJSON file of messages to measure (for a single connector/topic).")
+    parser.add_argument("--samples-dir", help="Directory with <topic>.ndjson or <connector name>.ndjson samples.")
+    parser.add_argument("--kafka-bootstrap", help="Read samples from the topics on these brokers (e.g. a local Kafka).")
+    parser.add_argument("--kafka-timeout", type=float, default=30, help="Seconds to wait for Kafka samples. Defaults to 30.")
+    parser.add_argument("--sample-count", type=int, default=10000, help="Messages to sample per topic. Defaults to 10000.")
+    parser.add_argument("--rate", type=float, help="Expected messages/sec for every topic.")
+    parser.add_argument("--rates", help="JSON file of {\"topic or connector name\": messages/sec}; overrides --rate.")
+    parser.add_argument("--repeat", type=int, default=5, help="Serialization passes over the sample; the fastest counts. Defaults to 5.")
+    parser.add_argument("--cpu-factor", type=float, default=3.0,
+                        help="Processor CPU per message as a multiple of the measured serialization cost. Defaults to 3.")
+    parser.add_argument("--write-latency-ms", type=float, default=10,
+                        help="Round trip of one $merge batch write to the cluster. Defaults to 10.")
+    parser.add_argument("--per-doc-write-us", type=float, default=50,
+                        help="Server-side cost per document in a $merge batch. Defaults to 50.")
+    parser.add_argument("--batch-size", type=int, default=100, help="Maximum documents per $merge batch. Defaults to 100.")
+    parser.add_argument("--emit-latency-ms", type=float, default=5,
+                        help="Producer batching and acknowledgement time of an $emit to Kafka. Defaults to 5.")
+    parser.add_argument("--output", help="Write the capacity plan as JSON to this file.")
+    args = parser.parse_args()
+
+    if args.rate is None and args.rates is None:
+        parser.error("give the expected load with --rate or --rates")
+    if not (args.sample or args.samples_dir or args.kafka_bootstrap):
+        parser.error("give a message sample with --sample, --samples-dir or --kafka-bootstrap")
+    rate_overrides = {}
+    if args.rates:
+        with open(args.rates) as f:
+            rate_overrides = json.load(f)
+
+    plans = []
+    for connector in load_connectors(args.connectors):
+        try:
+            topics = connector_topics(connector)
+        except KeyError as e:
+            print(f"Skipping '{connector.get('name')}': missing {e}")
+            continue
+        measurements, rates = {}, {}
+        for topic in topics:
+            rate = rate_overrides.get(topic, rate_overrides.get(connector["name"], args.rate))
+            if not rate:
+                print(f"Skipping {connector['name']} topic '{topic}': no expected rate")
+                continue
+            measured = measure(connector, find_sample(topic, connector, args), args.repeat)
+            if measured is None:
+                print(f"Skipping {connector['name']} topic '{topic}': no sample messages")
+                continue
+            measurements[topic], rates[topic] = measured, rate
+        if measurements:
+            plan = plan_connector(connector, measurements, rates, args)
+            print_plan(plan)
+            plans.append(plan)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(plans, f, indent=2, default=str)
+        print(f"Capacity plan written to {args.output}")
+    if not plans:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,7 @@
 // count the number of operations in a change stream
 // Thi s script is intended to be run in the mongo shell
+// It scans the whole oplog for the namespace; for ops/sec, bytes/sec and sizes per namespace
+// over bounded time ranges, with a checkpoint, use oplog_profiler.py
 
 db.getSiblingDB("local")
 db.oplog.rs.aggregate( [
@@ -0,0 +1,278 @@
+import argparse
+import bisect
+import itertools
+import json
+import multiprocessing
+import random
+import string
+import time
+from pymongo import DeleteOne, InsertOne, MongoClient, ReplaceOne, UpdateOne
+
+# Drives a controlled change stream workload against a collection, for benchmarking change
+# stream source processors (including ones with a $source.config.pipeline filter like
+# code_snippets/changeStreamLargePushdownFilter.js).
+#
+#   * op mix:        --mix insert=50,update=30,replace=10,delete=10
+#   * document size: --doc-size 512 --size-distribution lognormal --size-sigma 0.5
+#   * key skew:      updates/replaces/deletes pick keys from --keyspace with Zipf exponent --zipf
+#   * rate:          --rate total ops/sec, split over --processes writer processes, each
+#                    sending unordered bulk writes of --batch-size ops
+#
+# Afterwards the oplog entries for the collection since the run started are counted per op
+# type with the same aggregation as change_stream_count_ops.js (needs a replica set), and
+# compared with what the writers' bulk write results say they changed. --watch also opens a
+# change stream (optionally with the --watch-pipeline filter) and counts the events it
+# delivers, i.e. what a processor with that $source would have seen.
+#
+#   python3 change_stream_workload.py --uri mongodb://localhost:27017/?replicaSet=rs0 \
+#       --rate 5000 --processes 4 --duration 60 --zipf 1.1 --watch
+
+OPS = ("insert", "update", "replace", "delete")
+OPLOG_OPS = {"i": "insert", "u": "update/replace", "d": "delete"}
+PAYLOAD = "".join(random.Random(0).choices(string.ascii_letters + string.digits, k=1 << 20))
+DOCUMENT_OVERHEAD = 60  # Approximate BSON bytes of _id, k, seq and field names
+
+
+def parse_mix(text):
+    """Parses "insert=50,update=30,..." into cumulative weights in OPS order."""
+    weights = dict.fromkeys(OPS, 0.0)
+    for part in text.split(","):
+        op, _, weight = part.partition("=")
+        if op.strip() not in weights:
+            raise argparse.ArgumentTypeError(f"unknown op '{op}', expected one of {', '.join(OPS)}")
+        weights[op.strip()] = float(weight)
+    if not sum(weights.values()):
+        raise argparse.ArgumentTypeError("the op mix needs at least one non-zero weight")
+    return weights
+
+
+class ZipfKeys:
+    """Samples keys 0..n-1 with P(k) proportional to 1 / (k + 1) ** s; s = 0 is uniform."""
+
+    def __init__(self, n, s, rng):
+        self.rng = rng
+        self.n = n
+        self.cdf = list(itertools.accumulate(1 / (k + 1) ** s for k in range(n))) if s else None
+
+    def sample(self):
+        if self.cdf is None:
+            return self.rng.randrange(self.n)
+        return bisect.bisect_left(self.cdf, self.rng.random() * self.cdf[-1])
+
+
+def document_size(args, rng):
+    if args.size_distribution == "fixed":
+        size = args.doc_size
+    elif args.size_distribution == "uniform":
+        size = rng.uniform(0, 2 * args.doc_size)
+    else:
+        size = rng.lognormvariate(-args.size_sigma ** 2 / 2, args.size_sigma) * args.doc_size  # mean = --doc-size
+    return max(0, min(int(size) - DOCUMENT_OVERHEAD, len(PAYLOAD)))
+
+
+def make_document(key, seq, args, rng):
+    start = rng.randrange(len(PAYLOAD))
+    size = document_size(args, rng)
+    payload = (PAYLOAD[start:] + PAYLOAD)[:size] if start + size > len(PAYLOAD) else PAYLOAD[start:start + size]
+    return {"_id": key, "k": key % 1000, "seq": seq, "payload": payload}
+
+
+def writer(index, args, counters, stop):
+    """One writer process: sends unordered bulk writes at its share of --rate until stopped."""
+    rng = random.Random(None if args.seed is None else args.seed + index)
+    keys = ZipfKeys(args.keyspace, args.zipf, rng)
+    ops, weights = zip(*args.mix.items())
+    collection = MongoClient(args.uri)[args.db][args.coll]
+    rate = args.rate / args.processes
+    # Inserts use fresh keys above the keyspace, interleaved per process so writers never collide
+    next_insert = args.keyspace + index
+    sent = 0
+    start = time.perf_counter()
+
+    while not stop.is_set():
+        due = start + sent / rate
+        now = time.perf_counter()
+        if due > now:
+            time.sleep(due - now)
+
+        requests = []
+        for op in rng.choices(ops, weights, k=args.batch_size):
+            sent += 1
+            if op == "insert":
+                requests.append(InsertOne(make_document(next_insert, sent, args, rng)))
+                next_insert += args.processes
+            elif op == "update":
+                requests.append(UpdateOne({"_id": keys.sample()}, {"$set": {"seq": sent}, "$inc": {"updates": 1}}))
+            elif op == "replace":
+                key = keys.sample()
+                requests.append(ReplaceOne({"_id": key}, make_document(key, sent, args, rng)))
+            else:
+                requests.append(DeleteOne({"_id": keys.sample()}))
+
+        write_start = time.perf_counter()
+        try:
+            result = collection.bulk_write(requests, ordered=False).bulk_api_result
+        except Exception as e:  # BulkWriteError still carries the counts of what was applied
+            result = getattr(e, "details", None) or {}
+            with counters["errors"].get_lock():
+                counters["errors"].value += 1
+        elapsed_us = int((time.perf_counter() - write_start) * 1e6)
+
+        with counters["lock"]:
+            counters["sent"].value += len(requests)
+            counters["insert"].value += result.get("nInserted", 0) + result.get("nUpserted", 0)
+            counters["modified"].value += result.get("nModified", 0)
+            counters["delete"].value += result.get("nRemoved", 0)
+            counters["batches"].value += 1
+            counters["write_us"].value += elapsed_us
+
+
+def seed_keyspace(collection, args):
+    """(Re)creates the keyspace documents that updates, replaces and deletes act on."""
+    rng = random.Random(args.seed)
+    collection.drop()
+    for start in range(0, args.keyspace, 10000):
+        collection.insert_many([make_document(key, 0, args, rng) for key in range(start, min(start + 10000, args.keyspace))],
+                               ordered=False)
+    if args.pre_post:
+        # Same as change_stream_pre-post.js, for the workload collection only
+        collection.database.command({"collMod": args.coll, "changeStreamPreAndPostImages": {"enabled": True}})
+
+
+def watcher(args, start_at, event_counts, ready, stop):
+    """Counts change events per operationType, as a change stream source with --watch-pipeline would see them."""
+    pipeline = []
+    if args.watch_pipeline:
+        with open(args.watch_pipeline) as f:
+            pipeline = json.load(f)
+    collection = MongoClient(args.uri)[args.db][args.coll]
+    counts = {}
+    with collection.watch(pipeline, start_at_operation_time=start_at, max_await_time_ms=200) as stream:
+        ready.set()
+        idle_since = None
+        while True:
+            change = stream.try_next()
+            if change is None:
+                # Keep reading until the writers have stopped and the stream has been quiet for a second
+                if stop.is_set():
+                    idle_since = idle_since or time.monotonic()
+                    if time.monotonic() - idle_since > 1:
+                        break
+                continue
+            idle_since = None
+            counts[change["operationType"]] = counts.get(change["operationType"], 0) + 1
+    event_counts.update(counts)
+
+
+def count_oplog(client, args, start_at):
+    """The change_stream_count_ops.js aggregation, limited to entries written since the run started."""
+    namespace = f"{args.db}.{args.coll}"
+    return {
+        entry["_id"]["op"]: entry["op"]
+        for entry in client.local["oplog.rs"].aggregate([
+            {"$match": {"ns": namespace, "ts": {"$gte": start_at}}},
+            {"$group": {"_id": {"op": "$op", "ns": "$ns"}, "op": {"$sum": 1}}},
+            {"$project": {"_id": 1, "op": 1, "ns": 1}},
+            {"$sort": {"_id.ns": 1, "_id.op": 1}},
+        ])
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a controlled change stream workload and verify it against the oplog.")
+    parser.add_argument("--uri", default="mongodb://localhost:27017/?replicaSet=rs0", help="Replica set connection string.")
+    parser.add_argument("--db", default="test", help="Database. Defaults to test.")
+    parser.add_argument("--coll", default="pipelinetest", help="Collection. Defaults to pipelinetest, as in change_stream_count_ops.js.")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("insert=50,update=30,replace=10,delete=10"),
+                        help="Op mix weights. Defaults to insert=50,update=30,replace=10,delete=10.")
+    parser.add_argument("--doc-size", type=int, default=512, help="Mean document size in bytes. Defaults to 512.")
+    parser.add_argument("--size-distribution", choices=["fixed", "uniform", "lognormal"], default="lognormal",
+                        help="Document size distribution. Defaults to lognormal.")
+    parser.add_argument("--size-sigma", type=float, default=0.5, help="Sigma of the lognormal size distribution. Defaults to 0.5.")
+    parser.add_argument("--keyspace", type=int, default=100000, help="Documents that updates/replaces/deletes act on. Defaults to 100000.")
+    parser.add_argument("--zipf", type=float, default=1.0, help="Zipf exponent of the key choice; 0 is uniform. Defaults to 1.0.")
+    parser.add_argument("--rate", type=float, default=1000, help="Target total ops/sec. Defaults to 1000.")
+    parser.add_argument("--processes", type=int, default=2, help="Writer processes. Defaults to 2.")
+    parser.add_argument("--batch-size", type=int, default=100, help="Ops per bulk write. Defaults to 100.")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds to run. Defaults to 30.")
+    parser.add_argument("--seed", type=int, help="Random seed.")
+    parser.add_argument("--pre-post", action="store_true", help="Enable changeStreamPreAndPostImages on the collection.")
+    parser.add_argument("--no-seed", action="store_true", help="Keep the existing collection instead of recreating the keyspace.")
+    parser.add_argument("--watch", action="store_true", help="Count the change events delivered by a change stream during the run.")
+    parser.add_argument("--watch-pipeline", help="JSON file with a change stream pipeline for --watch, e.g. a $source config.pipeline filter.")
+    args = parser.parse_args()
+
+    client = MongoClient(args.uri)
+    collection = client[args.db][args.coll]
+    if not args.no_seed:
+        print(f"Seeding {args.keyspace} documents into {args.db}.{args.coll}")
+        seed_keyspace(collection, args)
+
+    # The cluster time before the first write bounds the oplog and change stream to this run
+    with client.start_session() as session:
+        client.admin.command("ping", session=session)
+        start_at = session.operation_time
+
+    manager = multiprocessing.Manager()
+    stop = multiprocessing.Event()
+    counters = {name: multiprocessing.Value("q", 0, lock=name == "errors")
+                for name in ("sent", "insert", "modified", "delete", "batches", "write_us", "errors")}
+    counters["lock"] = multiprocessing.Lock()
+    event_counts = manager.dict()
+    watch_process = None
+    if args.watch or args.watch_pipeline:
+        ready = multiprocessing.Event()
+        watch_process = multiprocessing.Process(target=watcher, args=(args, start_at, event_counts, ready, stop))
+        watch_process.start()
+        ready.wait(30)
+
+    writers = [multiprocessing.Process(target=writer, args=(i, args, counters, stop)) for i in range(args.processes)]
+    for process in writers:
+        process.start()
+
+    start = time.perf_counter()
+    last_sent, last_report = 0, start
+    try:
+        while time.perf_counter() - start < args.duration:
+            time.sleep(1)
+            now = time.perf_counter()
+            sent = counters["sent"].value
+            print(f"{now - start:6.1f}s ops={sent} ({(sent - last_sent) / (now - last_report):,.0f}/s)")
+            last_sent, last_report = sent, now
+    except KeyboardInterrupt:
+        pass
+    stop.set()
+    for process in writers:
+        process.join()
+    elapsed = time.perf_counter() - start
+    if watch_process is not None:
+        watch_process.join()
+
+    batches = counters["batches"].value or 1
+    print("-------------------------------------------------")
+    print(f"Sent {counters['sent'].value} ops in {elapsed:.1f}s: {counters['sent'].value / elapsed:,.0f} ops/sec "
+          f"(target {args.rate:,.0f}), mean bulk write {counters['write_us'].value / batches / 1000:.1f} ms, "
+          f"failed batches={counters['errors'].value}")
+    expected = {"i": counters["insert"].value, "u": counters["modified"].value, "d": counters["delete"].value}
+
+    try:
+        oplog = count_oplog(client, args, start_at)
+    except Exception as e:
+        print(f"Could not read local.oplog.rs (is this a replica set and may this user read it?): {e}")
+        oplog = None
+    print(f"{'Op':<16} {'Writers applied':>16} {'Oplog entries':>14}" + (f" {'Change events':>14}" if watch_process else ""))
+    for op, label in OPLOG_OPS.items():
+        events = ""
+        if watch_process:
+            if op == "u":
+                events = f" {event_counts.get('update', 0) + event_counts.get('replace', 0):>14}"
+            else:
+                events = f" {event_counts.get(label, 0):>14}"
+        oplog_count = oplog.get(op, 0) if oplog is not None else "n/a"
+        print(f"{label:<16} {expected[op]:>16} {oplog_count:>14}{events}")
+    if oplog is not None and any(oplog.get(op, 0) != count for op, count in expected.items()):
+        print("Oplog counts differ from what the writers applied.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,289 @@
+import argparse
+import json
+import os
+import time
+from datetime import datetime, timezone
+from bson import Timestamp
+from pymongo import MongoClient
+
+# Profiles the change stream volume of a replica set from its oplog: events/sec, bytes/sec and
+# document sizes per namespace and operation type, to decide which collections get their own
+# change stream processor and which tier each one needs.
+#
+# change_stream_count_ops.js groups the whole oplog for one namespace in one aggregation. This
+# scans it in bounded ts ranges of --chunk-seconds, each a separate aggregation that groups on
+# the server into --bucket-seconds time buckets and a log-scale size histogram per namespace and
+# op, so only a few hundred small documents come back per chunk:
+#
+#   * transactions (applyOps entries) are unwound into their operations, as change streams do
+#   * a checkpoint file keeps the position and the buckets, so the next run only scans the
+#     oplog written since and reports on everything together (--retain-hours trims old buckets)
+#   * --match estimates the selectivity of a $source.config.pipeline $match (see
+#     code_snippets/changeStreamLargePushdownFilter.js) on approximate change events rebuilt
+#     from the oplog: operationType, ns, documentKey, and fullDocument for inserts and
+#     replaces. Updates carry no fullDocument or updateDescription, so filters on those only
+#     match inserts and replaces here
+#
+# Sizes are of the oplog entry's document: the full document for inserts and replaces, the
+# diff for updates and the _id for deletes. Percentiles are upper bounds of their histogram class
+# (within 19%). Peak rates are the busiest bucket, so they depend on --bucket-seconds. A rebuilt
+# event lacks the resume token _id and wallTime of a real one and has a _profile field instead,
+# so $bsonSize of $$ROOT comes out about 100 bytes smaller.
+#
+#   python3 oplog_profiler.py --uri mongodb://localhost:27017/?replicaSet=rs0 --hours 24 --checkpoint oplog.json
+#   python3 oplog_profiler.py --ns '^test\.' --match '{"$expr": {"$lt": [{"$bsonSize": "$$ROOT"}, 100]}}'
+#   python3 oplog_profiler.py --checkpoint oplog.json --events-per-vcpu 4000   # later: only the new oplog
+
+OPERATION_TYPES = {"i": "insert", "u": "update", "r": "replace", "d": "delete"}
+# Stream processing tiers (name, vCPU), as in ASP_tools/kafka-to-asp/estimate_throughput.py
+SP_TIERS = [("SP2", 0.25), ("SP5", 0.5), ("SP10", 1), ("SP30", 2), ("SP50", 8)]
+TARGET_UTILIZATION = 0.70
+# Size histogram classes are powers of 2 ** (1 / SIZE_CLASSES_PER_DOUBLING)
+SIZE_CLASSES_PER_DOUBLING = 4
+
+
+def change_events(start, end, ns_regex, include_system):
+    """Pipeline stages turning the oplog entries in [start, end) seconds into approximate change events."""
+    namespaces = [{"entry.ns": {"$regex": ns_regex}}] if ns_regex else []
+    if not include_system:
+        namespaces.append({"entry.ns": {"$not": {"$regex": r"^(admin|config|local)\.|\.system\."}}})
+    return [
+        {"$match": {"ts": {"$gte": Timestamp(start, 0), "$lt": Timestamp(end, 0)},
+                    "$or": [{"op": {"$in": ["i", "u", "d"]}}, {"op": "c", "o.applyOps": {"$exists": True}}]}},
+        {"$project": {"ts": 1, "entry": {"$cond": [{"$eq": ["$op", "c"]}, "$o.applyOps",
+                                                   [{"ns": "$ns", "op": "$op", "o": "$o", "o2": "$o2"}]]}}},
+        {"$unwind": "$entry"},
+        {"$match": {"$and": [{"entry.op": {"$in": ["i", "u", "d"]}}] + namespaces}},
+        # An update without $v / diff operators is a replacement
+        {"$set": {"entry.op": {"$cond": [{"$and": [
+            {"$eq": ["$entry.op", "u"]},
+            {"$eq": [{"$size": {"$filter": {"input": {"$objectToArray": "$entry.o"},
+                                            "cond": {"$or": [{"$eq": [{"$substrBytes": ["$$this.k", 0, 1]}, "$"]},
+                                                             {"$eq": ["$$this.k", "diff"]}]}}}}, 0]}]}, "r", "$entry.op"]}}},
+        {"$replaceRoot": {"newRoot": {
+            "_profile": {"op": "$entry.op", "ns": "$entry.ns", "size": {"$bsonSize": "$entry.o"}},
+            "clusterTime": "$ts",
+            "operationType": {"$switch": {"branches": [{"case": {"$eq": ["$entry.op", op]}, "then": name}
+                                                       for op, name in OPERATION_TYPES.items()]}},
+            "ns": {"db": {"$arrayElemAt": [{"$split": ["$entry.ns", "."]}, 0]},
+                   "coll": {"$substrBytes": ["$entry.ns", {"$add": [{"$indexOfBytes": ["$entry.ns", "."]}, 1]}, -1]}},
+            "documentKey": {"$ifNull": ["$entry.o2", {"_id": "$entry.o._id"}]},
+            "fullDocument": {"$cond": [{"$in": ["$entry.op", ["i", "r"]]}, "$entry.o", "$$REMOVE"]},
+        }}},
+    ]
+
+
+def summary_stages(bucket_seconds):
+    """Groups the events into (namespace, op, time bucket, size class) counts and byte totals."""
+    return [
+        {"$group": {
+            "_id": {"ns": "$_profile.ns", "op": "$_profile.op",
+                    "t": {"$subtract": ["$_profile.t", {"$mod": ["$_profile.t", bucket_seconds]}]},
+                    "s": {"$floor": {"$multiply": [{"$log": [{"$max": ["$_profile.size", 1]}, 2]},
+                                                   SIZE_CLASSES_PER_DOUBLING]}}},
+            "count": {"$sum": 1},
+            "bytes": {"$sum": "$_profile.size"},
+        }},
+    ]
+
+
+def scan_chunk(oplog, start, end, args):
+    """Returns the grouped rows for [start, end), and the matched rows if --match is set."""
+    events = change_events(start, end, args.ns, args.include_system)
+    seconds = {"$set": {"_profile.t": {"$toLong": {"$divide": [{"$toLong": {"$toDate": "$clusterTime"}}, 1000]}}}}
+    rows = list(oplog.aggregate(events + [seconds] + summary_stages(args.bucket_seconds), allowDiskUse=True))
+    matched = []
+    if args.match:
+        matched = list(oplog.aggregate(events + [{"$match": args.match}, seconds] + summary_stages(args.bucket_seconds),
+                                       allowDiskUse=True))
+    return rows, matched
+
+
+def merge_rows(profile, rows, key):
+    """Adds grouped rows into profile[key][ns][op]: {"buckets": {t: [count, bytes]}, "sizes": {class: count}}."""
+    for row in rows:
+        group = row["_id"]
+        entry = profile[key].setdefault(group["ns"], {}).setdefault(group["op"], {"buckets": {}, "sizes": {}})
+        bucket = entry["buckets"].setdefault(str(int(group["t"])), [0, 0])
+        bucket[0] += row["count"]
+        bucket[1] += row["bytes"]
+        size_class = str(int(group["s"]))
+        entry["sizes"][size_class] = entry["sizes"].get(size_class, 0) + row["count"]
+
+
+def trim(profile, oldest):
+    for key in ("all", "matched"):
+        for ops in profile[key].values():
+            for entry in ops.values():
+                entry["buckets"] = {t: value for t, value in entry["buckets"].items() if int(t) >= oldest}
+
+
+def size_percentile(sizes, pct):
+    """Upper bound of the size class holding the pct percentile of a histogram."""
+    total = sum(sizes.values())
+    running = 0
+    for size_class in sorted(sizes, key=int):
+        running += sizes[size_class]
+        if running >= pct / 100 * total:
+            return 2 ** ((int(size_class) + 1) / SIZE_CLASSES_PER_DOUBLING)
+    return 0
+
+
+def load_checkpoint(path, args):
+    if path and os.path.exists(path):
+        with open(path) as f:
+            profile = json.load(f)
+        if profile["bucket_seconds"] != args.bucket_seconds or profile.get("match") != args.match or profile.get("ns") != args.ns:
+            raise SystemExit(f"{path} was written with other --bucket-seconds/--match/--ns; use another checkpoint file")
+        return profile
+    return {"bucket_seconds": args.bucket_seconds, "match": args.match, "ns": args.ns, "scanned_from": None,
+            "scanned_until": None, "all": {}, "matched": {}}
+
+
+def save_checkpoint(path, profile):
+    if path:
+        with open(path + ".tmp", "w") as f:
+            json.dump(profile, f)
+        os.replace(path + ".tmp", path)  # A run stopped mid-write keeps the previous checkpoint
+
+
+def tier_for(rate, args):
+    if not args.events_per_vcpu:
+        return "-"
+    vcpu = rate / args.events_per_vcpu
+    return next((name for name, cores in SP_TIERS if vcpu <= cores * TARGET_UTILIZATION), f">{SP_TIERS[-1][0]}")
+
+
+def fmt_time(seconds):
+    return datetime.fromtimestamp(seconds, timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def print_profile(profile, args):
+    start, end = profile["scanned_from"], profile["scanned_until"]
+    oldest = max(start, end - args.retain_hours * 3600) if args.retain_hours else start
+    span = max(1, end - oldest)
+    bucket_seconds = profile["bucket_seconds"]
+    print("-------------------------------------------------")
+    print(f"Oplog {fmt_time(oldest)} - {fmt_time(end)} UTC ({span / 3600:.1f}h), {bucket_seconds}s buckets")
+    header = (f"{'Namespace':<32} {'Op':<8} {'Events':>10} {'Avg/s':>9} {'Peak/s':>9} {'Avg KB/s':>9} {'Peak KB/s':>10} "
+              f"{'p50 B':>7} {'p95 B':>8} {'p99 B':>8}")
+    if args.match:
+        header += f" {'Match %':>8} {'Match peak/s':>13}"
+    print(header)
+
+    totals = []
+    for ns, ops in profile["all"].items():
+        buckets_total = {}
+        matched_total = {}
+        for op, entry in sorted(ops.items()):
+            count = sum(value[0] for value in entry["buckets"].values())
+            volume = sum(value[1] for value in entry["buckets"].values())
+            peak = max((value[0] for value in entry["buckets"].values()), default=0) / bucket_seconds
+            peak_bytes = max((value[1] for value in entry["buckets"].values()), default=0) / bucket_seconds
+            line = (f"{ns[:32]:<32} {OPERATION_TYPES[op]:<8} {count:>10,} {count / span:>9,.1f} {peak:>9,.1f} "
+                    f"{volume / span / 1024:>9,.1f} {peak_bytes / 1024:>10,.1f} {size_percentile(entry['sizes'], 50):>7,.0f} "
+                    f"{size_percentile(entry['sizes'], 95):>8,.0f} {size_percentile(entry['sizes'], 99):>8,.0f}")
+            for t, value in entry["buckets"].items():
+                buckets_total[t] = buckets_total.get(t, 0) + value[0]
+            if args.match:
+                matched = profile["matched"].get(ns, {}).get(op, {"buckets": {}})
+                matched_count = sum(value[0] for value in matched["buckets"].values())
+                matched_peak = max((value[0] for value in matched["buckets"].values()), default=0) / bucket_seconds
+                line += f" {matched_count / count * 100 if count else 0:>7.1f}% {matched_peak:>13,.1f}"
+                for t, value in matched["buckets"].items():
+                    matched_total[t] = matched_total.get(t, 0) + value[0]
+            if count:
+                print(line)
+        # The processor sees the events of all ops together, so its peak is the peak of their sum
+        peak_total = max(buckets_total.values(), default=0) / bucket_seconds
+        peak_matched = max(matched_total.values(), default=0) / bucket_seconds if args.match else peak_total
+        totals.append((ns, sum(buckets_total.values()), peak_total, peak_matched))
+
+    print("-------------------------------------------------")
+    print(f"{'Namespace':<32} {'Events':>10} {'Peak/s':>9}" + (f" {'After $match':>13}" if args.match else "")
+          + f" {'Tier':>6}  Processor")
+    shared = []
+    for ns, count, peak, peak_matched in sorted(totals, key=lambda item: item[3], reverse=True):
+        own = peak_matched >= args.dedicated_rate
+        if not own:
+            shared.append(peak_matched)
+        print(f"{ns[:32]:<32} {count:>10,} {peak:>9,.1f}" + (f" {peak_matched:>13,.1f}" if args.match else "")
+              + f" {tier_for(peak_matched, args):>6}  {'own' if own else 'shared'}")
+    if shared:
+        # Peaks of different namespaces rarely coincide, so their sum is an upper bound
+        print(f"{len(shared)} namespace(s) below {args.dedicated_rate:g} events/sec at peak can share one processor "
+              f"on a database or cluster change stream: at most {sum(shared):,.1f} events/sec"
+              + (f", tier {tier_for(sum(shared), args)}" if args.events_per_vcpu else ""))
+    if not args.events_per_vcpu:
+        print("Pass --events-per-vcpu (measured with a test processor, e.g. under change_stream_workload.py) to get tiers")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Profile change stream volume per namespace and op from the oplog.")
+    parser.add_argument("--uri", default="mongodb://localhost:27017/?replicaSet=rs0", help="Replica set connection string.")
+    parser.add_argument("--hours", type=float, default=24,
+                        help="Hours of oplog to scan on the first run (capped by the oplog window). Defaults to 24.")
+    parser.add_argument("--checkpoint", help="JSON file to resume from and save to, so later runs only scan new entries.")
+    parser.add_argument("--chunk-seconds", type=int, default=300, help="Seconds of oplog per aggregation. Defaults to 300.")
+    parser.add_argument("--bucket-seconds", type=int, default=60, help="Time bucket size for rates. Defaults to 60.")
+    parser.add_argument("--retain-hours", type=float, default=0, help="Drop buckets older than this from the checkpoint. Defaults to 0 (keep).")
+    parser.add_argument("--ns", help="Regex on the namespace (db.collection), e.g. '^test\\.'. Defaults to all.")
+    parser.add_argument("--include-system", action="store_true", help="Include admin, config, local and system.* namespaces.")
+    parser.add_argument("--match", type=json.loads, help="A $source.config.pipeline $match filter (JSON) to estimate the selectivity of.")
+    parser.add_argument("--dedicated-rate", type=float, default=1000,
+                        help="Peak events/sec from which a namespace gets its own processor. Defaults to 1000.")
+    parser.add_argument("--events-per-vcpu", type=float, help="Change events/sec one vCPU handles for your pipeline, to pick tiers.")
+    args = parser.parse_args()
+
+    client = MongoClient(args.uri)
+    oplog = client.local["oplog.rs"]
+    first = oplog.find_one(sort=[("$natural", 1)])
+    last = oplog.find_one(sort=[("$natural", -1)])
+    if first is None:
+        raise SystemExit("The oplog is empty or not readable (a replica set member and read access to local are needed)")
+
+    profile = load_checkpoint(args.checkpoint, args)
+    # The current second may still get entries, so scanning stops before it
+    end = last["ts"].time
+    start = profile["scanned_until"] or max(first["ts"].time, end - int(args.hours * 3600))
+    if start < first["ts"].time:
+        print(f"The oplog no longer reaches back to the checkpoint ({fmt_time(start)}); "
+              f"entries up to {fmt_time(first['ts'].time)} were not profiled")
+        start = first["ts"].time
+    # Chunks start on bucket boundaries, so a bucket is never split between runs
+    start -= start % args.bucket_seconds
+    end -= end % args.bucket_seconds
+    if profile["scanned_from"] is None:
+        profile["scanned_from"] = start
+
+    began = time.perf_counter()
+    chunks = 0
+    chunk = max(args.bucket_seconds, args.chunk_seconds - args.chunk_seconds % args.bucket_seconds)
+    position = start
+    while position < end:
+        until = min(position + chunk, end)
+        rows, matched = scan_chunk(oplog, position, until, args)
+        merge_rows(profile, rows, "all")
+        merge_rows(profile, matched, "matched")
+        profile["scanned_until"] = position = until
+        chunks += 1
+        save_checkpoint(args.checkpoint, profile)
+        print(f"\rScanned up to {fmt_time(until)} ({chunks} chunks, {time.perf_counter() - began:.1f}s)", end="", flush=True)
+    if chunks:
+        print()
+    else:
+        print("No new oplog since the checkpoint")
+    if args.retain_hours and profile["scanned_until"]:
+        oldest = profile["scanned_until"] - int(args.retain_hours * 3600)
+        trim(profile, oldest)
+        profile["scanned_from"] = max(profile["scanned_from"], oldest)
+        save_checkpoint(args.checkpoint, profile)
+
+    if not profile["all"]:
+        print("No change events in the scanned range")
+        return
+    print_profile(profile, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,24 @@
 import os
 import json
-from pymongo import MongoClient
+import time
+import argparse
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+from pymongo import MongoClient, UpdateOne
 from openai import OpenAI
 from dotenv import load_dotenv
+from llm_cache import cache_from_env
 
 # Load environment variables from .env file
 load_dotenv()
 
 # Initialize OpenAI client
-client = OpenAI(api_key=os.getenv("OPEN_AI_KEY"))
+# OPEN_AI_BASE_URL can point at a local stub such as stub_completion_server.py
+client = OpenAI(api_key=os.getenv("OPEN_AI_KEY"), base_url=os.getenv("OPEN_AI_BASE_URL"))
 
 # MongoDB connection details
-MONGO_URI = f"mongodb+srv://{os.getenv('MONGODB_USERNAME')}:{os.getenv('MONGODB_PASSWORD')}@{os.getenv('MONGODB_CLUSTER')}/?retryWrites=true&w=majority"
+# MONGODB_URI overrides the Atlas connection string, e.g. mongodb://localhost:27017 for a local mongod
+MONGO_URI = os.getenv("MONGODB_URI") or f"mongodb+srv://{os.getenv('MONGODB_USERNAME')}:{os.getenv('MONGODB_PASSWORD')}@{os.getenv('MONGODB_CLUSTER')}/?retryWrites=true&w=majority"
 MONGO_DB = os.getenv("MONGODB_DB")
 MONGO_COLLECTION = os.getenv("MONGODB_COLLECTION")
 
@@ -20,8 +27,18 @@ mongo_client = MongoClient(MONGO_URI)
 db = mongo_client[MONGO_DB]
 collection = db[MONGO_COLLECTION]
 
-# Fetch machine logs from MongoDB
-machine_logs = list(collection.find())
+# Cache analyses by prompt, so re-running over unchanged logs does not call the LLM again
+response_cache = cache_from_env(db)
+
+# Only the fields used by the analysis prompt are read from the collection
+PROMPT_FIELDS = {
+    "machine_id": 1,
+    "issue_report": 1,
+    "sensor_data": 1,
+    "engine_hours": 1,
+    "year_of_manufacture": 1,
+    "maintenance_history": 1,
+}
 
 # Analyze machine logs using OpenAI
 def analyze_machine_log(log):
@@ -41,31 +58,94 @@ def analyze_machine_log(log):
     Maintenance History: {json.dumps(log['maintenance_history'], indent=4)}
     """
 
-    try:
+    def create():
         response = client.responses.create(
             model="gpt-4o",
             input=instructions,
         )
         return response.output_text.strip()
+
+    try:
+        return response_cache.get_or_create(instructions, create)
     except Exception as e:
         print(f"Error with OpenAI API: {e}")
         return None
 
-# Analyze each machine log and print the results
-for log in machine_logs:
-    analysis = analyze_machine_log(log)
-    if analysis:
-        print(f"Analysis for Machine ID {log['machine_id']}:\n{analysis}\n")
-
-# Save the analysis results back to MongoDB (optional)
-def save_analysis_to_mongodb(log_id, analysis):
-    collection.update_one(
-        {"_id": log_id},
-        {"$set": {"analysis": analysis}}
+# Save the analysis results back to MongoDB
+def save_analyses_to_mongodb(results):
+    """Writes a batch of (log_id, analysis) pairs with one unordered bulk_write."""
+    analyzed_at = datetime.now(timezone.utc)
+    collection.bulk_write(
+        [UpdateOne({"_id": log_id}, {"$set": {"analysis": analysis, "analyzedAt": analyzed_at}})
+         for log_id, analysis in results],
+        ordered=False
     )
 
-# Uncomment the following lines to save the analysis results back to MongoDB
-# for log in machine_logs:
-#     analysis = analyze_machine_log(log)
-#     if analysis:
-#         save_analysis_to_mongodb(log["_id"], analysis)
\ No newline at end of file
+# Stream unanalyzed logs through concurrent analysis workers
+def analyze_pending_logs(concurrency=8, batch_size=100, save=True, limit=0):
+    """Analyzes every log that does not have an `analysis` field yet.
+
+    Logs are read with a batched cursor sorted by _id, so memory use does not depend on
+    the size of the collection: at most `concurrency * 2` logs are in flight and at most
+    `batch_size` results wait to be written. Because finished logs get an `analysis`
+    field, the "not yet analyzed" filter is the checkpoint: after a crash, or when new
+    logs arrive, the next run picks up only the logs that still need an analysis.
+    """
+    query = {"analysis": {"$exists": False}}
+    cursor = collection.find(query, PROMPT_FIELDS, batch_size=batch_size, no_cursor_timeout=True).sort("_id", 1)
+    if limit:
+        cursor = cursor.limit(limit)
+
+    pending_writes = []
+    analyzed = failed = 0
+    start = time.perf_counter()
+
+    def collect(done):
+        nonlocal analyzed, failed
+        for future in done:
+            log, analysis = future.result()
+            if not analysis:
+                failed += 1
+                continue
+            analyzed += 1
+            if save:
+                pending_writes.append((log["_id"], analysis))
+            else:
+                print(f"Analysis for Machine ID {log['machine_id']}:\n{analysis}\n")
+        if len(pending_writes) >= batch_size:
+            save_analyses_to_mongodb(pending_writes)
+            pending_writes.clear()
+            print(f"✅ Saved {analyzed} analyses ({analyzed / (time.perf_counter() - start):.1f} logs/sec)")
+
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            in_flight = set()
+            for log in cursor:
+                # Bound the work in flight so the cursor is only read as fast as logs are analyzed
+                if len(in_flight) >= concurrency * 2:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    collect(done)
+                in_flight.add(executor.submit(lambda log=log: (log, analyze_machine_log(log))))
+            collect(wait(in_flight).done)
+        if pending_writes:
+            save_analyses_to_mongodb(pending_writes)
+    finally:
+        cursor.close()
+
+    elapsed = time.perf_counter() - start
+    print(f"Analyzed {analyzed} logs in {elapsed:.1f}s ({analyzed / elapsed if elapsed else 0:.1f} logs/sec), failed={failed}")
+    print(response_cache.report())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Analyze machine logs with an LLM and save the results to MongoDB.")
+    parser.add_argument("--concurrency", type=int, default=8, help="LLM calls in flight. Defaults to 8.")
+    parser.add_argument("--batch-size", type=int, default=100,
+                        help="Cursor batch size and number of analyses per bulk_write. Defaults to 100.")
+    parser.add_argument("--limit", type=int, default=0, help="Analyze at most this many logs. Defaults to all.")
+    parser.add_argument("--no-save", action="store_true",
+                        help="Print the analyses instead of saving them (nothing is checkpointed).")
+    args = parser.parse_args()
+
+    analyze_pending_logs(concurrency=args.concurrency, batch_size=args.batch_size,
+                         save=not args.no_save, limit=args.limit)
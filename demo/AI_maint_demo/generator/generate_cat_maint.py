@@ -1,25 +1,48 @@
 import random
 import json
 import time
+import queue
+import argparse
+import threading
 import os  # Import os module to read environment variables
-from openai import OpenAI  # Import OpenAI client
+from concurrent.futures import ThreadPoolExecutor
+from openai import APIConnectionError, InternalServerError, OpenAI, RateLimitError  # Import OpenAI client
 from pymongo import MongoClient  # Import MongoClient from pymongo
 from dotenv import load_dotenv  # Import load_dotenv from dotenv
+from llm_cache import bucket, cache_from_env
 from datetime import datetime, timedelta
 
 # Load environment variables from .env file
 load_dotenv()
 
-# Initialize OpenAI client
-client = OpenAI(api_key=os.getenv("OPEN_AI_KEY"))
+# OpenAI client, created on the first LLM call so --no-llm seeding runs without OPEN_AI_KEY
+client = None
+client_lock = threading.Lock()
+
+def get_client():
+    global client
+    with client_lock:
+        if client is None:
+            # OPEN_AI_BASE_URL can point at a local stub such as stub_completion_server.py
+            # The client's own retries are off; create_response_with_retry does the retrying
+            client = OpenAI(api_key=os.getenv("OPEN_AI_KEY"), base_url=os.getenv("OPEN_AI_BASE_URL"), max_retries=0)
+        return client
 
 # MongoDB connection details
-MONGO_URI = f"mongodb+srv://{os.getenv('MONGODB_USERNAME')}:{os.getenv('MONGODB_PASSWORD')}@{os.getenv('MONGODB_CLUSTER')}/?retryWrites=true&w=majority"
+# MONGODB_URI overrides the Atlas connection string, e.g. mongodb://localhost:27017 for a local mongod
+MONGO_URI = os.getenv("MONGODB_URI") or f"mongodb+srv://{os.getenv('MONGODB_USERNAME')}:{os.getenv('MONGODB_PASSWORD')}@{os.getenv('MONGODB_CLUSTER')}/?retryWrites=true&w=majority"
 MONGO_DB = os.getenv("MONGODB_DB")
 MONGO_COLLECTION = os.getenv("MONGODB_COLLECTION")
 
 print(MONGO_URI)
 
+# Counters shared by the bulk pipeline threads
+stats_lock = threading.Lock()
+pipeline_stats = {"retries": 0}
+
+# Optional LLM response cache, enabled with --cache (see llm_cache.py)
+response_cache = None
+
 # List of heavy equipment types and machine IDs
 MACHINE_TYPES = ["CAT-980L Loader", "CAT-D8T Dozer", "CAT-336 Excavator", "CAT-745 Articulated Truck"]
 MACHINE_IDS = ["CAT-980L-" + str(i) for i in range(1, 6)] + \
@@ -27,6 +50,34 @@ MACHINE_IDS = ["CAT-980L-" + str(i) for i in range(1, 6)] + \
               ["CAT-336-" + str(i) for i in range(1, 6)] + \
               ["CAT-745-" + str(i) for i in range(1, 6)]
 
+# Maintenance work that can appear in a machine's history
+HISTORY_OPTIONS = [
+    "Hydraulic pump replacement",
+    "Oil change",
+    "Engine overhaul",
+    "Track replacement",
+    "Brake system check",
+    "Hydraulic fluid top-up",
+    "Filter replacement",
+    "Cooling system flush",
+    "Transmission service",
+    "Battery replacement"
+]
+
+# Operating conditions used to vary the generated issue reports
+ISSUE_SCENARIOS = [
+    "The machine has been operating under heavy load for extended periods.",
+    "The machine was recently serviced but is showing unusual behavior.",
+    "The machine is operating in extreme weather conditions.",
+    "The machine has been idle for a long time and was recently restarted.",
+    "The machine is being used for a new type of task it hasn't performed before.",
+    "The machine is experiencing fuel lockup issues.",
+    "The machine's diesel fuel appears to be contaminated.",
+    "The machine's tracks are stuck and not moving properly.",
+    "The machine is overheating due to hot weather conditions.",
+    "The machine is showing signs of hydraulic fluid leakage."
+]
+
 # Random sensor value generators
 def get_hydraulic_pressure():
     return round(random.uniform(1500, 3000), 2)
@@ -38,25 +89,13 @@ def get_vibration():
     return round(random.uniform(0.1, 5.0), 2)
 
 def get_maintenance_history():
-    history_options = [
-        "Hydraulic pump replacement",
-        "Oil change",
-        "Engine overhaul",
-        "Track replacement",
-        "Brake system check",
-        "Hydraulic fluid top-up",
-        "Filter replacement",
-        "Cooling system flush",
-        "Transmission service",
-        "Battery replacement"
-    ]
     history = []
     num_records = random.randint(1, 5)
     for _ in range(num_records):
         record_date = datetime.now() - timedelta(days=random.randint(0, 365*5))  # Random date within the last 5 years
         record = {
             "date": record_date.strftime("%Y-%m-%d"),
-            "description": random.choice(history_options)
+            "description": random.choice(HISTORY_OPTIONS)
         }
         history.append(record)
     history.sort(key=lambda x: x["date"])  # Sort by date
@@ -71,21 +110,30 @@ def get_year_of_manufacture():
 # Generate an issue report using OpenAI with enhanced variability
 def generate_issue_report(machine_type, sensor_data, engine_hours, year_of_manufacture):
     """Uses OpenAI API to generate realistic heavy equipment issue reports with enhanced variability."""
-    scenarios = [
-        "The machine has been operating under heavy load for extended periods.",
-        "The machine was recently serviced but is showing unusual behavior.",
-        "The machine is operating in extreme weather conditions.",
-        "The machine has been idle for a long time and was recently restarted.",
-        "The machine is being used for a new type of task it hasn't performed before.",
-        "The machine is experiencing fuel lockup issues.",
-        "The machine's diesel fuel appears to be contaminated.",
-        "The machine's tracks are stuck and not moving properly.",
-        "The machine is overheating due to hot weather conditions.",
-        "The machine is showing signs of hydraulic fluid leakage."
-    ]
-    scenario = random.choice(scenarios)
-
-    instructions = f"""
+    scenario = random.choice(ISSUE_SCENARIOS)
+    instructions = issue_report_prompt(machine_type, sensor_data, engine_hours, year_of_manufacture, scenario)
+
+    def create():
+        return create_response_with_retry(instructions)
+
+    try:
+        if response_cache is not None:
+            # Key the cache on bucketed readings so near-identical requests share one LLM call
+            bucketed_sensors = {
+                "hydraulic_pressure": bucket(sensor_data["hydraulic_pressure"], 250),
+                "temperature": bucket(sensor_data["temperature"], 10),
+                "vibration": bucket(sensor_data["vibration"], 0.5),
+            }
+            cache_prompt = issue_report_prompt(machine_type, bucketed_sensors, bucket(engine_hours, 1000),
+                                               year_of_manufacture, scenario)
+            return response_cache.get_or_create(cache_prompt, create)
+        return create()
+    except Exception as e:
+        print(f"Error with OpenAI API: {e}")
+        return "Machine performance is fluctuating, possible issue detected."
+
+def issue_report_prompt(machine_type, sensor_data, engine_hours, year_of_manufacture, scenario):
+    return f"""
     You are a field technician logging an issue for a {machine_type}. 
     The machine's sensor data indicates the following:
     
@@ -102,15 +150,36 @@ def generate_issue_report(machine_type, sensor_data, engine_hours, year_of_manuf
     Vary the voice of the results to reflect a cranky tech or someone doing simple routine work.
     """
 
+# Errors worth retrying: connection problems and timeouts, rate limits and 5xx responses.
+# Anything else (bad request, authentication, unknown model) fails the same way every time.
+RETRYABLE_ERRORS = (APIConnectionError, RateLimitError, InternalServerError)
+
+def retry_delay(error, attempt, base_delay):
+    """Seconds to wait before the next attempt: the server's Retry-After if it sent one, else exponential backoff with jitter."""
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
     try:
-        response = client.responses.create(
-            model="gpt-4o",
-            input=instructions,
-        )
-        return response.output_text.strip()
-    except Exception as e:
-        print(f"Error with OpenAI API: {e}")
-        return "Machine performance is fluctuating, possible issue detected."
+        return max(0.0, float(retry_after))
+    except (TypeError, ValueError):
+        return base_delay * (2 ** attempt) * random.uniform(0.5, 1.5)
+
+# Call the LLM, retrying transient failures with exponential backoff and jitter
+def create_response_with_retry(instructions, retries=4, base_delay=0.5):
+    """Returns the LLM output text, retrying transient errors up to `retries` times before re-raising the last one."""
+    for attempt in range(retries + 1):
+        try:
+            response = get_client().responses.create(
+                model="gpt-4o",
+                input=instructions,
+                timeout=60,
+            )
+            return response.output_text.strip()
+        except RETRYABLE_ERRORS as e:
+            if attempt == retries:
+                raise
+            with stats_lock:
+                pipeline_stats["retries"] += 1
+            time.sleep(retry_delay(e, attempt, base_delay))
 
 # Generate a log entry using LLM
 def generate_machine_log():
@@ -153,6 +222,188 @@ def save_logs_to_mongodb(num_logs=10):
         collection.insert_one(log)
         print(f"✅ Log {i+1} inserted into collection '{MONGO_COLLECTION}' in database '{MONGO_DB}'")
 
+# Save logs to MongoDB with concurrent LLM calls and batched inserts
+def save_logs_to_mongodb_bulk(num_logs=1000, concurrency=16, batch_size=100):
+    """Generates logs with `concurrency` LLM calls in flight and writes them with insert_many.
+
+    Generator threads put finished logs on a bounded queue; a single writer thread drains
+    it into unordered insert_many batches of up to `batch_size`. The bounded queue applies
+    backpressure, so a slow database slows generation instead of growing memory.
+    """
+    mongo_client = MongoClient(MONGO_URI)
+    collection = mongo_client[MONGO_DB][MONGO_COLLECTION]
+    log_queue = queue.Queue(maxsize=batch_size * 4)
+    inserted = [0]
+    stop = threading.Event()
+    writer_error = []
+
+    def writer():
+        batch, done = [], False
+        try:
+            while not done:
+                try:
+                    log = log_queue.get(timeout=1.0)
+                    if log is None:
+                        done = True  # Producers are finished
+                    else:
+                        batch.append(log)
+                    timed_out = False
+                except queue.Empty:
+                    timed_out = True  # Nothing arrived for a second, write what we have
+                    done = stop.is_set()  # The producers failed and will send nothing more
+                if batch and (done or timed_out or len(batch) >= batch_size):
+                    collection.insert_many(batch, ordered=False)
+                    inserted[0] += len(batch)
+                    print(f"✅ Inserted {inserted[0]}/{num_logs} logs into '{MONGO_DB}.{MONGO_COLLECTION}'")
+                    batch = []
+        except Exception as e:
+            # Stop the producers, which would otherwise block on the full queue forever
+            writer_error.append(e)
+            stop.set()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                log_queue.put(item, timeout=1.0)
+                return
+            except queue.Full:
+                pass
+
+    def produce(_):
+        if not stop.is_set():
+            put(generate_machine_log())
+
+    start = time.perf_counter()
+    writer_thread = threading.Thread(target=writer)
+    writer_thread.start()
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            # list() re-raises any exception from the generator threads
+            list(executor.map(produce, range(num_logs)))
+    except BaseException:
+        stop.set()
+        raise
+    finally:
+        put(None)  # Tell the writer there is nothing more to come
+        writer_thread.join()
+    if writer_error:
+        raise writer_error[0]
+
+    elapsed = time.perf_counter() - start
+    print(f"Generated and inserted {inserted[0]} logs in {elapsed:.1f}s "
+          f"({inserted[0] / elapsed:.1f} logs/sec, concurrency={concurrency}, "
+          f"batch_size={batch_size}, LLM retries={pipeline_stats['retries']})")
+
+# Generate logs in bulk with NumPy, without the LLM step
+def generate_machine_log_columns(num_logs, rng, start_date=None):
+    """Samples every field of `num_logs` logs at once and returns them as NumPy columns.
+
+    Uses the same distributions as the per-field helpers above (get_temperature,
+    get_maintenance_history, ...) but with one vectorized draw per field per batch.
+    The issue report is the sampled scenario text, since no LLM is called. Maintenance
+    history falls in the 5 years up to `start_date` (a date, default today).
+    """
+    import numpy as np  # Only needed for bulk seeding
+
+    history_counts = rng.integers(1, 6, num_logs)  # 1-5 records per log, like get_maintenance_history
+    total_records = int(history_counts.sum())
+    days_ago = rng.integers(0, 365 * 5 + 1, total_records)
+    owners = np.repeat(np.arange(num_logs), history_counts)
+    # Oldest record first within each log, matching the sort in get_maintenance_history
+    order = np.lexsort((-days_ago, owners))
+    today = np.datetime64(start_date or datetime.now().date(), "D")
+
+    return {
+        "machine_id": np.asarray(MACHINE_IDS)[rng.integers(0, len(MACHINE_IDS), num_logs)],
+        "machine_type": np.asarray(MACHINE_TYPES)[rng.integers(0, len(MACHINE_TYPES), num_logs)],
+        "engine_hours": rng.integers(1000, 10001, num_logs),
+        "year_of_manufacture": rng.integers(2000, 2023, num_logs),
+        "issue_report": np.asarray(ISSUE_SCENARIOS)[rng.integers(0, len(ISSUE_SCENARIOS), num_logs)],
+        "hydraulic_pressure": rng.uniform(1500, 3000, num_logs).round(2),
+        "temperature": rng.uniform(80, 180, num_logs).round(2),
+        "vibration": rng.uniform(0.1, 5.0, num_logs).round(2),
+        "history_offsets": np.concatenate(([0], np.cumsum(history_counts))),
+        "history_date": (today - days_ago[order]).astype(str),
+        "history_description": np.asarray(HISTORY_OPTIONS)[rng.integers(0, len(HISTORY_OPTIONS), total_records)],
+    }
+
+def machine_logs_from_columns(columns, timestamp=None):
+    """Turns the columns from generate_machine_log_columns into log documents shaped like generate_machine_log()."""
+    # tolist() converts whole columns to Python types in C, which is much faster than per-item conversion
+    cols = {name: values.tolist() for name, values in columns.items()}
+    offsets = cols["history_offsets"]
+    timestamp = timestamp or time.strftime("%Y-%m-%dT%H:%M:%SZ")
+    logs = []
+    for i in range(len(cols["machine_id"])):
+        logs.append({
+            "machine_id": cols["machine_id"][i],
+            "machine_type": cols["machine_type"][i],
+            "engine_hours": cols["engine_hours"][i],
+            "year_of_manufacture": cols["year_of_manufacture"][i],
+            "timestamp": timestamp,
+            "issue_report": cols["issue_report"][i],
+            "sensor_data": {
+                "hydraulic_pressure": cols["hydraulic_pressure"][i],
+                "temperature": cols["temperature"][i],
+                "vibration": cols["vibration"][i],
+            },
+            "maintenance_history": [
+                {"date": date, "description": description}
+                for date, description in zip(cols["history_date"][offsets[i]:offsets[i + 1]],
+                                             cols["history_description"][offsets[i]:offsets[i + 1]])
+            ],
+        })
+    return logs
+
+def iter_machine_log_batches(num_logs, batch_size=10000, seed=None, start_date=None):
+    """Yields lists of up to `batch_size` generated logs, `num_logs` in total.
+
+    The same seed and `start_date` always produce the same logs, so benchmark data sets
+    can be recreated exactly. Without `start_date`, the logs are dated today.
+    """
+    import numpy as np  # Only needed for bulk seeding
+
+    rng = np.random.default_rng(seed)
+    timestamp = start_date.strftime("%Y-%m-%dT00:00:00Z") if start_date else None
+    for start in range(0, num_logs, batch_size):
+        columns = generate_machine_log_columns(min(batch_size, num_logs - start), rng, start_date)
+        yield machine_logs_from_columns(columns, timestamp)
+
+def seed_logs(num_logs, batch_size=10000, seed=None, export_path=None, start_date=None):
+    """Seeds `num_logs` generated logs into MongoDB, or into a .jsonl/.parquet file if `export_path` is set."""
+    start = time.perf_counter()
+    written = 0
+
+    if export_path and export_path.endswith(".parquet"):
+        import pyarrow as pa  # Optional, only for Parquet export
+        import pyarrow.parquet as pq
+        writer = None
+        try:
+            for batch in iter_machine_log_batches(num_logs, batch_size, seed, start_date):
+                table = pa.Table.from_pylist(batch)
+                writer = writer or pq.ParquetWriter(export_path, table.schema)
+                writer.write_table(table)
+                written += len(batch)
+        finally:
+            if writer:
+                writer.close()
+    elif export_path:
+        with open(export_path, "w") as f:
+            for batch in iter_machine_log_batches(num_logs, batch_size, seed, start_date):
+                f.write("\n".join(json.dumps(log) for log in batch) + "\n")
+                written += len(batch)
+    else:
+        mongo_client = MongoClient(MONGO_URI)
+        collection = mongo_client[MONGO_DB][MONGO_COLLECTION]
+        for batch in iter_machine_log_batches(num_logs, batch_size, seed, start_date):
+            collection.insert_many(batch, ordered=False)
+            written += len(batch)
+            print(f"✅ Inserted {written}/{num_logs} logs into '{MONGO_DB}.{MONGO_COLLECTION}'")
+
+    elapsed = time.perf_counter() - start
+    print(f"Seeded {written} logs to {export_path or MONGO_DB + '.' + MONGO_COLLECTION} "
+          f"in {elapsed:.1f}s ({written / elapsed:,.0f} logs/sec)")
+
 # Stream logs to console (simulate Kafka/MQTT streaming)
 def stream_logs(interval=2):
     """Simulates streaming logs every 'interval' seconds."""
@@ -163,8 +414,41 @@ def stream_logs(interval=2):
 
 # Run the script (Choose one)
 if __name__ == "__main__":
-    # Save 10 logs to MongoDB
-    save_logs_to_mongodb(num_logs=30)
+    parser = argparse.ArgumentParser(description="Generate synthetic heavy equipment maintenance logs.")
+    parser.add_argument("--num-logs", type=int, default=30, help="Number of logs to generate. Defaults to 30.")
+    parser.add_argument("--bulk", action="store_true",
+                        help="Use the concurrent pipeline: parallel LLM calls and batched insert_many.")
+    parser.add_argument("--concurrency", type=int, default=16, help="LLM calls in flight in --bulk mode. Defaults to 16.")
+    parser.add_argument("--batch-size", type=int, default=100, help="Logs per insert_many in --bulk mode. Defaults to 100.")
+    parser.add_argument("--no-llm", action="store_true",
+                        help="Generate logs with vectorized NumPy sampling and no LLM call, for bulk seeding.")
+    parser.add_argument("--seed", type=int, default=None, help="Random seed for --no-llm, for reproducible data sets.")
+    parser.add_argument("--seed-batch-size", type=int, default=10000,
+                        help="Logs sampled and written per batch with --no-llm. Defaults to 10000.")
+    parser.add_argument("--start-date", type=lambda v: datetime.strptime(v, "%Y-%m-%d").date(), default=None,
+                        help="With --no-llm, date the logs as of this day (YYYY-MM-DD): the timestamp is its midnight "
+                             "and maintenance history falls in the 5 years before it. Defaults to today, so pass it "
+                             "with --seed to recreate a data set exactly.")
+    parser.add_argument("--export", default=None,
+                        help="With --no-llm, write the logs to this .jsonl or .parquet file instead of MongoDB.")
+    parser.add_argument("--cache", action="store_true",
+                        help="Reuse issue reports for requests with the same machine type, scenario and bucketed sensor values.")
+    args = parser.parse_args()
+
+    if args.cache:
+        response_cache = cache_from_env(MongoClient(MONGO_URI)[MONGO_DB])
+
+    if args.no_llm:
+        seed_logs(num_logs=args.num_logs, batch_size=args.seed_batch_size, seed=args.seed, export_path=args.export,
+                  start_date=args.start_date)
+    elif args.bulk:
+        save_logs_to_mongodb_bulk(num_logs=args.num_logs, concurrency=args.concurrency, batch_size=args.batch_size)
+    else:
+        # Save logs to MongoDB one at a time
+        save_logs_to_mongodb(num_logs=args.num_logs)
+
+    if response_cache is not None:
+        print(response_cache.report())
 
     # OR: Stream logs indefinitely (like a real-time Kafka stream)
-    #stream_logs(interval=2)
\ No newline at end of file
+    #stream_logs(interval=2)
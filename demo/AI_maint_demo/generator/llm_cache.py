@@ -0,0 +1,164 @@
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from pymongo.errors import OperationFailure
+
+# Content-addressed cache for LLM responses used by generate_cat_maint.py and
+# analyze_machine_logs.py.
+#
+# A response is stored under the SHA-256 of its normalized prompt. Lookups go to an
+# in-memory LRU first and then to an optional MongoDB collection, so a re-run over
+# unchanged data is answered from the cache instead of calling the model again.
+# Both tiers evict by age (TTL) and by size (maximum number of entries).
+
+
+def normalize_prompt(prompt):
+    """Collapses whitespace so prompts that only differ in indentation or line breaks share a key."""
+    return re.sub(r"\s+", " ", prompt).strip()
+
+
+def prompt_key(prompt):
+    return hashlib.sha256(normalize_prompt(prompt).encode("utf-8")).hexdigest()
+
+
+def bucket(value, size):
+    """Rounds a sensor reading to the nearest multiple of `size`, e.g. bucket(2143.7, 250) -> 2250."""
+    return round(round(value / size) * size, 6)
+
+
+def cache_from_env(db=None):
+    """Builds a ResponseCache configured from environment variables.
+
+    LLM_CACHE_MAX_ENTRIES (default 10000), LLM_CACHE_MAX_PERSISTENT_ENTRIES (default 100000)
+    and LLM_CACHE_TTL_SECONDS (default 7 days) size the cache. If `db` is given, the persistent tier is the LLM_CACHE_COLLECTION collection
+    (default "llm_cache") in that database; set LLM_CACHE_COLLECTION to an empty string to
+    keep the cache in memory only.
+    """
+    collection_name = os.getenv("LLM_CACHE_COLLECTION", "llm_cache")
+    return ResponseCache(
+        max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", 10000)),
+        ttl_seconds=float(os.getenv("LLM_CACHE_TTL_SECONDS", 7 * 24 * 3600)),
+        collection=db[collection_name] if db is not None and collection_name else None,
+        max_persistent_entries=int(os.getenv("LLM_CACHE_MAX_PERSISTENT_ENTRIES", 100000)),
+    )
+
+
+class ResponseCache:
+    """Two-tier LLM response cache: an in-memory LRU in front of an optional MongoDB collection.
+
+    Args:
+        max_entries: Maximum entries kept in memory (least recently used are evicted first).
+        ttl_seconds: Age after which an entry is treated as missing, in both tiers.
+        collection: Optional pymongo collection for the persistent tier. A TTL index on
+            `createdAt` lets the server expire old entries; `max_persistent_entries` caps
+            the collection by trimming the oldest entries.
+        max_persistent_entries: Size cap for the persistent tier.
+    """
+
+    def __init__(self, max_entries=10000, ttl_seconds=7 * 24 * 3600, collection=None, max_persistent_entries=100000):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.collection = collection
+        self.max_persistent_entries = max_persistent_entries
+        self.memory = OrderedDict()  # key -> (stored_at, response)
+        self.lock = threading.Lock()
+        self.counters = {"memory_hits": 0, "persistent_hits": 0, "misses": 0, "evictions": 0}
+        self.writes_since_trim = 0
+        if collection is not None:
+            self._ensure_ttl_index()
+
+    def _ensure_ttl_index(self):
+        """Creates the TTL index on createdAt, or updates its expireAfterSeconds if the TTL changed."""
+        try:
+            self.collection.create_index("createdAt", expireAfterSeconds=int(self.ttl_seconds))
+        except OperationFailure as e:
+            if e.code != 85:  # IndexOptionsConflict: the index exists with another expireAfterSeconds
+                raise
+            self.collection.database.command({"collMod": self.collection.name,
+                                              "index": {"keyPattern": {"createdAt": 1},
+                                                        "expireAfterSeconds": int(self.ttl_seconds)}})
+
+    def get(self, prompt):
+        """Returns the cached response for `prompt`, or None."""
+        key = prompt_key(prompt)
+        now = time.time()
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry and now - entry[0] < self.ttl_seconds:
+                self.memory.move_to_end(key)
+                self.counters["memory_hits"] += 1
+                return entry[1]
+            if entry:
+                del self.memory[key]  # Expired
+                self.counters["evictions"] += 1
+
+        if self.collection is not None:
+            doc = self.collection.find_one({"_id": key})
+            stored_at = doc["createdAt"].replace(tzinfo=timezone.utc).timestamp() if doc else 0
+            # The TTL monitor only runs once a minute, so check the age here as well
+            if doc and now - stored_at < self.ttl_seconds:
+                with self.lock:
+                    self.counters["persistent_hits"] += 1
+                    self._remember(key, stored_at, doc["response"])
+                return doc["response"]
+
+        with self.lock:
+            self.counters["misses"] += 1
+        return None
+
+    def put(self, prompt, response):
+        key = prompt_key(prompt)
+        now = time.time()
+        with self.lock:
+            self._remember(key, now, response)
+            self.writes_since_trim += 1
+            trim = self.writes_since_trim >= 1000
+            if trim:
+                self.writes_since_trim = 0
+
+        if self.collection is not None:
+            self.collection.replace_one(
+                {"_id": key},
+                {"_id": key, "response": response, "createdAt": datetime.fromtimestamp(now, timezone.utc)},
+                upsert=True,
+            )
+            if trim:
+                self._trim_persistent()
+
+    def get_or_create(self, prompt, create):
+        """Returns the cached response for `prompt`, calling `create()` and caching its result on a miss."""
+        response = self.get(prompt)
+        if response is None:
+            response = create()
+            if response is not None:
+                self.put(prompt, response)
+        return response
+
+    def _remember(self, key, stored_at, response):
+        self.memory[key] = (stored_at, response)
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+            self.counters["evictions"] += 1
+
+    def _trim_persistent(self):
+        """Deletes the oldest persistent entries beyond max_persistent_entries."""
+        excess = self.collection.estimated_document_count() - self.max_persistent_entries
+        if excess > 0:
+            oldest = self.collection.find({}, {"_id": 1}).sort("createdAt", 1).limit(excess)
+            self.collection.delete_many({"_id": {"$in": [doc["_id"] for doc in oldest]}})
+            with self.lock:
+                self.counters["evictions"] += excess
+
+    def report(self):
+        with self.lock:
+            counters = dict(self.counters)
+        lookups = counters["memory_hits"] + counters["persistent_hits"] + counters["misses"]
+        hit_rate = (lookups - counters["misses"]) / lookups * 100 if lookups else 0
+        return (f"LLM cache: {lookups} lookups, hit rate {hit_rate:.1f}% "
+                f"(memory={counters['memory_hits']}, persistent={counters['persistent_hits']}, "
+                f"misses={counters['misses']}, evictions={counters['evictions']})")
@@ -0,0 +1,117 @@
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Local stand-in for the OpenAI Responses API (POST /v1/responses), so the generator and
+# analyzer scripts can be run and benchmarked offline. Point the scripts at it with:
+#
+#   python3 stub_completion_server.py --latency-ms 800 --error-rate 0.05
+#   OPEN_AI_BASE_URL=http://localhost:8000/v1 OPEN_AI_KEY=stub python3 generate_cat_maint.py --bulk --num-logs 1000
+#
+# Each request sleeps for a random latency around --latency-ms and a fraction of requests
+# fail with HTTP 429 or 500 to exercise the client retry logic.
+
+CANNED_REPORTS = [
+    "Hydraulic pressure is all over the place under load, pump is whining. Probably needs a new pump.",
+    "Routine check: engine temp running a bit high, coolant topped up, will monitor.",
+    "Tracks are binding again, had to stop work twice today. Somebody needs to look at the tensioner.",
+    "Fuel filter clogged, machine stalled after lunch. Looks like contaminated diesel.",
+    "Excess vibration in the cab at idle, mounts might be shot.",
+]
+
+
+class StubState:
+    def __init__(self, latency_ms, error_rate):
+        self.latency = latency_ms / 1000.0
+        self.error_rate = error_rate
+        self.lock = threading.Lock()
+        self.counters = {"requests": 0, "errors": 0}
+
+    def count(self, key):
+        with self.lock:
+            self.counters[key] += 1
+
+
+class StubCompletionHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state = None
+
+    def log_message(self, format, *args):
+        pass  # Keep the console readable under load
+
+    def send_json(self, status, body):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        if self.path == "/stub/counters":
+            with self.state.lock:
+                self.send_json(200, dict(self.state.counters))
+            return
+        self.send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if not self.path.rstrip("/").endswith("/responses"):
+            self.send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+            return
+
+        self.state.count("requests")
+        # Latency varies +/-50% around the configured value, like a real completion endpoint
+        time.sleep(self.state.latency * random.uniform(0.5, 1.5))
+        if random.random() < self.state.error_rate:
+            self.state.count("errors")
+            self.send_json(random.choice([429, 500]), {"error": {"message": "stub injected error", "type": "server_error"}})
+            return
+
+        text = random.choice(CANNED_REPORTS)
+        if "diagnostics" in str(request.get("input", "")):
+            # Analysis prompts ask for JSON
+            text = json.dumps({"cause": "Hydraulic pump wear", "probability": 0.62, "confidence_level": "medium"})
+        self.send_json(200, {
+            "id": f"resp_{uuid.uuid4().hex}",
+            "object": "response",
+            "created_at": int(time.time()),
+            "model": request.get("model", "gpt-4o"),
+            "status": "completed",
+            "output": [{
+                "id": f"msg_{uuid.uuid4().hex}",
+                "type": "message",
+                "role": "assistant",
+                "status": "completed",
+                "content": [{"type": "output_text", "text": text, "annotations": []}],
+            }],
+            "usage": {"input_tokens": len(str(request.get("input", ""))) // 4, "output_tokens": len(text) // 4},
+        })
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local stub of the OpenAI Responses API.")
+    parser.add_argument("--port", type=int, default=8000, help="Port to listen on. Defaults to 8000.")
+    parser.add_argument("--latency-ms", type=float, default=500, help="Mean response latency in milliseconds. Defaults to 500.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with HTTP 429/500. Defaults to 0.")
+    args = parser.parse_args()
+
+    StubCompletionHandler.state = StubState(args.latency_ms, args.error_rate)
+    server = ThreadingHTTPServer(("localhost", args.port), StubCompletionHandler)
+    print(f"Stub completion server listening on http://localhost:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"Counters: {StubCompletionHandler.state.counters}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+import argparse
+import asyncio
+import bisect
+import itertools
+import json
+import os
+import random
+import sys
+import time
+from urllib.parse import urlsplit
+from mock_api_server import read_message
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "scripts"))
+from offline_helpers import percentile
+
+# Load test for mock_api_server.py (or any API with the same endpoints) that reports requests/sec
+# and latency percentiles, to quantify what a cache tier in front of an enrichment API saves.
+#
+# Keys (zipcodes, user ids, coordinates) are drawn from --keys distinct values with Zipf
+# skew --zipf, so a few hot keys dominate the way a few zipcodes dominate real streams.
+# With --rate the requests are sent open-loop at that rate and latency is measured from the
+# time a request was due, so a slow API shows up as queueing instead of a lower send rate.
+# Without --rate each of the --concurrency connections sends its next request as soon as the
+# previous one returns, like a processor waiting on $https.
+#
+# With --cache-url the same load is run against the origin (--url) and then through the cache,
+# and both results are printed side by side together with the cache hit ratio and the number
+# of requests that reached the origin. The cache keeps its entries between runs; restart the
+# server to measure from a cold cache.
+#
+#   python3 api_load_client.py --url http://localhost:8080 --cache-url http://localhost:8081 \
+#       --endpoint zipcode --keys 5000 --zipf 1.1 --rate 2000 --duration 20
+
+
+class ZipfKeys:
+    """Samples keys 0..n-1 with P(k) proportional to 1 / (k + 1) ** s; s = 0 is uniform."""
+
+    def __init__(self, n, s, rng):
+        self.rng = rng
+        self.n = n
+        self.cdf = list(itertools.accumulate(1 / (k + 1) ** s for k in range(n))) if s else None
+
+    def sample(self):
+        if self.cdf is None:
+            return self.rng.randrange(self.n)
+        return bisect.bisect_left(self.cdf, self.rng.random() * self.cdf[-1])
+
+
+def make_request(endpoint, key):
+    """Returns (method, target, body) for one request to an endpoint of mock_api_server.py."""
+    if endpoint == "zipcode":
+        return "GET", f"/api/zipcode/{10000 + key}", b""
+    if endpoint == "solar":
+        return "GET", f"/api/solar/solar_resource/v1.json?lat={25 + key % 23}.{key % 97}&lon=-{71 + key % 51}.{key % 89}", b""
+    # Mirrors the generic_api_enrichment.json payload: per-event request_id, per-user user_id
+    body = {"user_id": f"user-{key}", "event_data": {"type": "user_action", "timestamp": time.time()},
+            "request_id": f"{random.getrandbits(64):x}"}
+    return "POST", "/api/v2/enrich", json.dumps(body).encode()
+
+
+async def fetch_stats(host, port):
+    """Returns the server's /stats counters, or {} if it has none."""
+    try:
+        reader, writer = await asyncio.open_connection(host, port)
+        writer.write(f"GET /stats HTTP/1.1\r\nHost: {host}:{port}\r\nContent-Length: 0\r\n\r\n".encode())
+        await writer.drain()
+        start_line, _, body = await read_message(reader)
+        writer.close()
+        return json.loads(body) if " 200 " in start_line + " " else {}
+    except (OSError, ValueError, TypeError):
+        return {}
+
+
+async def run_load(url, args):
+    """Runs the configured load against one base URL and returns the measurements."""
+    target = urlsplit(url)
+    host, port = target.hostname, target.port or 80
+    rng = random.Random(args.seed)
+    keys = ZipfKeys(args.keys, args.zipf, rng)
+    results = {"latencies": [], "statuses": {}, "cache": {}, "timeouts": 0}
+    schedule = asyncio.Queue(maxsize=args.concurrency * 4) if args.rate else None
+    start = time.perf_counter()
+    deadline = start + args.duration
+
+    async def connection():
+        reader = writer = None
+        while True:
+            if schedule is not None:
+                due = await schedule.get()
+                if due is None:
+                    break
+            else:
+                due = time.perf_counter()
+                if due >= deadline:
+                    break
+            method, path, body = make_request(args.endpoint, keys.sample())
+            try:
+                if writer is None:
+                    reader, writer = await asyncio.open_connection(host, port)
+                request = (f"{method} {path} HTTP/1.1\r\nHost: {host}:{port}\r\nContent-Type: application/json\r\n"
+                           f"Content-Length: {len(body)}\r\n\r\n").encode() + body
+                writer.write(request)
+                await writer.drain()
+                message = await asyncio.wait_for(read_message(reader), args.timeout)
+                if message is None:
+                    raise ConnectionError("server closed the connection")
+                start_line, headers, _ = message
+                status = start_line.split(" ", 2)[1]
+                cache_status = headers.get("x-cache")
+                if cache_status:
+                    results["cache"][cache_status] = results["cache"].get(cache_status, 0) + 1
+            except asyncio.TimeoutError:
+                # The response may still arrive later, so the connection cannot be reused
+                results["timeouts"] += 1
+                status = "timeout"
+                writer.close()
+                writer = None
+            except (OSError, asyncio.IncompleteReadError):
+                status = "connection error"
+                if writer is not None:
+                    writer.close()
+                writer = None
+            results["statuses"][status] = results["statuses"].get(status, 0) + 1
+            results["latencies"].append(time.perf_counter() - due)
+        if writer is not None:
+            writer.close()
+
+    async def dispatch():
+        sent = 0
+        while True:
+            due = start + sent / args.rate
+            if due >= deadline:
+                break
+            delay = due - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await schedule.put(due)
+            sent += 1
+        for _ in range(args.concurrency):
+            await schedule.put(None)
+
+    before = await fetch_stats(host, port)
+    tasks = [asyncio.ensure_future(connection()) for _ in range(args.concurrency)]
+    if schedule is not None:
+        tasks.append(asyncio.ensure_future(dispatch()))
+    await asyncio.gather(*tasks)
+    results["elapsed"] = time.perf_counter() - start
+    after = await fetch_stats(host, port)
+    if "origin_requests" in after:
+        results["origin_requests"] = after["origin_requests"] - before.get("origin_requests", 0)
+    return results
+
+
+def summarize(name, results):
+    latencies = results["latencies"]
+    ok = results["statuses"].get("200", 0)
+    cache_total = sum(results["cache"].values())
+    return {
+        "name": name,
+        "requests": len(latencies),
+        "rps": len(latencies) / results["elapsed"],
+        "ok_rps": ok / results["elapsed"],
+        "p50": percentile(latencies, 50) * 1000,
+        "p95": percentile(latencies, 95) * 1000,
+        "p99": percentile(latencies, 99) * 1000,
+        "max": max(latencies, default=0) * 1000,
+        "errors": len(latencies) - ok,
+        "hit_ratio": (results["cache"].get("HIT", 0) + results["cache"].get("COALESCED", 0)) / cache_total
+        if cache_total else None,
+        "origin_requests": results.get("origin_requests"),
+        "statuses": results["statuses"],
+    }
+
+
+def print_summaries(summaries):
+    print("-------------------------------------------------")
+    print(f"{'Target':<8} {'Requests':>9} {'req/s':>9} {'ok/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+          f"{'max ms':>8} {'Errors':>7} {'Hit %':>6} {'Origin':>8}")
+    for s in summaries:
+        hit = f"{s['hit_ratio'] * 100:.1f}" if s["hit_ratio"] is not None else "-"
+        origin = s["origin_requests"] if s["origin_requests"] is not None else s["requests"]
+        print(f"{s['name']:<8} {s['requests']:>9} {s['rps']:>9,.0f} {s['ok_rps']:>9,.0f} {s['p50']:>8.1f} "
+              f"{s['p95']:>8.1f} {s['p99']:>8.1f} {s['max']:>8.1f} {s['errors']:>7} {hit:>6} {origin:>8}")
+    for s in summaries:
+        failed = {status: count for status, count in s["statuses"].items() if status != "200"}
+        if failed:
+            print(f"{s['name']} non-200 responses: {failed}")
+    if len(summaries) == 2 and summaries[0]["p50"]:
+        direct, cached = summaries
+        print(f"Cache: p50 {direct['p50'] / max(cached['p50'], 1e-3):.1f}x lower, p99 "
+              f"{direct['p99'] / max(cached['p99'], 1e-3):.1f}x lower, origin requests "
+              f"{cached['origin_requests'] if cached['origin_requests'] is not None else '?'} instead of {direct['requests']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test an enrichment API with and without a cache in front.")
+    parser.add_argument("--url", default="http://localhost:8080", help="Origin API base URL. Defaults to http://localhost:8080.")
+    parser.add_argument("--cache-url", help="Cache base URL; runs the load against --url and then through the cache.")
+    parser.add_argument("--endpoint", choices=["zipcode", "solar", "enrich"], default="zipcode",
+                        help="Request type (see mock_api_server.py). Defaults to zipcode.")
+    parser.add_argument("--keys", type=int, default=5000, help="Distinct keys (zipcodes, users, coordinates). Defaults to 5000.")
+    parser.add_argument("--zipf", type=float, default=1.1, help="Zipf exponent of the key choice; 0 is uniform. Defaults to 1.1.")
+    parser.add_argument("--concurrency", type=int, default=64, help="Connections, i.e. requests in flight at most. Defaults to 64.")
+    parser.add_argument("--rate", type=float, default=0, help="Open-loop requests/sec. Defaults to 0 (closed loop).")
+    parser.add_argument("--duration", type=float, default=20, help="Seconds per run. Defaults to 20.")
+    parser.add_argument("--timeout", type=float, default=5, help="Seconds before a request counts as timed out. Defaults to 5.")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed for the key sequence. Defaults to 1.")
+    parser.add_argument("--output", help="Write the summaries as JSON to this file.")
+    args = parser.parse_args()
+
+    runs = [("direct", args.url)] + ([("cached", args.cache_url)] if args.cache_url else [])
+    summaries = []
+    for name, url in runs:
+        print(f"Running {args.duration:g}s against {url}")
+        summaries.append(summarize(name, asyncio.run(run_load(url, args))))
+    print_summaries(summaries)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(summaries, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,340 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import random
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qs, urlsplit
+
+# Local stand-in for the APIs the $https examples call, to measure what per-event enrichment
+# costs and how much a cache tier in front of the API would save. Uses asyncio only.
+#
+# The origin server answers the endpoints used by generic_api_enrichment.json and
+# solar_fake_zipcode.json, plus a zipcode lookup for hot-key tests:
+#
+#   POST /api/v2/enrich                          user profile, recommendations, risk score
+#   GET  /api/v2/addresses                       FakerAPI-style address
+#   GET  /api/solar/solar_resource/v1.json?lat=&lon=   NREL-style irradiance
+#   GET  /api/zipcode/<zipcode>                  location of a zipcode
+#   GET  /stats                                  request counters (never delayed)
+#
+# Every response is delayed by a latency drawn from --latency-distribution, and a share of the
+# requests fail with 500 (--error-rate), 429 (--throttle-rate) or hang for --timeout-ms
+# (--timeout-rate). --origin-concurrency caps the requests served at once, like an API quota.
+# Responses are deterministic per request key, so they are safe to cache.
+#
+# With --cache-port a read-through cache listens as well and forwards misses to the origin
+# over keep-alive connections. Entries expire after --cache-ttl seconds and the least recently
+# used entry is evicted beyond --cache-entries. With coalescing (the default), concurrent misses
+# for the same key share one origin request. Each response carries X-Cache: HIT, MISS or
+# COALESCED. Errors are never cached.
+#
+#   python3 mock_api_server.py --port 8080 --cache-port 8081 --latency-ms 80 --error-rate 0.01
+#   python3 api_load_client.py --url http://localhost:8080 --cache-url http://localhost:8081
+
+CITIES = ["Austin", "Boston", "Chicago", "Denver", "Miami", "Portland", "Phoenix", "Seattle"]
+
+
+async def read_message(reader):
+    """Reads one HTTP/1.1 message (request or response) with a Content-Length body.
+
+    Returns (start_line, headers, body) with lower-cased header names, or None at end of stream.
+    """
+    start_line = await reader.readline()
+    if not start_line:
+        return None
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    length = int(headers.get("content-length", 0))
+    body = await reader.readexactly(length) if length else b""
+    return start_line.decode("latin-1").rstrip("\r\n"), headers, body
+
+
+def write_response(writer, status, body, extra_headers=None):
+    reason = {200: "OK", 404: "Not Found", 429: "Too Many Requests", 500: "Internal Server Error",
+              502: "Bad Gateway"}.get(status, "Status")
+    lines = [f"HTTP/1.1 {status} {reason}", "Content-Type: application/json", f"Content-Length: {len(body)}"]
+    lines += [f"{name}: {value}" for name, value in (extra_headers or {}).items()]
+    writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+
+
+async def serve_connection(reader, writer, handle):
+    """Serves keep-alive requests on one connection with handle(method, target, headers, body)."""
+    try:
+        while True:
+            message = await read_message(reader)
+            if message is None:
+                break
+            start_line, headers, body = message
+            method, target, _ = start_line.split(" ", 2)
+            status, payload, extra_headers = await handle(method, target, headers, body)
+            write_response(writer, status, payload, extra_headers)
+            await writer.drain()
+    except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+        pass
+    finally:
+        writer.close()
+
+
+class LatencyModel:
+    """Draws per-request delays (seconds) and failures from the configured distributions."""
+
+    def __init__(self, args, rng):
+        self.args = args
+        self.rng = rng
+
+    def delay(self):
+        mean = self.args.latency_ms / 1000
+        if self.args.latency_distribution == "fixed":
+            return mean
+        if self.args.latency_distribution == "uniform":
+            return self.rng.uniform(0, 2 * mean)
+        if self.args.latency_distribution == "exponential":
+            return self.rng.expovariate(1 / mean) if mean else 0.0
+        sigma = self.args.latency_sigma
+        return self.rng.lognormvariate(math.log(mean) - sigma ** 2 / 2, sigma) if mean else 0.0
+
+    def outcome(self):
+        """Returns 'ok', 'error', 'throttle' or 'timeout' for one request."""
+        draw = self.rng.random()
+        for name, rate in (("error", self.args.error_rate), ("throttle", self.args.throttle_rate),
+                           ("timeout", self.args.timeout_rate)):
+            if draw < rate:
+                return name
+            draw -= rate
+        return "ok"
+
+
+def key_random(key):
+    """A Random seeded from the request key, so equal requests get equal responses."""
+    return random.Random(int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big"))
+
+
+def location(rng, zipcode):
+    return {"zipcode": zipcode, "city": rng.choice(CITIES),
+            "latitude": round(rng.uniform(25, 48), 4), "longitude": round(rng.uniform(-122, -71), 4)}
+
+
+class Origin:
+    """The slow third-party API."""
+
+    def __init__(self, args):
+        self.model = LatencyModel(args, random.Random(args.seed))
+        self.timeout = args.timeout_ms / 1000
+        self.slots = asyncio.Semaphore(args.origin_concurrency) if args.origin_concurrency else None
+        self.counts = {"requests": 0, "ok": 0, "error": 0, "throttle": 0, "timeout": 0, "not_found": 0, "in_flight": 0}
+
+    async def handle(self, method, target, headers, body):
+        url = urlsplit(target)
+        if url.path == "/stats":
+            return 200, json.dumps(self.counts).encode(), None
+        self.counts["requests"] += 1
+        self.counts["in_flight"] += 1
+        try:
+            if self.slots is None:
+                return await self.respond(method, url, body)
+            async with self.slots:
+                return await self.respond(method, url, body)
+        finally:
+            self.counts["in_flight"] -= 1
+
+    async def respond(self, method, url, body):
+        outcome = self.model.outcome()
+        await asyncio.sleep(self.timeout if outcome == "timeout" else self.model.delay())
+        if outcome != "ok":
+            self.counts[outcome] += 1
+            status = 429 if outcome == "throttle" else 500
+            return status, json.dumps({"error": outcome}).encode(), None
+
+        payload = self.route(method, url, body)
+        if payload is None:
+            self.counts["not_found"] += 1
+            return 404, b'{"error": "not found"}', None
+        self.counts["ok"] += 1
+        return 200, json.dumps(payload).encode(), None
+
+    def route(self, method, url, body):
+        query = {name: values[0] for name, values in parse_qs(url.query).items()}
+        if method == "POST" and url.path == "/api/v2/enrich":
+            request = json.loads(body or b"{}")
+            user_id = str(request.get("user_id"))
+            rng = key_random(user_id)
+            return {"user_profile": {"user_id": user_id, "segment": rng.choice(["new", "regular", "vip"]),
+                                     "tier": rng.randint(1, 5)},
+                    "recommendations": [f"item-{rng.randint(1, 9999)}" for _ in range(3)],
+                    "risk_assessment": {"score": round(rng.random(), 3)},
+                    "response_time_ms": self.model.args.latency_ms}
+        if method == "GET" and url.path == "/api/v2/addresses":
+            rng = key_random(url.query)
+            return {"status": "OK", "code": 200, "total": 1,
+                    "data": [location(rng, f"{rng.randint(10000, 99999)}")]}
+        if method == "GET" and url.path == "/api/solar/solar_resource/v1.json":
+            rng = key_random(f"{query.get('lat')},{query.get('lon')}")
+            return {"inputs": query, "outputs": {name: {"annual": round(rng.uniform(3, 7), 2)}
+                                                 for name in ("avg_ghi", "avg_dni", "avg_lat_tilt")}}
+        if method == "GET" and url.path.startswith("/api/zipcode/"):
+            zipcode = url.path.rsplit("/", 1)[1]
+            return location(key_random(zipcode), zipcode)
+        return None
+
+
+class OriginClient:
+    """Keep-alive HTTP/1.1 connections from the cache to the origin, reused from an idle pool."""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.idle = []
+
+    async def request(self, method, target, headers, body):
+        if self.idle:
+            reader, writer = self.idle.pop()
+        else:
+            reader, writer = await asyncio.open_connection(self.host, self.port)
+        lines = [f"{method} {target} HTTP/1.1", f"Host: {self.host}:{self.port}", f"Content-Length: {len(body)}"]
+        if "content-type" in headers:
+            lines.append(f"Content-Type: {headers['content-type']}")
+        try:
+            writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+            await writer.drain()
+            message = await read_message(reader)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            writer.close()
+            raise
+        if message is None:
+            writer.close()
+            raise ConnectionError("origin closed the connection")
+        self.idle.append((reader, writer))
+        status_line, _, response_body = message
+        return int(status_line.split(" ", 2)[1]), response_body
+
+
+class ReadThroughCache:
+    """TTL + LRU cache in front of the origin, with optional coalescing of concurrent misses."""
+
+    def __init__(self, args):
+        self.client = OriginClient(args.origin_host, args.port)
+        self.ttl = args.cache_ttl
+        self.max_entries = args.cache_entries
+        self.coalesce = not args.no_coalesce
+        self.key_field = args.cache_key_field
+        self.entries = OrderedDict()  # key -> (expires_at, status, body)
+        self.in_flight = {}  # key -> Future of (status, body)
+        self.counts = {"requests": 0, "hits": 0, "misses": 0, "coalesced": 0, "origin_requests": 0,
+                       "origin_errors": 0, "evictions": 0, "expired": 0}
+
+    def cache_key(self, method, target, body):
+        """GET requests are keyed by URL; POSTs by --cache-key-field of the JSON body, else the whole body."""
+        if method != "POST":
+            return f"{method} {target}"
+        try:
+            value = json.loads(body).get(self.key_field)
+        except (ValueError, AttributeError):
+            value = None
+        return f"POST {target} {value if value is not None else body.decode('utf-8', 'replace')}"
+
+    async def handle(self, method, target, headers, body):
+        if urlsplit(target).path == "/stats":
+            return 200, json.dumps(dict(self.counts, entries=len(self.entries))).encode(), None
+        self.counts["requests"] += 1
+        key = self.cache_key(method, target, body)
+
+        entry = self.entries.get(key)
+        if entry is not None:
+            if entry[0] > time.monotonic():
+                self.entries.move_to_end(key)
+                self.counts["hits"] += 1
+                return entry[1], entry[2], {"X-Cache": "HIT"}
+            del self.entries[key]
+            self.counts["expired"] += 1
+
+        if self.coalesce and key in self.in_flight:
+            self.counts["coalesced"] += 1
+            status, response = await asyncio.shield(self.in_flight[key])
+            return status, response, {"X-Cache": "COALESCED"}
+
+        self.counts["misses"] += 1
+        future = asyncio.get_running_loop().create_future()
+        if self.coalesce:
+            self.in_flight[key] = future
+        status, response = 502, json.dumps({"error": "origin request did not complete"}).encode()
+        try:
+            self.counts["origin_requests"] += 1
+            status, response = await self.client.request(method, target, headers, body)
+        except (OSError, ValueError, asyncio.IncompleteReadError) as e:
+            self.counts["origin_errors"] += 1
+            status, response = 502, json.dumps({"error": f"origin unavailable: {e}"}).encode()
+        finally:
+            self.in_flight.pop(key, None)
+            # Resolved even on cancellation or an unexpected error, so coalesced requests never wait forever
+            future.set_result((status, response))
+
+        if status == 200:
+            self.entries[key] = (time.monotonic() + self.ttl, status, response)
+            if len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.counts["evictions"] += 1
+        return status, response, {"X-Cache": "MISS"}
+
+
+async def report(servers, interval):
+    """Prints each server's counters every interval."""
+    while True:
+        await asyncio.sleep(interval)
+        for name, server in servers:
+            print(f"{name}: " + " ".join(f"{key}={value}" for key, value in server.counts.items()))
+
+
+async def main(args):
+    origin = Origin(args)
+    servers = [("origin", origin)]
+    listeners = [await asyncio.start_server(lambda r, w: serve_connection(r, w, origin.handle), args.host, args.port,
+                                            backlog=1024)]
+    print(f"Origin API on http://{args.host}:{args.port} ({args.latency_distribution} latency, "
+          f"mean {args.latency_ms:g} ms, error rate {args.error_rate:g})")
+    if args.cache_port:
+        cache = ReadThroughCache(args)
+        servers.append(("cache", cache))
+        listeners.append(await asyncio.start_server(lambda r, w: serve_connection(r, w, cache.handle), args.host,
+                                                    args.cache_port, backlog=1024))
+        print(f"Read-through cache on http://{args.host}:{args.cache_port} (ttl {args.cache_ttl:g}s, "
+              f"{args.cache_entries} entries, coalescing {'off' if args.no_coalesce else 'on'})")
+    if args.report_interval:
+        asyncio.ensure_future(report(servers, args.report_interval))
+    await asyncio.gather(*(listener.serve_forever() for listener in listeners))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mock enrichment API with latency/error injection and a read-through cache.")
+    parser.add_argument("--host", default="localhost", help="Interface to listen on. Defaults to localhost.")
+    parser.add_argument("--port", type=int, default=8080, help="Origin API port. Defaults to 8080.")
+    parser.add_argument("--latency-ms", type=float, default=50, help="Mean response latency in ms. Defaults to 50.")
+    parser.add_argument("--latency-distribution", choices=["fixed", "uniform", "exponential", "lognormal"],
+                        default="lognormal", help="Latency distribution. Defaults to lognormal.")
+    parser.add_argument("--latency-sigma", type=float, default=0.6, help="Sigma of the lognormal latency. Defaults to 0.6.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with 500. Defaults to 0.")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Share of requests answered with 429. Defaults to 0.")
+    parser.add_argument("--timeout-rate", type=float, default=0.0, help="Share of requests that hang for --timeout-ms. Defaults to 0.")
+    parser.add_argument("--timeout-ms", type=float, default=30000, help="How long a hanging request takes. Defaults to 30000.")
+    parser.add_argument("--origin-concurrency", type=int, default=0,
+                        help="Requests the origin serves at once; the rest queue. Defaults to 0 (unlimited).")
+    parser.add_argument("--seed", type=int, help="Random seed for latency and errors.")
+    parser.add_argument("--cache-port", type=int, help="Also run the read-through cache on this port.")
+    parser.add_argument("--origin-host", default="localhost", help="Host the cache forwards misses to. Defaults to localhost.")
+    parser.add_argument("--cache-ttl", type=float, default=60, help="Seconds a cached response stays valid. Defaults to 60.")
+    parser.add_argument("--cache-entries", type=int, default=10000, help="LRU capacity of the cache. Defaults to 10000.")
+    parser.add_argument("--cache-key-field", default="user_id",
+                        help="JSON body field that identifies a POST request for caching. Defaults to user_id.")
+    parser.add_argument("--no-coalesce", action="store_true", help="Send every concurrent miss to the origin.")
+    parser.add_argument("--report-interval", type=float, default=10, help="Seconds between counter reports; 0 is off. Defaults to 10.")
+    try:
+        asyncio.run(main(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,387 @@
+import argparse
+import bisect
+import multiprocessing
+import queue
+import random
+import string
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pymongo import DeleteOne, InsertOne, MongoClient, ReplaceOne, UpdateOne
+
+# Reference cloner and benchmark for withDeletes.js (initialSync with parallelism, then the
+# change stream, into $merge), to find the parallelism that pays off for a collection before
+# setting it on the processor. Needs a replica set (for example a local single-node one).
+#
+# The cloner does what the processor does:
+#   1. notes the cluster time, then copies the collection in _id ranges (boundaries from a
+#      $sample of _ids) with --parallelism worker processes, as unordered bulk upserts
+#      (replace when matched, insert when not), checkpointing the last _id copied per range
+#   2. meanwhile reads the change stream from the noted time. Events for ranges that are
+#      already copied are applied straight away with the processor's $merge semantics
+#      (insert/update/replace -> replace or insert the full document, delete -> delete if
+#      present); events for ranges still being copied wait until their range is done, so a
+#      stale copy can never overwrite a newer change
+#   3. after the copy it keeps applying events until it has caught up with the cluster time
+#      at which the copy finished, and reports the catch-up time
+#
+# Checkpoints live in the target database (clone_checkpoints). A cloner that is stopped or
+# fails resumes where it left off unless --fresh is given. The change stream resumes from the
+# last point before which every event was applied (at first the noted time); events after it
+# may be applied a second time, which gives the same result.
+#
+# --benchmark runs a fresh clone for each of --parallelism 1,2,4,... and prints docs/sec per
+# level; --write-rate keeps inserting, updating and deleting source documents meanwhile.
+#
+#   python3 clone_bench.py --uri mongodb://localhost:27017/?replicaSet=rs0 --seed-docs 1000000
+#   python3 clone_bench.py --benchmark --parallelism 1,2,4,8,16 --write-rate 500 --verify
+
+CHECKPOINTS = "clone_checkpoints"
+
+
+def seed_source(collection, count, doc_size, seed=None):
+    """Fills the source collection with `count` documents of about `doc_size` bytes."""
+    rng = random.Random(seed)
+    collection.drop()
+    filler = "".join(rng.choices(string.ascii_letters, k=max(1, doc_size - 80)))
+    for start in range(0, count, 10000):
+        collection.insert_many([{"_id": i, "group": i % 100, "value": rng.random(), "payload": filler}
+                                for i in range(start, min(start + 10000, count))], ordered=False)
+    print(f"Seeded {count} documents into {collection.full_name}")
+
+
+def range_boundaries(collection, ranges):
+    """Splits the _id space into about `ranges` ranges from a sample of _ids."""
+    sample = sorted(doc["_id"] for doc in collection.aggregate([{"$sample": {"size": ranges * 20}},
+                                                                {"$project": {"_id": 1}}]))
+    boundaries = []
+    for i in range(1, ranges):
+        candidate = sample[len(sample) * i // ranges] if sample else None
+        if candidate is not None and (not boundaries or candidate > boundaries[-1]):
+            boundaries.append(candidate)
+    return boundaries
+
+
+def range_filter(lo, hi, after=None):
+    condition = {}
+    if after is not None:
+        condition["$gt"] = after
+    elif lo is not None:
+        condition["$gte"] = lo
+    if hi is not None:
+        condition["$lt"] = hi
+    return {"_id": condition} if condition else {}
+
+
+def copy_range(uri, source, target, checkpoint_id, index, lo, hi, after, batch_size, fail_after):
+    """Worker process: copies one _id range in _id order, checkpointing after every batch."""
+    client = MongoClient(uri)
+    source_coll = client[source[0]][source[1]]
+    target_coll = client[target[0]][target[1]]
+    checkpoints = client[target[0]][CHECKPOINTS]
+    copied = 0
+    start = time.perf_counter()
+    batch = []
+
+    def flush():
+        target_coll.bulk_write([ReplaceOne({"_id": doc["_id"]}, doc, upsert=True) for doc in batch], ordered=False)
+        checkpoints.update_one({"_id": checkpoint_id}, {"$set": {f"ranges.{index}.last_id": batch[-1]["_id"]}})
+
+    for document in source_coll.find(range_filter(lo, hi, after), sort=[("_id", 1)], batch_size=batch_size):
+        batch.append(document)
+        if len(batch) >= batch_size:
+            flush()
+            copied += len(batch)
+            batch = []
+            if fail_after and copied >= fail_after:
+                raise RuntimeError(f"range {index} stopped after {copied} documents (--fail-after)")
+    if batch:
+        flush()
+        copied += len(batch)
+    checkpoints.update_one({"_id": checkpoint_id}, {"$set": {f"ranges.{index}.done": True}})
+    return index, copied, time.perf_counter() - start
+
+
+def apply_events(collection, events):
+    """Applies change events with withDeletes.js' $merge semantics, in order."""
+    requests = []
+    for event in events:
+        if event["operationType"] == "delete":
+            requests.append(DeleteOne(event["documentKey"]))
+        elif event.get("fullDocument") is not None:
+            requests.append(ReplaceOne({"_id": event["documentKey"]["_id"]}, event["fullDocument"], upsert=True))
+        # An update whose document is already gone has no full document; its delete follows
+    if requests:
+        collection.bulk_write(requests, ordered=True)
+    return len(requests)
+
+
+class CatchUp(threading.Thread):
+    """Reads the change stream and applies events once the copy of their _id range is done."""
+
+    def __init__(self, client, args, checkpoint, boundaries, done):
+        super().__init__(daemon=True)
+        self.source = client[args.db][args.coll]
+        self.target = client[args.target_db][args.target_coll]
+        self.checkpoints = client[args.target_db][CHECKPOINTS]
+        self.checkpoint = checkpoint
+        self.boundaries = boundaries
+        self.done = set(done)
+        if len(self.done) == len(boundaries) + 1:
+            self.done.add(-1)  # Every range was copied before a restart
+        self.waiting = {}  # range index -> buffered events
+        self.messages = queue.Queue()
+        self.batch_size = args.batch_size
+        self.applied = 0
+        self.buffered_peak = 0
+        self.caught_up_at = None
+        self.catch_up_to = None
+        self.stop = threading.Event()
+        self.error = None
+
+    def range_of(self, document_key):
+        try:
+            return bisect.bisect_right(self.boundaries, document_key["_id"])
+        except TypeError:
+            return -1  # _id of another type: hold until every range is done (-1 joins done then)
+
+    def range_done(self, index):
+        self.messages.put(("done", index))
+
+    def run(self):
+        try:
+            self.follow()
+        except Exception as e:  # Reported by the main thread
+            self.error = e
+
+    def follow(self):
+        resume = {"resume_after": self.checkpoint["token"]} if self.checkpoint.get("token") else \
+            {"start_at_operation_time": self.checkpoint["start_at"]}
+        ready = []
+        with self.source.watch(full_document="updateLookup", max_await_time_ms=100, **resume) as stream:
+            while not self.stop.is_set():
+                while not self.messages.empty():
+                    _, index = self.messages.get()
+                    self.done.add(index)
+                    ready.extend(self.waiting.pop(index, []))
+                    if len(self.done) == len(self.boundaries) + 1:
+                        # From now on, events of any _id type are applied straight away
+                        self.done.add(-1)
+                        ready.extend(self.waiting.pop(-1, []))
+
+                event = stream.try_next()
+                if event is not None:
+                    index = self.range_of(event["documentKey"])
+                    if index in self.done:
+                        ready.append(event)
+                    else:
+                        self.waiting.setdefault(index, []).append(event)
+                        self.buffered_peak = max(self.buffered_peak, sum(map(len, self.waiting.values())))
+
+                if ready and (event is None or len(ready) >= self.batch_size):
+                    self.applied += apply_events(self.target, ready)
+                    ready = []
+                    if not self.waiting:
+                        # Everything before this point is applied, so the stream can resume here
+                        self.checkpoints.update_one({"_id": self.checkpoint["_id"]},
+                                                    {"$set": {"token": stream.resume_token}})
+
+                if self.catch_up_to is not None and self.caught_up_at is None and not ready and not self.waiting:
+                    position = event["clusterTime"] if event is not None else None
+                    if event is None or position >= self.catch_up_to:
+                        self.caught_up_at = time.perf_counter()
+
+
+def cluster_time(client):
+    with client.start_session() as session:
+        client.admin.command("ping", session=session)
+        return session.operation_time
+
+
+def load_checkpoint(client, args, fresh):
+    """Returns the clone's checkpoint document, creating a new one (and new ranges) if needed."""
+    checkpoints = client[args.target_db][CHECKPOINTS]
+    checkpoint_id = f"{args.db}.{args.coll}->{args.target_db}.{args.target_coll}"
+    if fresh:
+        checkpoints.delete_one({"_id": checkpoint_id})
+        client[args.target_db][args.target_coll].drop()
+    checkpoint = checkpoints.find_one({"_id": checkpoint_id})
+    if checkpoint is None:
+        start_at = cluster_time(client)
+        boundaries = range_boundaries(client[args.db][args.coll], args.ranges)
+        checkpoint = {"_id": checkpoint_id, "start_at": start_at, "boundaries": boundaries, "token": None,
+                      "ranges": {str(i): {"last_id": None, "done": False} for i in range(len(boundaries) + 1)}}
+        checkpoints.insert_one(checkpoint)
+    else:
+        finished = sum(r["done"] for r in checkpoint["ranges"].values())
+        print(f"Resuming from checkpoint: {finished}/{len(checkpoint['ranges'])} ranges copied")
+    return checkpoint
+
+
+def clone(args, parallelism, fresh):
+    """Runs one clone and returns its measurements."""
+    client = MongoClient(args.uri)
+    checkpoint = load_checkpoint(client, args, fresh)
+    boundaries = checkpoint["boundaries"]
+    bounds = [None] + boundaries + [None]
+    done = [int(i) for i, r in checkpoint["ranges"].items() if r["done"]]
+
+    catch_up = CatchUp(client, args, checkpoint, boundaries, done)
+    catch_up.start()
+
+    start = time.perf_counter()
+    copied = 0
+    failed = None
+    with ProcessPoolExecutor(max_workers=parallelism, mp_context=multiprocessing.get_context("spawn")) as pool:
+        futures = [pool.submit(copy_range, args.uri, (args.db, args.coll), (args.target_db, args.target_coll),
+                               checkpoint["_id"], i, bounds[i], bounds[i + 1], r["last_id"], args.batch_size,
+                               args.fail_after)
+                   for i, r in ((int(i), r) for i, r in checkpoint["ranges"].items()) if not r["done"]]
+        for future in as_completed(futures):
+            try:
+                index, count, _ = future.result()
+            except Exception as e:
+                failed = failed or e
+                continue
+            copied += count
+            catch_up.range_done(index)
+    copy_seconds = time.perf_counter() - start
+
+    if failed is not None:
+        catch_up.stop.set()
+        catch_up.join()
+        raise SystemExit(f"Copy failed: {failed}. Run again without --fresh to resume from the checkpoint.")
+
+    catch_up.catch_up_to = cluster_time(client)
+    deadline = time.perf_counter() + args.catch_up_timeout
+    while catch_up.caught_up_at is None and catch_up.error is None and time.perf_counter() < deadline:
+        time.sleep(0.05)
+    catch_up.stop.set()
+    catch_up.join()
+    if catch_up.error is not None:
+        raise SystemExit(f"Change stream catch-up failed: {catch_up.error}")
+
+    return {
+        "parallelism": parallelism,
+        "ranges": len(bounds) - 1,
+        "copied": copied,
+        "copy_seconds": copy_seconds,
+        "docs_per_sec": copied / copy_seconds if copy_seconds else 0,
+        "catch_up_seconds": catch_up.caught_up_at - start - copy_seconds if catch_up.caught_up_at else None,
+        "events_applied": catch_up.applied,
+        "buffered_peak": catch_up.buffered_peak,
+    }
+
+
+def write_load(uri, db, coll, rate, stop, seed):
+    """Inserts, updates and deletes source documents at `rate` ops/sec until stopped."""
+    rng = random.Random(seed)
+    collection = MongoClient(uri)[db][coll]
+    highest = collection.find_one(sort=[("_id", -1)])
+    next_id = (highest["_id"] + 1) if highest and isinstance(highest["_id"], int) else 10 ** 9
+    sent = 0
+    start = time.perf_counter()
+    while not stop.is_set():
+        due = start + sent / rate
+        if due > time.perf_counter():
+            time.sleep(due - time.perf_counter())
+        requests = []
+        for _ in range(10):
+            draw = rng.random()
+            key = rng.randrange(next_id)
+            if draw < 0.4:
+                requests.append(InsertOne({"_id": next_id, "group": next_id % 100, "value": rng.random(), "payload": "new"}))
+                next_id += 1
+            elif draw < 0.8:
+                requests.append(UpdateOne({"_id": key}, {"$set": {"value": rng.random()}, "$inc": {"updates": 1}}))
+            else:
+                requests.append(DeleteOne({"_id": key}))
+        collection.bulk_write(requests, ordered=False)
+        sent += len(requests)
+
+
+def verify(client, args):
+    """Compares source and target document by document in _id order."""
+    source = client[args.db][args.coll].find(sort=[("_id", 1)])
+    target = client[args.target_db][args.target_coll].find(sort=[("_id", 1)])
+    missing = extra = different = 0
+    left, right = next(source, None), next(target, None)
+    while left is not None or right is not None:
+        if right is None or (left is not None and left["_id"] < right["_id"]):
+            missing += 1
+            left = next(source, None)
+        elif left is None or right["_id"] < left["_id"]:
+            extra += 1
+            right = next(target, None)
+        else:
+            different += left != right
+            left, right = next(source, None), next(target, None)
+    return missing, extra, different
+
+
+def print_result(result):
+    catch_up = f"{result['catch_up_seconds']:.2f}s" if result["catch_up_seconds"] is not None else "timed out"
+    print(f"{result['parallelism']:>11} {result['ranges']:>6} {result['copied']:>10} {result['copy_seconds']:>8.1f}s "
+          f"{result['docs_per_sec']:>11,.0f} {result['events_applied']:>8} {result['buffered_peak']:>9} {catch_up:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Clone a collection like initialSync + change stream + $merge, and benchmark parallelism.")
+    parser.add_argument("--uri", default="mongodb://localhost:27017/?replicaSet=rs0", help="Replica set connection string.")
+    parser.add_argument("--db", default="test", help="Source database. Defaults to test.")
+    parser.add_argument("--coll", default="replicate", help="Source collection. Defaults to replicate, as in withDeletes.js.")
+    parser.add_argument("--target-db", default="test", help="Target database. Defaults to test.")
+    parser.add_argument("--target-coll", default="replicate_test", help="Target collection. Defaults to replicate_test.")
+    parser.add_argument("--parallelism", default="4",
+                        help="Worker processes, or a comma-separated list with --benchmark. Defaults to 4.")
+    parser.add_argument("--ranges", type=int, help="_id ranges to split the copy into. Defaults to 4 x the largest parallelism.")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Documents per bulk write and checkpoint. Defaults to 1000.")
+    parser.add_argument("--benchmark", action="store_true", help="Run a fresh clone per --parallelism value and compare them.")
+    parser.add_argument("--fresh", action="store_true", help="Drop the target and its checkpoint instead of resuming.")
+    parser.add_argument("--seed-docs", type=int, help="(Re)create the source collection with this many documents first.")
+    parser.add_argument("--doc-size", type=int, default=1024, help="Approximate size of seeded documents. Defaults to 1024.")
+    parser.add_argument("--write-rate", type=float, default=0, help="Source writes/sec during each clone. Defaults to 0.")
+    parser.add_argument("--catch-up-timeout", type=float, default=120,
+                        help="Seconds to wait for the change stream to catch up after the copy. Defaults to 120.")
+    parser.add_argument("--fail-after", type=int, default=0,
+                        help="Make every range fail after this many documents, to try resuming. Defaults to 0 (off).")
+    parser.add_argument("--verify", action="store_true", help="Compare source and target after each clone (writes paused).")
+    parser.add_argument("--seed", type=int, help="Random seed for seeding and the write load.")
+    args = parser.parse_args()
+
+    levels = [int(level) for level in args.parallelism.split(",")]
+    if len(levels) > 1 and not args.benchmark:
+        parser.error("a list of --parallelism values needs --benchmark")
+    args.ranges = args.ranges or 4 * max(levels)
+
+    client = MongoClient(args.uri)
+    if args.seed_docs:
+        seed_source(client[args.db][args.coll], args.seed_docs, args.doc_size, args.seed)
+
+    print("-------------------------------------------------")
+    print(f"{'Parallelism':>11} {'Ranges':>6} {'Copied':>10} {'Copy':>9} {'Docs/sec':>11} {'Events':>8} "
+          f"{'Buffered':>9} {'Catch-up':>10}")
+    for parallelism in levels:
+        stop = multiprocessing.Event()
+        writer = None
+        if args.write_rate:
+            writer = multiprocessing.Process(target=write_load, args=(args.uri, args.db, args.coll, args.write_rate,
+                                                                      stop, args.seed))
+            writer.start()
+        try:
+            result = clone(args, parallelism, fresh=args.fresh or args.benchmark)
+        finally:
+            stop.set()
+            if writer is not None:
+                writer.join()
+        print_result(result)
+        if args.verify:
+            if args.write_rate:
+                # Apply the writes made between the catch-up point and stopping the load
+                clone(args, parallelism, fresh=False)
+            missing, extra, different = verify(client, args)
+            print(f"{'':>11} verify: missing={missing} extra={extra} different={different}")
+
+
+if __name__ == "__main__":
+    main()
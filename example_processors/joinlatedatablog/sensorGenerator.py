@@ -1,6 +1,15 @@
-from confluent_kafka import Producer
+from confluent_kafka import KafkaException, Producer
+import argparse
 import json
+import mmap
+import os
+import random
+import sys
 import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'largeMessageChunking'))
+from kafka_chunking import Chunker, add_arguments, report
 
 # Kafka topics
 TEMPERATURE_TOPIC = 'temperature'
@@ -15,8 +24,22 @@ conf = {
     'sasl.password': 'YOURAPISECRET'  # API secret
 }
 
-# Create producer instance
-producer = Producer(conf)
+# Without arguments the script sends the three small demo batches below.
+#
+# Replay mode (--replay FILE) streams a large NDJSON file of sensor records to the same
+# topics to test late data and DLQ handling in sensorJoins.js / sensorDLQUpdater.js at scale:
+#   * the file is memory-mapped and read line by line, so it is never loaded as a whole
+#   * records are routed to the temperature/humidity topics by the field they carry
+#   * a share of the records can be made late (their timestamp moved back) and the order
+#     can be shuffled within a bounded window
+#   * messages are produced asynchronously; delivery results are counted in the callback
+#     and reported once per second instead of printing every message
+#   * with --max-message-bytes, records larger than the topic accepts are split into chunks
+#     (see ../largeMessageChunking)
+#
+#   python3 sensorGenerator.py --generate sensors.ndjson --records 1000000
+#   python3 sensorGenerator.py --replay sensors.ndjson --late-fraction 0.05 --late-mean 8 --reorder-window 100
+
 
 # Callback for producer confirmation
 def acked(err, msg):
@@ -51,7 +74,7 @@ batch_3 = [
         {"sensorIdGroup": 3, "humidity": 55, "timestamp": "2024-11-04T20:00:09.000"}
 ]
 
-def send_batch(batch):
+def send_batch(producer, batch):
     for record in batch:
         if "temperature" in record:
             topic = TEMPERATURE_TOPIC
@@ -59,25 +82,248 @@ def send_batch(batch):
             topic = HUMIDITY_TOPIC
         else:
             continue  # Skip if neither temperature nor humidity is present
-        
+
         # Convert record to JSON format
         producer.produce(topic, value=json.dumps(record), callback=acked)
         print(f"Sent to {topic}: {record}")
-        
+
     # Wait for all messages in the batch to be sent
     producer.flush()
 
-# Send the first batch
-send_batch(batch_1)
 
-# Wait 5 seconds before sending the second batch
-time.sleep(5)
+def run_demo(producer):
+    # Send the first batch
+    send_batch(producer, batch_1)
+
+    # Wait 5 seconds before sending the second batch
+    time.sleep(5)
+
+    # Send the second batch
+    send_batch(producer, batch_2)
+
+    # Wait 5 seconds before sending the third batch
+    time.sleep(5)
+
+    # Send the second batch
+    send_batch(producer, batch_3)
+
+
+def generate_file(path, records, sensors, start, interval_ms, seed=None):
+    """Writes an in-order NDJSON file of alternating temperature/humidity readings."""
+    rng = random.Random(seed)
+    timestamp = datetime.fromisoformat(start)
+    step = timedelta(milliseconds=interval_ms)
+    with open(path, 'w') as f:
+        for i in range(records):
+            sensor = rng.randint(1, sensors)
+            ts = timestamp.isoformat(timespec='milliseconds')
+            if i % 2:
+                f.write(f'{{"sensorIdGroup": {sensor}, "humidity": {rng.randint(0, 100)}, "timestamp": "{ts}"}}\n')
+            else:
+                f.write(f'{{"sensorIdGroup": {sensor}, "temperature": {rng.randint(-10, 40)}, "timestamp": "{ts}"}}\n')
+            timestamp += step
+    print(f"Wrote {records} records to {path}")
+
+
+def iter_lines(path):
+    """Yields the non-empty lines of a file through a read-only memory map."""
+    if os.path.getsize(path) == 0:
+        return  # An empty file cannot be memory mapped
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        if hasattr(mm, 'madvise') and hasattr(mmap, 'MADV_SEQUENTIAL'):
+            mm.madvise(mmap.MADV_SEQUENTIAL)
+        position, size = 0, len(mm)
+        while position < size:
+            end = mm.find(b'\n', position)
+            if end == -1:
+                end = size
+            line = mm[position:end].strip()
+            position = end + 1
+            if line:
+                yield line
+
+
+def route(line):
+    """Returns the topic for a raw record, by the reading it carries, or None."""
+    if b'"temperature"' in line:
+        return TEMPERATURE_TOPIC
+    if b'"humidity"' in line:
+        return HUMIDITY_TOPIC
+    return None
+
+
+def make_late(line, rng, mean_seconds, distribution):
+    """Moves a record's timestamp back so it arrives after records with later event times."""
+    if distribution == 'fixed':
+        lateness = mean_seconds
+    elif distribution == 'uniform':
+        lateness = rng.uniform(0, 2 * mean_seconds)
+    else:
+        lateness = rng.expovariate(1 / mean_seconds)
+    record = json.loads(line)
+    timestamp = datetime.fromisoformat(record['timestamp']) - timedelta(seconds=lateness)
+    record['timestamp'] = timestamp.isoformat(timespec='milliseconds')
+    return json.dumps(record).encode()
+
+
+def replay_records(args):
+    """Yields (topic, value) for every routable line, with lateness and reordering applied."""
+    rng = random.Random(args.seed)
+    window = []
+    for line in iter_lines(args.replay):
+        topic = route(line)
+        if topic is None:
+            continue
+        if args.late_fraction and rng.random() < args.late_fraction:
+            line = make_late(line, rng, args.late_mean, args.late_distribution)
+        if args.reorder_window <= 1:
+            yield topic, line
+            continue
+        # Emit a random record from the window, so no record moves more than the window size
+        window.append((topic, line))
+        if len(window) >= args.reorder_window:
+            index = rng.randrange(len(window))
+            window[index], window[-1] = window[-1], window[index]
+            yield window.pop()
+    rng.shuffle(window)
+    yield from window
+
+
+class DeliveryStats:
+    """Counts delivery results from the producer callback and prints them once per second."""
+
+    def __init__(self):
+        self.sent = 0
+        self.delivered = 0
+        self.failed = 0
+        self.last_error = None
+        self.start = time.perf_counter()
+        self.last_report = self.start
+        self.last_delivered = 0
+
+    def on_delivery(self, err, msg):
+        if err is not None:
+            self.failed += 1
+            self.last_error = err
+        else:
+            self.delivered += 1
+
+    def record_callback(self, parts):
+        """Returns a delivery callback for the `parts` chunks of one record.
+
+        The record counts once, when its last chunk is acknowledged, and as failed if any chunk failed.
+        """
+        if parts == 1:
+            return self.on_delivery
+        state = {'pending': parts, 'error': None}
+
+        def on_chunk_delivery(err, msg):
+            state['pending'] -= 1
+            state['error'] = state['error'] or err
+            if state['pending'] == 0:
+                self.on_delivery(state['error'], msg)
+        return on_chunk_delivery
+
+    def report(self, in_flight, force=False):
+        now = time.perf_counter()
+        if not force and now - self.last_report < 1:
+            return
+        rate = (self.delivered - self.last_delivered) / (now - self.last_report)
+        line = (f"{now - self.start:6.1f}s sent={self.sent} delivered={self.delivered} ({rate:,.0f}/s) "
+                f"failed={self.failed} in_flight={in_flight}")
+        if self.last_error is not None:
+            line += f" last_error={self.last_error}"
+            self.last_error = None
+        print(line)
+        self.last_report, self.last_delivered = now, self.delivered
+
+
+def run_replay(producer, args, chunker=None):
+    stats = DeliveryStats()
+    start = time.perf_counter()
+    for topic, value in replay_records(args):
+        if args.rate:
+            due = start + stats.sent / args.rate
+            if due > time.perf_counter():
+                time.sleep(due - time.perf_counter())
+        records = [(None, value, None)] if chunker is None else chunker.prepare(value)
+        if producer is not None:
+            on_delivery = stats.record_callback(len(records))
+            for key, record, headers in records:
+                while True:
+                    try:
+                        producer.produce(topic, value=record, key=key, headers=headers, on_delivery=on_delivery)
+                        break
+                    except BufferError:
+                        producer.poll(0.05)  # Local queue is full: wait for deliveries to free space
+                    except KafkaException as e:
+                        # Rejected by the client (e.g. MSG_SIZE_TOO_LARGE): count it like a failed delivery
+                        on_delivery(e.args[0], None)
+                        break
+        else:
+            stats.delivered += 1  # --dry-run: measure reading, routing and reshuffling only
+        stats.sent += 1
+        if stats.sent % 1000 == 0:
+            if producer is not None:
+                producer.poll(0)
+            stats.report(len(producer) if producer is not None else 0)
+
+    if producer is not None:
+        producer.flush()
+    stats.report(0, force=True)
+    elapsed = time.perf_counter() - stats.start
+    print(f"Replayed {stats.sent} records in {elapsed:.1f}s ({stats.sent / elapsed:,.0f}/s), "
+          f"delivered={stats.delivered} failed={stats.failed}")
+    if chunker is not None:
+        report(chunker)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Send sensor readings to the temperature and humidity topics.')
+    parser.add_argument('--replay', help='NDJSON file of sensor records to stream instead of the demo batches.')
+    parser.add_argument('--generate', metavar='FILE', help='Write a synthetic NDJSON file for --replay and exit.')
+    parser.add_argument('--records', type=int, default=100000, help='Records to write with --generate. Defaults to 100000.')
+    parser.add_argument('--sensors', type=int, default=100, help='Sensor groups in --generate. Defaults to 100.')
+    parser.add_argument('--start', default='2024-11-04T20:00:00.000', help='First timestamp for --generate.')
+    parser.add_argument('--interval-ms', type=int, default=10, help='Milliseconds between generated records. Defaults to 10.')
+    parser.add_argument('--late-fraction', type=float, default=0.0, help='Share of replayed records to make late. Defaults to 0.')
+    parser.add_argument('--late-mean', type=float, default=5.0, help='Mean lateness in seconds. Defaults to 5.')
+    parser.add_argument('--late-distribution', choices=['exponential', 'uniform', 'fixed'], default='exponential',
+                        help='Distribution of the lateness. Defaults to exponential.')
+    parser.add_argument('--reorder-window', type=int, default=0,
+                        help='Shuffle records within a window of this many records (out-of-order delivery). Defaults to 0 (off).')
+    parser.add_argument('--rate', type=float, default=0, help='Maximum records per second. Defaults to 0 (as fast as possible).')
+    parser.add_argument('--seed', type=int, help='Random seed for --generate, lateness and reordering.')
+    parser.add_argument('--bootstrap-servers', help='Use these brokers without SASL (e.g. a local Kafka) instead of the Confluent Cloud settings above.')
+    parser.add_argument('--linger-ms', type=int, default=20, help='Producer linger.ms in replay mode. Defaults to 20.')
+    parser.add_argument('--compression', default='lz4', help='Producer compression.type in replay mode. Defaults to lz4.')
+    parser.add_argument('--dry-run', action='store_true', help='Replay without a Kafka producer to measure the reader alone.')
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    if args.generate:
+        generate_file(args.generate, args.records, args.sensors, args.start, args.interval_ms, args.seed)
+        return
+
+    producer_conf = {'bootstrap.servers': args.bootstrap_servers} if args.bootstrap_servers else dict(conf)
+    if not args.replay:
+        run_demo(Producer(producer_conf))
+        return
+    if os.path.getsize(args.replay) == 0:
+        print(f"{args.replay} is empty; nothing to replay.")
+        sys.exit(1)
 
-# Send the second batch
-send_batch(batch_2)
+    chunker = Chunker(args.max_message_bytes, args.compression) if args.max_message_bytes else None
+    producer = None
+    if not args.dry_run:
+        producer_conf.update({'linger.ms': args.linger_ms, 'compression.type': args.compression,
+                              'queue.buffering.max.messages': 500000})
+        if chunker is not None:
+            # librdkafka checks message.max.bytes before compressing
+            producer_conf['message.max.bytes'] = chunker.client_max_bytes
+        producer = Producer(producer_conf)
+    run_replay(producer, args, chunker)
 
-# Wait 5 seconds before sending the third batch
-time.sleep(5)
 
-# Send the second batch
-send_batch(batch_3)
+if __name__ == '__main__':
+    main()
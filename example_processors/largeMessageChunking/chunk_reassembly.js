@@ -0,0 +1,61 @@
+// Reassembles messages that kafka_chunking.py split into chunks, and writes whole and
+// reassembled documents to the same collection. Two processors read the topic: one for the
+// messages that were sent unchanged (no chunk headers), one for the chunks.
+
+// Headers are read the same way as in code_snippets/kafka_headers_readwrite.js
+s = {$source : {connectionName : "kafkaprod", topic : "largemessages",
+                config : {auto_offset_reset : "earliest"}}}
+h = {$addFields : {_chunk : {$arrayToObject : {$meta : "stream.source.headers"}}}}
+// Header names contain dots, so they are read with $getField rather than a field path
+f = {$addFields : {_chunked : {$ne : [{$type : {$getField : {field : "chunk.id", input : "$_chunk"}}}, "missing"]}}}
+
+m = {$merge : {into : {connectionName : "jsncluster0", db : "test", coll : "largemessages"}}}
+
+// Whole messages: anything without a chunk.id header passes straight through
+whole = [s, h, f,
+         {$match : {_chunked : false}},
+         {$unset : ["_chunk", "_chunked"]},
+         m]
+sp.createStreamProcessor("largemessages_whole", whole)
+
+// Chunks: decode the header values, then collect the chunks of one message in a session
+// window partitioned by chunk.id. The producer sends all chunks of a message back to back
+// to one partition, so a short gap is enough to collect all of them.
+c = {$project : {
+        part : 1,
+        id : {$convert : {input : {$getField : {field : "chunk.id", input : "$_chunk"}}, to : "string", format : "utf8"}},
+        index : {$toInt : {$convert : {input : {$getField : {field : "chunk.index", input : "$_chunk"}}, to : "string", format : "utf8"}}},
+        count : {$toInt : {$convert : {input : {$getField : {field : "chunk.count", input : "$_chunk"}}, to : "string", format : "utf8"}}},
+        size : {$toInt : {$convert : {input : {$getField : {field : "chunk.size", input : "$_chunk"}}, to : "string", format : "utf8"}}}
+}}
+
+w = {$sessionWindow : {
+      partitionBy : "$id",
+      gap : {unit : "second", size : 5},
+      boundary : "processingTime",
+      pipeline : [
+        {$group : {_id : "$id",
+                   count : {$first : "$count"},
+                   size : {$first : "$size"},
+                   parts : {$push : {index : "$index", part : "$part"}}}},
+        {$project : {count : 1, size : 1, received : {$size : "$parts"},
+                     json : {$reduce : {input : {$sortArray : {input : "$parts", sortBy : {index : 1}}},
+                                        initialValue : "",
+                                        in : {$concat : ["$$value", "$$this.part"]}}}}}
+      ]
+}}
+
+// A message with a missing chunk (or a duplicate) goes to the DLQ instead of being merged half built
+v = {$validate : {validator : {$expr : {$and : [{$eq : ["$received", "$count"]},
+                                                 {$eq : [{$strLenBytes : "$json"}, "$size"]}]}},
+                  validationAction : "dlq"}}
+
+// The joined text is the original JSON document
+p = {$replaceRoot : {newRoot : {$function : {body : "function(json) { return JSON.parse(json); }",
+                                             args : ["$json"],
+                                             lang : "js"}}}}
+
+chunks = [s, h, f,
+          {$match : {_chunked : true}},
+          c, w, v, p, m]
+sp.createStreamProcessor("largemessages_chunks", chunks, {dlq : {connectionName : "jsncluster0", db : "dlq", coll : "largemessages_chunks"}})
@@ -0,0 +1,150 @@
+import argparse
+import json
+import random
+import string
+import time
+import bson
+from kafka_chunking import Chunker, Reassembler, encoded_size
+
+# Compares two ways of handling messages that are larger than the topic accepts:
+#
+#   dlq    the producer sends every payload unchanged; the processor parses it, checks its size
+#          with $bsonSize (code_snippets/largeKafkaMessages.js) and writes oversized documents
+#          to the DLQ, so they cross the network twice and never reach the target collection
+#   chunk  the producer splits oversized payloads with kafka_chunking.py; the processor
+#          reassembles them (chunk_reassembly.js) and every document is delivered
+#
+# For a synthetic workload it reports, per strategy, the producer and processor-side cost per
+# message, the records and bytes sent to the broker, bytes written to the DLQ and documents
+# delivered. Processor work is approximated in Python (JSON parse plus BSON encode, and
+# reassembly for chunks), which ranks the strategies rather than predicting ASP's own numbers.
+#
+#   python3 chunking_bench.py --messages 20000 --oversized-fraction 0.01 --oversized-size 3000000
+#
+# With --bootstrap-servers the records are also produced to --topic on a real (e.g. local)
+# Kafka, so delivery throughput and broker-side rejections are measured too. For the dlq run
+# the topic's max.message.bytes has to allow the oversized payloads, as it would have to today.
+#
+# A message is oversized when its BSON size is over --max-message-bytes, the same check as
+# $bsonSize in the processor. Both strategies handle the same messages: dlq rejects them and
+# chunk splits them.
+
+
+def make_payload(rng, size):
+    """A JSON document of roughly `size` bytes with some nesting and escaping."""
+    text = "".join(rng.choices(string.ascii_letters + ' "\\', k=max(1, size // 2)))
+    return json.dumps({"id": rng.randrange(1 << 30), "tags": ["a", "b"], "body": text,
+                       "values": [rng.random() for _ in range(max(1, size // 80))]}).encode()
+
+
+def workload(args):
+    rng = random.Random(args.seed)
+    return [make_payload(rng, args.oversized_size if rng.random() < args.oversized_fraction else args.size)
+            for _ in range(args.messages)]
+
+
+def produce(producer, topic, records, stats):
+    def on_error(exc):
+        stats["rejected"] += 1
+
+    for key, value, headers in records:
+        future = producer.send(topic, key=key, value=value, headers=headers or None)
+        future.add_errback(on_error)
+
+
+def bson_size(payload):
+    return len(bson.encode(json.loads(payload)))
+
+
+def run_dlq(payloads, oversized, args, producer=None):
+    stats = {"records": 0, "broker_bytes": 0, "dlq_bytes": 0, "delivered": 0, "rejected": 0}
+    start = time.perf_counter()
+    for payload in payloads:
+        stats["records"] += 1
+        stats["broker_bytes"] += encoded_size(payload)
+        if producer is not None:
+            produce(producer, args.topic, [(None, payload, None)], stats)
+    if producer is not None:
+        producer.flush()
+    produced = time.perf_counter() - start
+
+    # Processor: parse, $bsonSize check, DLQ the oversized documents
+    start = time.perf_counter()
+    for payload in payloads:
+        document = bson.encode(json.loads(payload))
+        if len(document) > args.max_message_bytes:
+            stats["dlq_bytes"] += len(document)
+        else:
+            stats["delivered"] += 1
+    return produced, time.perf_counter() - start, stats
+
+
+def run_chunk(payloads, oversized, args, producer=None):
+    chunker = Chunker(args.max_message_bytes)
+    stats = {"records": 0, "broker_bytes": 0, "dlq_bytes": 0, "delivered": 0, "rejected": 0}
+    sent = []
+    start = time.perf_counter()
+    for payload, too_large in zip(payloads, oversized):
+        records = chunker.split(payload) if too_large else [(None, payload, None)]
+        for key, value, headers in records:
+            stats["records"] += 1
+            stats["broker_bytes"] += encoded_size(value, key, headers)
+        if producer is not None:
+            produce(producer, args.topic, records, stats)
+        sent.extend(records)
+    if producer is not None:
+        producer.flush()
+    produced = time.perf_counter() - start
+
+    # Processor: reassemble chunks, then parse every complete document
+    reassembler = Reassembler()
+    start = time.perf_counter()
+    for _, value, headers in sent:
+        payload = reassembler.feed(value, headers)
+        if payload is not None:
+            bson.encode(json.loads(payload))
+            stats["delivered"] += 1
+    return produced, time.perf_counter() - start, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark DLQ rejection against producer-side chunking of large messages.")
+    parser.add_argument("--messages", type=int, default=20000, help="Messages in the workload. Defaults to 20000.")
+    parser.add_argument("--size", type=int, default=1000, help="Approximate size of a normal message in bytes. Defaults to 1000.")
+    parser.add_argument("--oversized-size", type=int, default=2000000,
+                        help="Approximate size of an oversized message in bytes. Defaults to 2000000.")
+    parser.add_argument("--oversized-fraction", type=float, default=0.01, help="Share of oversized messages. Defaults to 0.01.")
+    parser.add_argument("--max-message-bytes", type=int, default=1048588,
+                        help="Largest message the topic accepts. Defaults to 1048588 (the Kafka default).")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed for the workload. Defaults to 1.")
+    parser.add_argument("--bootstrap-servers", help="Also produce the records to this Kafka cluster.")
+    parser.add_argument("--topic", default="largemessages", help="Topic for --bootstrap-servers. Defaults to largemessages.")
+    args = parser.parse_args()
+
+    payloads = workload(args)
+    oversized = [bson_size(payload) > args.max_message_bytes for payload in payloads]
+    print(f"Workload: {len(payloads)} messages, {sum(oversized)} over {args.max_message_bytes:,} BSON bytes, "
+          f"{sum(map(len, payloads)):,} bytes in total")
+
+    producer = None
+    if args.bootstrap_servers:
+        from kafka import KafkaProducer
+        # The client-side limit is raised so oversized records reach the broker, which decides
+        producer = KafkaProducer(bootstrap_servers=args.bootstrap_servers.split(","), linger_ms=10,
+                                 max_request_size=max(args.oversized_size * 2, args.max_message_bytes))
+
+    print("-------------------------------------------------")
+    print(f"{'Strategy':<9} {'Produce us/msg':>15} {'Process us/msg':>15} {'Records':>9} {'Broker MB':>10} "
+          f"{'DLQ MB':>8} {'Delivered':>10} {'Rejected':>9} {'End-to-end msg/s':>17}")
+    for name, run in (("dlq", run_dlq), ("chunk", run_chunk)):
+        produced, processed, stats = run(payloads, oversized, args, producer)
+        print(f"{name:<9} {produced / len(payloads) * 1e6:>15.1f} {processed / len(payloads) * 1e6:>15.1f} "
+              f"{stats['records']:>9} {stats['broker_bytes'] / 1e6:>10.1f} {stats['dlq_bytes'] / 1e6:>8.1f} "
+              f"{stats['delivered']:>10} {stats['rejected']:>9} "
+              f"{stats['delivered'] / (produced + processed):>17,.0f}")
+    if producer is not None:
+        producer.close()
+
+
+if __name__ == "__main__":
+    main()
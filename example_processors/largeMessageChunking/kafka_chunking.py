@@ -0,0 +1,178 @@
+import json
+import uuid
+import zlib
+
+# Producer-side guard for Kafka messages that are too large for the topic, used by the
+# example producers (racer_data_gen.py, sensorGenerator.py, packet_capture.py) with
+# --max-message-bytes.
+#
+# code_snippets/largeKafkaMessages.js rejects oversized documents in the processor with a
+# $bsonSize validator, after they have crossed the network and been parsed. Here each
+# payload is checked before it is sent:
+#
+#   * it fits                  -> sent unchanged, without headers (a length check only)
+#   * it fits once compressed  -> sent unchanged, when the producer compresses with a codec
+#                                 (brokers check the compressed batch against max.message.bytes)
+#                                 and it is at most MAX_COMPRESSION_RATIO times the limit
+#   * otherwise                -> split into sequenced chunks that each fit
+#
+# A chunk is a JSON document {"part": "<slice of the original JSON text>"} with the chunk
+# metadata in Kafka headers, written as UTF-8 strings the way kafka_headers_readwrite.js
+# reads them back ($arrayToObject of stream.source.headers, then $convert to string):
+#
+#   chunk.id     id shared by all chunks of one message (also used as the message key, so
+#                the chunks land in one partition in order)
+#   chunk.index  0-based position of the chunk
+#   chunk.count  number of chunks
+#   chunk.size   size in bytes of the original payload
+#
+# chunk_reassembly.js rebuilds the documents in ASP; Reassembler does the same in Python.
+
+HEADER_ID = "chunk.id"
+HEADER_INDEX = "chunk.index"
+HEADER_COUNT = "chunk.count"
+HEADER_SIZE = "chunk.size"
+
+# Bytes a record adds on top of its key, value and headers in a v2 record batch (varint
+# lengths, attributes, offset and timestamp deltas), plus a share of the batch header.
+RECORD_OVERHEAD = 32
+
+# Compression is estimated with zlib; codecs other than gzip compress less, so their
+# estimate must leave this much room.
+CODEC_MARGIN = {"gzip": 1.0, "zstd": 0.9, "lz4": 0.7, "snappy": 0.7}
+
+# The client checks a record against its own limit before compressing it, so a payload sent
+# whole because it compresses has to fit that limit uncompressed. The producers raise their
+# limit to Chunker.client_max_bytes, and larger payloads are chunked however well they compress.
+MAX_COMPRESSION_RATIO = 8
+
+
+def encoded_size(value, key=None, headers=None):
+    """Size of a Kafka record with this key, value and headers, in bytes (no copies are made)."""
+    size = RECORD_OVERHEAD + len(value) + (len(key) if key else 0)
+    for name, header_value in headers or ():
+        size += len(name) + len(header_value) + 2
+    return size
+
+
+def utf8_boundary(data, position):
+    """Moves a cut position back so it does not split a multi-byte UTF-8 character."""
+    while 0 < position < len(data) and data[position] & 0xC0 == 0x80:
+        position -= 1
+    return position
+
+
+class Chunker:
+    """Prepares payloads for a producer so that no record exceeds max_bytes.
+
+    Args:
+        max_bytes: Largest record the topic accepts (the topic's max.message.bytes).
+        compression: The producer's compression codec, or None. With a codec, an oversized
+            payload that compresses below max_bytes is sent whole. The client's own limit
+            (max_request_size in kafka-python, message.max.bytes in librdkafka) is checked
+            before compression and has to be set to client_max_bytes.
+    """
+
+    def __init__(self, max_bytes, compression=None):
+        self.max_bytes = max_bytes
+        self.compression = compression if compression in CODEC_MARGIN else None
+        self.client_max_bytes = max_bytes * MAX_COMPRESSION_RATIO if self.compression else max_bytes
+        self.counts = {"passed": 0, "compressed": 0, "chunked": 0, "chunks": 0, "bytes_in": 0, "bytes_out": 0}
+
+    def prepare(self, value, key=None):
+        """Returns a list of (key, value, headers) records to send for one payload.
+
+        `value` is the encoded payload (UTF-8 JSON bytes); headers is None for unchanged payloads.
+        """
+        self.counts["bytes_in"] += len(value)
+        if encoded_size(value, key) <= self.max_bytes:
+            self.counts["passed"] += 1
+            self.counts["bytes_out"] += len(value)
+            return [(key, value, None)]
+
+        if self.compression and encoded_size(value, key) <= self.client_max_bytes:
+            estimate = len(zlib.compress(value, 6)) / CODEC_MARGIN[self.compression]
+            if RECORD_OVERHEAD + estimate <= self.max_bytes:
+                self.counts["compressed"] += 1
+                self.counts["bytes_out"] += len(value)
+                return [(key, value, None)]
+
+        records = self.split(value)
+        self.counts["chunked"] += 1
+        self.counts["chunks"] += len(records)
+        self.counts["bytes_out"] += sum(len(record[1]) for record in records)
+        return records
+
+    def split(self, value):
+        chunk_id = uuid.uuid4().hex
+        key = chunk_id.encode()
+        size = str(len(value)).encode()
+        # Headers are sized with the widest index so every chunk gets the same budget
+        widest = [(HEADER_ID, key), (HEADER_INDEX, size), (HEADER_COUNT, size), (HEADER_SIZE, size)]
+        budget = self.max_bytes - encoded_size(b'{"part": ""}', key, widest)
+        if budget <= 0:
+            raise ValueError(f"max_bytes={self.max_bytes} leaves no room for a chunk")
+
+        parts = []
+        position = 0
+        while position < len(value):
+            end = utf8_boundary(value, min(position + budget, len(value)))
+            while True:
+                part = json.dumps({"part": value[position:end].decode("utf-8")}, ensure_ascii=False).encode("utf-8")
+                excess = len(part) - len(b'{"part": ""}') - budget
+                if excess <= 0:
+                    break
+                # Escaped quotes and backslashes made the slice longer than the budget
+                end = utf8_boundary(value, end - excess)
+                if end <= position:
+                    raise ValueError(f"max_bytes={self.max_bytes} is too small for the escaped payload")
+            parts.append(part)
+            position = end
+
+        return [(key, part, [(HEADER_ID, key), (HEADER_INDEX, str(index).encode()),
+                             (HEADER_COUNT, str(len(parts)).encode()), (HEADER_SIZE, size)])
+                for index, part in enumerate(parts)]
+
+
+def header_dict(headers):
+    return {name: header_value.decode("utf-8") for name, header_value in headers or ()}
+
+
+class Reassembler:
+    """Rebuilds chunked payloads on the consumer side.
+
+    feed() returns the complete payload once all chunks of a message have arrived (or the
+    value itself for messages that were not chunked), and None while chunks are missing.
+    """
+
+    def __init__(self):
+        self.pending = {}
+
+    def feed(self, value, headers=None):
+        meta = header_dict(headers)
+        if HEADER_ID not in meta:
+            return value
+        parts = self.pending.setdefault(meta[HEADER_ID], {})
+        parts[int(meta[HEADER_INDEX])] = json.loads(value)["part"]
+        if len(parts) < int(meta[HEADER_COUNT]):
+            return None
+        del self.pending[meta[HEADER_ID]]
+        payload = "".join(parts[index] for index in range(len(parts))).encode("utf-8")
+        if len(payload) != int(meta[HEADER_SIZE]):
+            raise ValueError(f"chunked message {meta[HEADER_ID]} reassembled to {len(payload)} bytes, "
+                             f"expected {meta[HEADER_SIZE]}")
+        return payload
+
+
+def add_arguments(parser):
+    """Adds the --max-message-bytes option the example producers share."""
+    parser.add_argument("--max-message-bytes", type=int, default=0,
+                        help="Split messages larger than this into chunks (see largeMessageChunking). Defaults to 0 (off).")
+
+
+def report(*chunkers):
+    """Prints the combined counts of one or more chunkers (e.g. one per producer thread)."""
+    counts = {name: sum(chunker.counts[name] for chunker in chunkers) for name in chunkers[0].counts}
+    print(f"Large messages: passed={counts['passed']} compressed={counts['compressed']} "
+          f"chunked={counts['chunked']} into {counts['chunks']} chunks, "
+          f"{counts['bytes_in']:,} bytes in, {counts['bytes_out']:,} bytes out")
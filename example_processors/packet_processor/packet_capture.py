@@ -1,47 +1,296 @@
 import argparse
+import os
+import queue
+import socket
+import struct
+import sys
+import threading
 from kafka import KafkaProducer
-from scapy.all import *
+from scapy.all import RawPcapReader, conf
 import time
-import json
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'largeMessageChunking'))
+from kafka_chunking import Chunker, add_arguments, report
+
+# Captures TCP packets and publishes (src_ip, src_port, dst_ip, dst_port, timestamp) records
+# to Kafka for packet_processor.data.
+#
+# The capture path is built to keep up with busy links:
+#   * the "ip and tcp" BPF filter runs in the kernel, so other traffic never reaches Python
+#   * frames are read raw and the five fields are unpacked with struct at fixed offsets,
+#     instead of dissecting every packet into scapy layers
+#   * full batches go onto a bounded queue; if the producer falls behind, whole batches are
+#     dropped and counted instead of stalling the capture
+#   * a producer thread encodes batches with a fixed record template and sends them
+#   * the producer is health-checked and only recreated if it lost its connection
+#   * with --max-message-bytes, json records larger than the topic accepts are split into
+#     chunks (see ../largeMessageChunking)
+#
+# Replay a pcap file instead of capturing live to benchmark without an interface, and omit
+# --bootstrap-servers to measure capture and encoding without Kafka:
+#   python3 packet_capture.py --pcap capture.pcap --topic packet_data_topic
 
 # parse command line arguments
 parser = argparse.ArgumentParser(description='Capture network packets and publish to Kafka')
-parser.add_argument('--bootstrap-servers', dest='bootstrap_servers', required=True,
-                    help='List of Kafka bootstrap servers (comma-separated)')
+parser.add_argument('--bootstrap-servers', dest='bootstrap_servers',
+                    help='List of Kafka bootstrap servers (comma-separated). If omitted, records are encoded but not sent.')
 parser.add_argument('--topic', dest='topic', required=True, help='Name of the Kafka topic to publish to')
-parser.add_argument('--device', dest='device', required=True, help='Name of the network device to capture on')
-parser.add_argument('--producer-interval', dest='producer_interval', type=int, default=600,
-                    help='Interval in seconds to recreate the Kafka producer')
+parser.add_argument('--device', dest='device', help='Name of the network device to capture on')
+parser.add_argument('--pcap', dest='pcap', help='Replay packets from this pcap file instead of capturing from --device')
+parser.add_argument('--producer-interval', dest='producer_interval', type=int, default=30,
+                    help='Interval in seconds between Kafka producer health checks')
+parser.add_argument('--batch-size', dest='batch_size', type=int, default=500,
+                    help='Packets per batch handed from the capture to the producer thread')
+parser.add_argument('--queue-batches', dest='queue_batches', type=int, default=200,
+                    help='Maximum number of batches waiting for the producer before new batches are dropped')
+parser.add_argument('--flush-interval', dest='flush_interval', type=float, default=1.0,
+                    help='Seconds after which a partial batch is handed to the producer anyway')
+parser.add_argument('--encoding', choices=['json', 'binary'], default='json',
+                    help='json (what the ASP $source in packet_processor.data expects) or a fixed 20 byte binary record')
+parser.add_argument('--report-interval', dest='report_interval', type=float, default=10,
+                    help='Seconds between counter reports')
+add_arguments(parser)
 args = parser.parse_args()
+if not args.device and not args.pcap:
+    parser.error('one of --device or --pcap is required')
+if args.max_message_bytes and args.encoding == 'binary':
+    parser.error('--max-message-bytes only applies to json records')
+
+# Records are rendered from a fixed template instead of building a dict and calling json.dumps
+RECORD_JSON = '{"src_ip": "%s", "src_port": %d, "dst_ip": "%s", "dst_port": %d, "timestamp": %r}'
+# Binary layout: src ip (4 bytes), src port, dst ip (4 bytes), dst port, timestamp (float64), network byte order
+RECORD_BINARY = struct.Struct('!4sH4sHd')
+
+
+ETHERTYPE_IPV4 = 0x0800
+ETHERTYPE_VLAN = 0x8100
+IPPROTO_TCP = 6
+PORTS = struct.Struct('!HH')
+
+
+def parse_frame(frame, timestamp):
+    """Returns (src_ip, src_port, dst_ip, dst_port, timestamp) for an Ethernet IPv4 TCP frame, else None.
+
+    IP addresses are kept as 4 raw bytes; they are only converted when a batch is encoded.
+    """
+    if len(frame) < 38:  # Too short for Ethernet + IPv4 + TCP ports
+        return None
+    offset = 12
+    ethertype = (frame[offset] << 8) | frame[offset + 1]
+    if ethertype == ETHERTYPE_VLAN:  # Skip one 802.1Q tag
+        offset += 4
+        ethertype = (frame[offset] << 8) | frame[offset + 1]
+    offset += 2
+    if ethertype != ETHERTYPE_IPV4 or len(frame) < offset + 20 or frame[offset + 9] != IPPROTO_TCP:
+        return None
+    # Later fragments of a datagram carry payload where the ports would be
+    if ((frame[offset + 6] & 0x1F) << 8) | frame[offset + 7]:
+        return None
+    header_length = (frame[offset] & 0x0F) * 4  # More than 20 bytes with IP options
+    if header_length < 20 or len(frame) < offset + header_length + 4:
+        return None
+    src_port, dst_port = PORTS.unpack_from(frame, offset + header_length)
+    return frame[offset + 12:offset + 16], src_port, frame[offset + 16:offset + 20], dst_port, timestamp
+
+
+def encode_json(records):
+    return [(RECORD_JSON % (socket.inet_ntoa(src_ip), src_port, socket.inet_ntoa(dst_ip), dst_port, ts)).encode('ascii')
+            for src_ip, src_port, dst_ip, dst_port, ts in records]
+
+
+def encode_binary(records):
+    return [RECORD_BINARY.pack(*record) for record in records]
+
+
+class Counters:
+    """Thread-safe captured/dropped/sent/failed counters."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = {'captured': 0, 'dropped': 0, 'sent': 0, 'failed': 0}
+
+    def add(self, key, amount=1):
+        with self.lock:
+            self.values[key] += amount
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.values)
+
+
+counters = Counters()
+chunker = Chunker(args.max_message_bytes) if args.max_message_bytes else None
+batches = queue.Queue(maxsize=args.queue_batches)
+batch_lock = threading.Lock()
+current_batch = []
+batch_started = time.monotonic()
+producer_failed = threading.Event()
+producer_error = []
+
+
+def hand_off_batch():
+    """Moves the current batch onto the queue, dropping it if the producer is too far behind.
+
+    A pcap replay waits for the producer instead, so it measures the full pipeline throughput.
+    """
+    global current_batch, batch_started
+    with batch_lock:
+        batch, current_batch = current_batch, []
+        batch_started = time.monotonic()
+    if not batch:
+        return
+    counters.add('captured', len(batch))
+    try:
+        batches.put(batch, block=bool(args.pcap))
+    except queue.Full:
+        counters.add('dropped', len(batch))
+
+
+class ProducerFailed(Exception):
+    pass
+
+
+def handle_packet(frame, timestamp):
+    if producer_failed.is_set():
+        raise ProducerFailed()
+    record = parse_frame(frame, timestamp)
+    if record is None:
+        return
+    with batch_lock:
+        current_batch.append(record)
+        full = len(current_batch) >= args.batch_size
+    if full:
+        hand_off_batch()
+
+
+def replay_pcap(path):
+    """Feeds every frame of a pcap file through the capture path as fast as possible."""
+    for frame, metadata in RawPcapReader(path):
+        if hasattr(metadata, 'sec'):
+            timestamp = metadata.sec + metadata.usec / 1e6
+        else:  # pcapng
+            timestamp = ((metadata.tshigh << 32) | metadata.tslow) / metadata.tsresol
+        handle_packet(frame, timestamp)
+
+
+def capture_live(device):
+    """Reads raw frames from the device; the BPF filter drops non-TCP traffic in the kernel."""
+    sock = conf.L2listen(iface=device, filter='ip and tcp')
+    try:
+        while True:
+            _, frame, timestamp = sock.recv_raw()
+            if frame:
+                handle_packet(frame, timestamp or time.time())
+    finally:
+        sock.close()
+
 
 # define a function to create a Kafka producer
 def create_producer():
-    return KafkaProducer(bootstrap_servers=args.bootstrap_servers.split(','))
+    if not args.bootstrap_servers:
+        return None
+    return KafkaProducer(bootstrap_servers=args.bootstrap_servers.split(','), linger_ms=5,
+                         max_request_size=chunker.client_max_bytes if chunker else 1048576)
 
-# start sniffing for packets and publish to Kafka
-producer = create_producer()
-last_producer_time = time.time()
-sniff_count = 0
 
-def handle_packet(packet):
-    global producer, last_producer_time, sniff_count
-    if not TCP in packet:
-        return
-    sniff_count += 1
-    packet_data = {
-        'src_ip': packet[IP].src,
-        'src_port': packet[TCP].sport,
-        'dst_ip': packet[IP].dst,
-        'dst_port': packet[TCP].dport,
-        'timestamp': packet.time
-    }
-    producer.send(args.topic, json.dumps(packet_data).encode('utf-8'))
-
-    if time.time() - last_producer_time >= args.producer_interval:
+def producer_loop():
+    """Runs send_batches; if it fails, stops the capture and drains the queue so shutdown cannot block."""
+    try:
+        send_batches()
+    except Exception as e:
+        producer_error.append(e)
+        producer_failed.set()
+        while True:
+            batch = batches.get()
+            if batch is None:
+                break
+            counters.add('failed', len(batch))
+
+
+def send_batches():
+    """Encodes and sends queued batches until a None batch arrives."""
+    encode = encode_binary if args.encoding == 'binary' else encode_json
+    producer = create_producer()
+    last_health_check = time.monotonic()
+
+    def on_error(exc):
+        counters.add('failed')
+
+    while True:
+        batch = batches.get()
+        if batch is None:
+            break
+        payloads = encode(batch)
+        if producer is None:
+            counters.add('sent', len(payloads))
+        elif chunker is None:
+            for payload in payloads:
+                future = producer.send(args.topic, payload)
+                future.add_callback(lambda _: counters.add('sent'))
+                future.add_errback(on_error)
+        else:
+            for payload in payloads:
+                for key, value, headers in chunker.prepare(payload):
+                    future = producer.send(args.topic, key=key, value=value, headers=headers)
+                    future.add_callback(lambda _: counters.add('sent'))
+                    future.add_errback(on_error)
+
+        # Replace the producer only if it lost its connection, instead of on a fixed schedule
+        if producer is not None and time.monotonic() - last_health_check >= args.producer_interval:
+            last_health_check = time.monotonic()
+            if not producer.bootstrap_connected():
+                print('Kafka producer lost its connection, recreating it')
+                producer.close(timeout=5)
+                producer = create_producer()
+
+    if producer is not None:
+        producer.flush()
         producer.close()
-        producer = create_producer()
-        last_producer_time = time.time()
-        print(f'Recreated Kafka producer after sniffing {sniff_count} packets')
 
-sniff(iface=args.device, prn=handle_packet, store=0)
 
+def report_loop(stop):
+    """Flushes idle partial batches and prints the counters every report interval."""
+    last_report = time.monotonic()
+    last_values = counters.snapshot()
+    while not stop.wait(min(args.flush_interval, args.report_interval)):
+        if time.monotonic() - batch_started >= args.flush_interval:
+            hand_off_batch()
+        if time.monotonic() - last_report >= args.report_interval:
+            values = counters.snapshot()
+            elapsed = time.monotonic() - last_report
+            rates = {key: (values[key] - last_values[key]) / elapsed for key in values}
+            print(f"captured={values['captured']} ({rates['captured']:,.0f}/s) dropped={values['dropped']} "
+                  f"sent={values['sent']} ({rates['sent']:,.0f}/s) failed={values['failed']} queued={batches.qsize()}")
+            last_report, last_values = time.monotonic(), values
+
+
+# start the producer and reporter threads, then capture
+stop_reporting = threading.Event()
+producer_thread = threading.Thread(target=producer_loop)
+reporter_thread = threading.Thread(target=report_loop, args=(stop_reporting,), daemon=True)
+producer_thread.start()
+reporter_thread.start()
+start = time.monotonic()
+
+try:
+    if args.pcap:
+        replay_pcap(args.pcap)
+    else:
+        capture_live(args.device)
+except (KeyboardInterrupt, ProducerFailed):
+    pass
+finally:
+    hand_off_batch()
+    batches.put(None)  # Blocks until the producer has room, so no captured batch is lost at shutdown
+    producer_thread.join()
+    stop_reporting.set()
+
+elapsed = time.monotonic() - start
+values = counters.snapshot()
+print(f"Done in {elapsed:.1f}s: captured={values['captured']} ({values['captured'] / elapsed:,.0f}/s) "
+      f"dropped={values['dropped']} sent={values['sent']} failed={values['failed']}")
+if chunker is not None:
+    report(chunker)
+if producer_error:
+    print(f"Capture stopped because the Kafka producer failed: {producer_error[0]!r}")
+    sys.exit(1)
@@ -1,9 +1,29 @@
+import argparse
+import os
 import random
+import sys
+import threading
 import time
 import json
 from datetime import datetime
 from kafka import KafkaProducer
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "largeMessageChunking"))
+from kafka_chunking import Chunker, add_arguments, report
+
+# Generates race car events into the thunderhead_race Kafka topic for race_processor.data.
+#
+# Without arguments it runs the original demo: five racers, one event every 0.5-1.0 s.
+# With --load it becomes a rate-controlled load generator for sizing tiers:
+#
+#   python3 racer_data_gen.py --load --rate 50000 --producers 4 --racers 500 \
+#       --linger-ms 20 --batch-size 262144 --compression lz4 --duration 120
+#
+# Load mode paces all producer threads with one shared token bucket, serializes events
+# from pre-encoded per-racer byte templates (no json.dumps on the hot path) and prints
+# the delivered rate plus an ack-latency histogram at the end. --max-message-bytes splits
+# events larger than the topic accepts into chunks (see ../largeMessageChunking).
+
 class Racer:
     def __init__(self, name, number):
         self.name = name
@@ -30,21 +50,168 @@ class Racer:
             "timestamp": self.time,
         }
 
-racers = [
-    Racer("Go Mifune", 5),
-    Racer("Captain Terror", 11),
-    Racer("Snake Oiler", 12),
-    Racer("Race X", 9),
-    Racer("Pace Car", 0),
-]
-
-producer = KafkaProducer(bootstrap_servers=["localhost:9092"],
-                         value_serializer=lambda m: json.dumps(m).encode('ascii'))
-
-while True:
-    for racer in racers:
-        racer.move()
-        event = racer.get_status()
-        producer.send("thunderhead_race", value=event)
-        print(json.dumps(event))
-        time.sleep(random.uniform(0.5, 1.0))
+
+def event_template(racer):
+    """Returns a bytes template that renders exactly like json.dumps(racer.get_status()).
+
+    Name and number never change, so they are encoded once; only lap, corner and
+    timestamp are filled in per event with bytes %-formatting.
+    """
+    prefix = json.dumps({"Racer_Num": racer.number, "Racer_Name": racer.name})[:-1].replace("%", "%%")
+    return prefix.encode("ascii") + b', "lap": %d, "Corner_Num": %d, "timestamp": "%b"}'
+
+
+class TokenBucket:
+    """Thread-safe token bucket. take(n) blocks until n tokens are available."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = burst
+        self.updated = time.perf_counter()
+        self.lock = threading.Lock()
+
+    def take(self, n):
+        while True:
+            with self.lock:
+                now = time.perf_counter()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= n:
+                    self.tokens -= n
+                    return
+                wait = (n - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class AckStats:
+    """Counts delivered/failed messages and buckets ack latency into powers of two milliseconds."""
+
+    BUCKETS_MS = [1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 2048]
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.delivered = 0
+        self.failed = 0
+        self.histogram = [0] * (len(self.BUCKETS_MS) + 1)
+
+    def ack(self, sent_at):
+        latency_ms = (time.perf_counter() - sent_at) * 1000
+        bucket = next((i for i, upper in enumerate(self.BUCKETS_MS) if latency_ms < upper), len(self.BUCKETS_MS))
+        with self.lock:
+            self.delivered += 1
+            self.histogram[bucket] += 1
+
+    def error(self, exc):
+        with self.lock:
+            self.failed += 1
+
+    def report(self, elapsed, target_rate):
+        print("-------------------------------------------------")
+        print(f"Delivered {self.delivered} messages in {elapsed:.1f}s: "
+              f"{self.delivered / elapsed:,.0f} msg/sec (target {target_rate:,.0f}), failed={self.failed}")
+        print("Ack latency histogram:")
+        lower = 0
+        for upper, count in zip(self.BUCKETS_MS + [None], self.histogram):
+            label = f"{lower:>5}-{upper:<5} ms" if upper else f"{lower:>5}+      ms"
+            share = count / self.delivered * 100 if self.delivered else 0
+            print(f"  {label} {count:>10} {share:5.1f}% {'#' * int(share / 2)}")
+            lower = upper
+
+
+def producer_worker(args, racers, bucket, stats, deadline, chunker=None, chunk=100):
+    """Sends events for a slice of the racers until the deadline, paced by the shared bucket."""
+    producer = KafkaProducer(bootstrap_servers=args.bootstrap_servers.split(","),
+                             linger_ms=args.linger_ms,
+                             batch_size=args.batch_size,
+                             compression_type=args.compression,
+                             acks=args.acks,
+                             # max_request_size is checked before compression
+                             max_request_size=chunker.client_max_bytes if chunker else 1048576)
+    templates = [event_template(racer) for racer in racers]
+    index = 0
+    while time.perf_counter() < deadline:
+        # Take tokens in chunks to keep lock traffic low at high rates
+        bucket.take(chunk)
+        for _ in range(chunk):
+            racer, template = racers[index], templates[index]
+            index = (index + 1) % len(racers)
+            racer.move()
+            payload = template % (racer.lap, racer.corner, racer.time.encode("ascii"))
+            sent_at = time.perf_counter()
+            records = [(None, payload, None)] if chunker is None else chunker.prepare(payload)
+            for key, value, headers in records:
+                future = producer.send(args.topic, key=key, value=value, headers=headers)
+            # One event per ack: the chunks share a key and partition, so the last one is acked last
+            future.add_callback(lambda _, sent_at=sent_at: stats.ack(sent_at))
+            future.add_errback(stats.error)
+    producer.flush()
+    producer.close()
+
+
+def run_load(args):
+    racers = [Racer(name, number) for name, number in [
+        ("Go Mifune", 5), ("Captain Terror", 11), ("Snake Oiler", 12), ("Race X", 9), ("Pace Car", 0)
+    ]][:args.racers]
+    racers += [Racer(f"Racer {number}", number) for number in range(100, 100 + args.racers - len(racers))]
+
+    bucket = TokenBucket(args.rate, burst=max(100, args.rate / 10))
+    stats = AckStats()
+    start = time.perf_counter()
+    deadline = start + args.duration
+
+    # One chunker per thread, so their counters are not shared
+    chunkers = [Chunker(args.max_message_bytes, args.compression) if args.max_message_bytes else None
+                for _ in range(args.producers)]
+
+    # Each producer thread owns a disjoint slice of racers, so per-racer events stay in order
+    threads = [threading.Thread(target=producer_worker,
+                                args=(args, racers[i::args.producers], bucket, stats, deadline, chunkers[i]))
+               for i in range(args.producers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats.report(time.perf_counter() - start, args.rate)
+    if args.max_message_bytes:
+        report(*chunkers)
+
+
+parser = argparse.ArgumentParser(description="Generate race car events into Kafka.")
+parser.add_argument("--bootstrap-servers", default="localhost:9092", help="Comma-separated Kafka bootstrap servers.")
+parser.add_argument("--topic", default="thunderhead_race", help="Topic to produce to.")
+parser.add_argument("--load", action="store_true", help="Run the rate-controlled load generator instead of the demo loop.")
+parser.add_argument("--rate", type=float, default=10000, help="Target messages/sec in load mode.")
+parser.add_argument("--producers", type=int, default=2, help="Producer threads in load mode, each with its own KafkaProducer.")
+parser.add_argument("--racers", type=int, default=200, help="Number of racers in load mode (at least --producers).")
+parser.add_argument("--duration", type=float, default=60, help="Seconds to run in load mode.")
+parser.add_argument("--linger-ms", type=int, default=10, help="KafkaProducer linger_ms.")
+parser.add_argument("--batch-size", type=int, default=131072, help="KafkaProducer batch_size in bytes.")
+parser.add_argument("--compression", choices=["gzip", "snappy", "lz4", "zstd"], default=None, help="KafkaProducer compression_type.")
+parser.add_argument("--acks", default=1, type=lambda v: v if v == "all" else int(v), help="KafkaProducer acks (0, 1 or all).")
+add_arguments(parser)
+args = parser.parse_args()
+if args.load and not 1 <= args.producers <= args.racers:
+    parser.error("--producers must be at least 1 and at most --racers, so every producer thread has racers")
+
+if args.load:
+    run_load(args)
+else:
+    racers = [
+        Racer("Go Mifune", 5),
+        Racer("Captain Terror", 11),
+        Racer("Snake Oiler", 12),
+        Racer("Race X", 9),
+        Racer("Pace Car", 0),
+    ]
+
+    producer = KafkaProducer(bootstrap_servers=args.bootstrap_servers.split(","),
+                             value_serializer=lambda m: json.dumps(m).encode('ascii'))
+
+    while True:
+        for racer in racers:
+            racer.move()
+            event = racer.get_status()
+            producer.send(args.topic, value=event)
+            print(json.dumps(event))
+            time.sleep(random.uniform(0.5, 1.0))
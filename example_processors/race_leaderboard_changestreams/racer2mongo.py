@@ -1,8 +1,10 @@
+import argparse
 import random
 import time
 import json
 from datetime import datetime
 from pymongo import MongoClient
+from racer_load import add_load_arguments, make_racers, run_load
 
 class Racer:
     def __init__(self, name, number):
@@ -28,23 +30,32 @@ class Racer:
             "timestamp": self.time,
         }
 
-racers = [
-    Racer("Go Mifune", 5),
-    Racer("Captain Terror", 11),
-    Racer("Snake Oiler", 12),
-    Racer("Race X", 9),
-    Racer("Pace Car", 0),
-]
+parser = add_load_arguments(argparse.ArgumentParser(description="Insert race events into MongoDB."))
+args = parser.parse_args()
 
 # Connect to MongoDB
-client = MongoClient('localhost', 27017)
+client = MongoClient(args.uri)
 db = client['test']
 collection = db['race_events_raw']
 
-while True:
-    for racer in racers:
-        racer.move()
-        event = racer.get_status()
-        collection.insert_one(event)  # Insert document into MongoDB
-        print(event)
-        time.sleep(random.uniform(0.5, 1.0))
+if args.load:
+    # Load mode: N racers, paced to --rate, written with unordered insert_many batches
+    run_load(make_racers(Racer, args.racers),
+             lambda batch: collection.insert_many(batch, ordered=False),
+             args.rate, args.batch_size, args.duration)
+else:
+    racers = [
+        Racer("Go Mifune", 5),
+        Racer("Captain Terror", 11),
+        Racer("Snake Oiler", 12),
+        Racer("Race X", 9),
+        Racer("Pace Car", 0),
+    ]
+
+    while True:
+        for racer in racers:
+            racer.move()
+            event = racer.get_status()
+            collection.insert_one(event)  # Insert document into MongoDB
+            print(event)
+            time.sleep(random.uniform(0.5, 1.0))
@@ -1,8 +1,10 @@
+import argparse
 import random
 import time
 import json
 from datetime import datetime
-from pymongo import MongoClient
+from pymongo import MongoClient, UpdateOne
+from racer_load import add_load_arguments, make_racers, run_load
 
 class Racer:
     def __init__(self, name, number):
@@ -28,28 +30,46 @@ class Racer:
             "timestamp": self.time,
         }
 
-racers = [
-    Racer("Go Mifune", 5),
-    Racer("Captain Terror", 11),
-    Racer("Snake Oiler", 12),
-    Racer("Race X", 9),
-    Racer("Pace Car", 0),
-]
+parser = add_load_arguments(argparse.ArgumentParser(description="Upsert race events into MongoDB."))
+args = parser.parse_args()
 
 # Connect to MongoDB
-client = MongoClient('localhost', 27017)
+client = MongoClient(args.uri)
 db = client['test']
 collection = db['race_events_raw']
 
-while True:
-    for racer in racers:
-        racer.move()
-        event = racer.get_status()
-        racer_num = event['Racer_Num']
-        collection.update_one(
-            {"Racer_Num": racer_num},
-            {"$set": event},
-            upsert=True
+if args.load:
+    # Lets each upsert find its racer without a collection scan. Not unique: racer2mongo.py inserts
+    # many events per Racer_Num into this same collection, and a single writer sends the batches
+    # one after another, so its upserts cannot race each other.
+    collection.create_index("Racer_Num")
+
+    def upsert_batch(batch):
+        collection.bulk_write(
+            [UpdateOne({"Racer_Num": event["Racer_Num"]}, {"$set": event}, upsert=True) for event in batch],
+            ordered=False
         )
-        print(event)
-        time.sleep(random.uniform(0.5, 1.0))
+
+    # Load mode: N racers, paced to --rate, written with unordered bulk_write upserts
+    run_load(make_racers(Racer, args.racers), upsert_batch, args.rate, args.batch_size, args.duration)
+else:
+    racers = [
+        Racer("Go Mifune", 5),
+        Racer("Captain Terror", 11),
+        Racer("Snake Oiler", 12),
+        Racer("Race X", 9),
+        Racer("Pace Car", 0),
+    ]
+
+    while True:
+        for racer in racers:
+            racer.move()
+            event = racer.get_status()
+            racer_num = event['Racer_Num']
+            collection.update_one(
+                {"Racer_Num": racer_num},
+                {"$set": event},
+                upsert=True
+            )
+            print(event)
+            time.sleep(random.uniform(0.5, 1.0))
@@ -0,0 +1,91 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "scripts"))
+from offline_helpers import percentile
+
+# Load mode shared by racer2mongo.py (insert_many) and racer2mongo_upsert.py (bulk_write upserts).
+#
+# Instead of five racers and a 0.5-1.0 s sleep per event, load mode drives N racers at a
+# target events/sec, writes them in unordered batches and reports the achieved throughput
+# and write latency percentiles. Use it to push the change stream processor in
+# race_processor_cs.data at production rates against a local mongod.
+
+FAMOUS_RACERS = [("Go Mifune", 5), ("Captain Terror", 11), ("Snake Oiler", 12), ("Race X", 9), ("Pace Car", 0)]
+
+
+def add_load_arguments(parser):
+    """Adds the load mode options to a script's argument parser."""
+    parser.add_argument("--uri", default="mongodb://localhost:27017", help="MongoDB connection string. Defaults to a local mongod.")
+    parser.add_argument("--load", action="store_true", help="Run in load mode instead of the slow demo loop.")
+    parser.add_argument("--racers", type=int, default=100, help="Number of racers in load mode. Defaults to 100.")
+    parser.add_argument("--rate", type=float, default=1000, help="Target events/sec in load mode. Defaults to 1000.")
+    parser.add_argument("--batch-size", type=int, default=100, help="Events per write in load mode. Defaults to 100.")
+    parser.add_argument("--duration", type=float, default=60, help="Seconds to run in load mode. Defaults to 60.")
+    return parser
+
+
+def make_racers(racer_class, count):
+    """Returns `count` racers: the five from the demo followed by numbered ones."""
+    racers = [racer_class(name, number) for name, number in FAMOUS_RACERS[:count]]
+    for number in range(100, 100 + count - len(racers)):
+        racers.append(racer_class(f"Racer {number}", number))
+    return racers
+
+
+def run_load(racers, write_batch, rate, batch_size, duration, report_every=5):
+    """Generates racer events at `rate` events/sec and hands them to `write_batch` in batches.
+
+    Racers are cycled in order, so as long as `batch_size` <= number of racers a batch
+    never contains two events for the same racer. That keeps unordered upserts safe:
+    there is no ordering to preserve within a batch.
+
+    Args:
+        racers: Racer objects to move.
+        write_batch: Callable that writes a list of event documents to MongoDB.
+        rate: Target events per second.
+        batch_size: Number of events per write call.
+        duration: Seconds to run for.
+        report_every: Seconds between progress lines.
+    """
+    latencies = []
+    sent = 0
+    racer_index = 0
+    start = time.perf_counter()
+    next_report = start + report_every
+
+    while time.perf_counter() - start < duration:
+        # Pace by schedule rather than by sleeping a fixed time, so write latency
+        # does not lower the achieved rate until the target is out of reach.
+        due = start + sent / rate
+        now = time.perf_counter()
+        if due > now:
+            time.sleep(due - now)
+
+        batch = []
+        for _ in range(batch_size):
+            racer = racers[racer_index]
+            racer_index = (racer_index + 1) % len(racers)
+            racer.move()
+            batch.append(racer.get_status())
+
+        write_start = time.perf_counter()
+        write_batch(batch)
+        latencies.append(time.perf_counter() - write_start)
+        sent += len(batch)
+
+        if time.perf_counter() >= next_report:
+            elapsed = time.perf_counter() - start
+            print(f"{elapsed:6.1f}s sent={sent} rate={sent / elapsed:,.0f} events/sec")
+            next_report += report_every
+
+    elapsed = time.perf_counter() - start
+    print("-------------------------------------------------")
+    print(f"Sent {sent} events in {elapsed:.1f}s: {sent / elapsed:,.0f} events/sec (target {rate:,.0f})")
+    if latencies:
+        print(f"Write latency per batch of {batch_size}: "
+              f"p50={percentile(latencies, 50) * 1000:.1f} ms "
+              f"p95={percentile(latencies, 95) * 1000:.1f} ms "
+              f"p99={percentile(latencies, 99) * 1000:.1f} ms "
+              f"max={max(latencies) * 1000:.1f} ms")
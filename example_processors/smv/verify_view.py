@@ -0,0 +1,299 @@
+import argparse
+import collections
+import datetime
+import itertools
+import json
+import os
+import random
+import sys
+import threading
+import time
+from bson import ObjectId, json_util
+from pymongo import MongoClient
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "scripts"))
+from offline_helpers import percentile
+
+# Load generator and verifier for the queue_stats streaming materialized view. It drives the
+# ticket lifecycle of activity/*.js at thousands of events/sec and measures how far and for how
+# long queue_stats drifts from the true open ticket count per priority.
+#
+# Writer threads open, respond to, escalate, resolve and delete tickets (templates and the
+# starting tickets come from data/tickets.json). Every ticket is owned by one writer, so each
+# writer knows the status and priority of its tickets and, once a write is acknowledged, applies
+# its effect to an in-memory ground truth. support_tickets is scanned only once, at start.
+#
+# Every acknowledged change creates a new truth version. The verifier polls queue_stats every
+# --poll-ms; when the view matches a truth version, that version and all earlier ones have
+# converged, and their convergence lag is the time from the write's acknowledgement to the poll.
+# A view state that matches no version is drift (for example half of an escalation applied, or
+# an event the pipeline does not handle). Counts can return to an earlier state, so a view can
+# match a version it has not actually reached yet; lags are then slightly understated.
+#
+# After --duration the writers stop and the verifier waits up to --settle-timeout for the view
+# to reach the final truth.
+#
+#   python3 verify_view.py --uri "mongodb+srv://<user>:<pass>@<cluster-host>/" --reset --copies 200
+#   (start the processor: sp.queue_stats_escalation.start())
+#   python3 verify_view.py --uri "mongodb+srv://<user>:<pass>@<cluster-host>/" --rate 3000 --duration 60
+
+PRIORITIES = ["P1", "P2", "P3"]
+ESCALATION = {"P3": "P2", "P2": "P1"}
+# Event mixes of activity/simple-activity.js and activity/escalation-activity.js
+MIXES = {
+    "simple": {"open": 37, "resolve": 27, "respond": 26, "delete": 10},
+    "escalation": {"open": 32, "resolve": 23, "respond": 23, "escalate": 13, "delete": 9},
+}
+RESPONSES = [
+    "I'm looking into this now and will update you shortly.",
+    "Can you share your cluster logs from the past hour?",
+    "I've escalated this to our infrastructure team.",
+]
+TICKETS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "tickets.json")
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name not in MIXES["escalation"]:
+            raise argparse.ArgumentTypeError(f"unknown event {name!r}; use {', '.join(MIXES['escalation'])}")
+        mix[name] = float(weight)
+    return mix
+
+
+def load_tickets():
+    with open(TICKETS_FILE, encoding="utf-8") as f:
+        return json_util.loads(f.read())
+
+
+def reset(db, tickets, copies):
+    """Recreates support_tickets with `copies` copies of data/tickets.json and seeds queue_stats (see seed.mongodb.js)."""
+    for name in ["support_tickets", "queue_stats", "queue_stats_dlq"]:
+        db.drop_collection(name)
+    db.create_collection("support_tickets", changeStreamPreAndPostImages={"enabled": True})
+    for _ in range(copies):
+        db.support_tickets.insert_many([dict(ticket) for ticket in tickets])
+    db.support_tickets.aggregate([
+        {"$match": {"status": "open"}},
+        {"$group": {"_id": "$priority", "open_count": {"$sum": 1}}},
+        {"$merge": {"into": "queue_stats", "whenMatched": "replace", "whenNotMatched": "insert"}},
+    ])
+    print(f"Loaded {copies * len(tickets)} tickets and seeded queue_stats. Start the processor now; "
+          f"do not restart one that already counted against the old collections.")
+
+
+class GroundTruth:
+    """Open tickets per priority, versioned by the time each change was acknowledged."""
+
+    def __init__(self, counts):
+        self.lock = threading.Lock()
+        self.counts = dict(counts)
+        self.pending = collections.deque()  # (acknowledged at, counts) not yet seen in the view
+        self.versions = 0
+
+    def apply(self, deltas):
+        with self.lock:
+            for priority, delta in deltas:
+                self.counts[priority] = self.counts.get(priority, 0) + delta
+            self.pending.append((time.perf_counter(), self.state()))
+            self.versions += 1
+
+    def state(self):
+        return tuple(self.counts.get(priority, 0) for priority in PRIORITIES)
+
+    def converge(self, view, at):
+        """Marks every version up to the newest one equal to `view` as converged; returns their lags."""
+        with self.lock:
+            for newest in range(len(self.pending) - 1, -1, -1):
+                if self.pending[newest][1] == view:
+                    return [at - self.pending.popleft()[0] for _ in range(newest + 1)]
+        return None
+
+
+def writer(index, db, args, truth, owned, stop, counts):
+    """Sends lifecycle events at this writer's share of --rate, updating the truth after each ack."""
+    rng = random.Random(None if args.seed is None else args.seed + index)
+    tickets = db.support_tickets
+    templates = load_tickets()
+    events, weights = zip(*args.mix.items())
+    rate = args.rate / args.writers
+    sent = 0
+    start = time.perf_counter()
+    while not stop.is_set():
+        if rate:
+            due = start + sent / rate
+            if due > time.perf_counter():
+                time.sleep(due - time.perf_counter())
+        sent += 1
+        event = rng.choices(events, weights)[0]
+        now = datetime.datetime.now(datetime.timezone.utc)
+
+        if event == "open" or not owned:
+            template = rng.choice(templates)
+            ticket = {"_id": ObjectId(), "status": "open", "priority": template["priority"], "created_at": now,
+                      "tags": template["tags"], "updates": [{"timestamp": now, "type": "customer_message",
+                                                             "author": f"user{rng.randrange(100, 1000)}@customer.com",
+                                                             "body": template["updates"][0]["body"]}]}
+            tickets.insert_one(ticket)
+            owned[ticket["_id"]] = ticket["priority"]
+            truth.apply([(ticket["priority"], 1)])
+            event = "open"
+        else:
+            # Like the activity scripts' findOne: the oldest open ticket, or for an escalation the
+            # oldest one that can still be escalated
+            ticket_id = next(iter(owned))
+            if event == "escalate":
+                ticket_id = next((t for t, p in itertools.islice(owned.items(), 16) if p in ESCALATION), ticket_id)
+            priority = owned[ticket_id]
+            if event == "resolve":
+                tickets.update_one({"_id": ticket_id}, {"$set": {"status": "resolved"}, "$push": {"updates": {
+                    "timestamp": now, "type": "status_change", "from": "open", "to": "resolved"}}})
+                del owned[ticket_id]
+                truth.apply([(priority, -1)])
+            elif event == "delete":
+                tickets.delete_one({"_id": ticket_id})
+                del owned[ticket_id]
+                truth.apply([(priority, -1)])
+            elif event == "escalate" and priority in ESCALATION:
+                tickets.update_one({"_id": ticket_id}, {"$set": {"priority": ESCALATION[priority]}, "$push": {"updates": {
+                    "timestamp": now, "type": "escalation", "from": priority, "to": ESCALATION[priority]}}})
+                owned[ticket_id] = ESCALATION[priority]
+                truth.apply([(priority, -1), (ESCALATION[priority], 1)])
+            else:
+                # A response, or an escalation of a P1 ticket: noise either way
+                tickets.update_one({"_id": ticket_id}, {"$push": {"updates": {
+                    "timestamp": now, "type": "support_response", "author": "agent.support@mongodb.com",
+                    "body": rng.choice(RESPONSES)}}})
+                event = "respond"
+            if ticket_id in owned:
+                owned.move_to_end(ticket_id)
+        counts[index][event] += 1
+
+
+def read_view(db, offset):
+    view = {doc["_id"]: doc.get("open_count", 0) for doc in db.queue_stats.find()}
+    return tuple(view.get(priority, 0) - offset[i] for i, priority in enumerate(PRIORITIES))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive ticket activity and measure queue_stats convergence lag and drift.")
+    parser.add_argument("--uri", default="mongodb://localhost:27017/?replicaSet=rs0", help="Cluster connection string.")
+    parser.add_argument("--db", default="support", help="Database. Defaults to support.")
+    parser.add_argument("--variant", choices=["escalation", "simple"], default="escalation",
+                        help="Pipeline the processor runs; picks the default event mix. Defaults to escalation.")
+    parser.add_argument("--mix", type=parse_mix, help="Event weights, e.g. open=32,resolve=23,respond=23,escalate=13,delete=9.")
+    parser.add_argument("--reset", action="store_true", help="Recreate the collections from data/tickets.json and exit.")
+    parser.add_argument("--copies", type=int, default=1, help="Copies of data/tickets.json to load with --reset. Defaults to 1.")
+    parser.add_argument("--rate", type=float, default=1000, help="Ticket events/sec over all writers; 0 is unthrottled. Defaults to 1000.")
+    parser.add_argument("--writers", type=int, default=16, help="Writer threads. Defaults to 16.")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds of activity. Defaults to 30.")
+    parser.add_argument("--poll-ms", type=float, default=50, help="queue_stats poll interval. Defaults to 50.")
+    parser.add_argument("--settle-timeout", type=float, default=30,
+                        help="Seconds to wait for the view to reach the final truth. Defaults to 30.")
+    parser.add_argument("--seed", type=int, help="Random seed for the event sequence.")
+    parser.add_argument("--output", help="Write the results as JSON to this file.")
+    args = parser.parse_args()
+    args.mix = args.mix or MIXES[args.variant]
+
+    db = MongoClient(args.uri)[args.db]
+    if args.reset:
+        reset(db, load_tickets(), args.copies)
+        return
+
+    # The one scan of the source: who owns which open ticket, and the starting truth
+    owned = [collections.OrderedDict() for _ in range(args.writers)]
+    start_counts = collections.Counter()
+    for i, ticket in enumerate(db.support_tickets.find({"status": "open"}, {"priority": 1})):
+        owned[i % args.writers][ticket["_id"]] = ticket["priority"]
+        start_counts[ticket["priority"]] += 1
+    truth = GroundTruth(start_counts)
+    offset = tuple(a - b for a, b in zip(read_view(db, (0, 0, 0)), truth.state()))
+    if any(offset):
+        print(f"queue_stats starts off by {dict(zip(PRIORITIES, offset))} from support_tickets; "
+              f"measuring changes relative to that")
+
+    stop = threading.Event()
+    counts = [collections.Counter() for _ in range(args.writers)]
+    threads = [threading.Thread(target=writer, args=(i, db, args, truth, owned[i], stop, counts), daemon=True)
+               for i in range(args.writers)]
+    for thread in threads:
+        thread.start()
+
+    lags, drifts = [], []
+    polls = in_sync = unmatched = 0
+    start = time.perf_counter()
+    settled_at = stopped_at = None
+    print(f"Running {args.duration:g}s at {args.rate:g} events/sec ({args.variant} mix {args.mix})")
+    while True:
+        now = time.perf_counter()
+        if now - start >= args.duration and not stop.is_set():
+            stop.set()
+            for thread in threads:
+                thread.join()
+            stopped_at = time.perf_counter()
+        view = read_view(db, offset)
+        polled_at = time.perf_counter()
+        current = truth.state()
+        polls += 1
+        drifts.append(sum(abs(v - t) for v, t in zip(view, current)))
+        converged = truth.converge(view, polled_at)
+        if converged is not None:
+            lags.extend(converged)
+        elif view != current:
+            unmatched += 1
+        in_sync += view == current
+        if stop.is_set():
+            if view == current:
+                settled_at = polled_at
+                break
+            if polled_at - stopped_at > args.settle_timeout:
+                break
+        time.sleep(max(0.0, args.poll_ms / 1000 - (time.perf_counter() - now)))
+
+    events = sum(counts, collections.Counter())
+    elapsed = stopped_at - start
+    dlq = db.queue_stats_dlq.count_documents({})
+    final_view = read_view(db, offset)
+    result = {
+        "events": dict(events),
+        "events_per_sec": sum(events.values()) / elapsed,
+        "versions": truth.versions,
+        "lag_ms": {name: percentile(lags, pct) * 1000 for name, pct in
+                   [("p50", 50), ("p95", 95), ("p99", 99), ("max", 100)]},
+        "unconverged": len(truth.pending),
+        "polls": polls,
+        "in_sync_polls": in_sync,
+        "unmatched_polls": unmatched,
+        "max_drift": max(drifts),
+        "mean_drift": sum(drifts) / len(drifts),
+        "settle_seconds": settled_at - stopped_at if settled_at else None,
+        "final_truth": dict(zip(PRIORITIES, truth.state())),
+        "final_view": dict(zip(PRIORITIES, final_view)),
+        "dlq": dlq,
+    }
+
+    print("-------------------------------------------------")
+    print(f"Events: {sum(events.values())} in {elapsed:.1f}s ({result['events_per_sec']:,.0f}/sec) "
+          + " ".join(f"{name}={count}" for name, count in sorted(events.items())))
+    lag = result["lag_ms"]
+    print(f"Convergence lag (ms): p50={lag['p50']:.0f} p95={lag['p95']:.0f} p99={lag['p99']:.0f} max={lag['max']:.0f} "
+          f"over {len(lags)} of {truth.versions} truth versions")
+    print(f"Drift (sum of |view - truth| over priorities): max={result['max_drift']} mean={result['mean_drift']:.1f}; "
+          f"view in sync on {in_sync / polls * 100:.1f}% of {polls} polls, matching no truth version on {unmatched}")
+    if settled_at:
+        print(f"View reached the final truth {result['settle_seconds']:.2f}s after the writers stopped")
+    else:
+        print(f"View did NOT reach the final truth within {args.settle_timeout:g}s: "
+              f"view {result['final_view']} vs truth {result['final_truth']}")
+        if args.variant == "simple" and events["escalate"]:
+            print("simple-pipeline.mongodb.js does not handle escalations; use the escalation pipeline or drop escalate from --mix")
+    if dlq:
+        print(f"queue_stats_dlq has {dlq} documents")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
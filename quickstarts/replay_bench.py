@@ -0,0 +1,816 @@
+import argparse
+import glob
+import json
+import os
+import random
+import re
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+from offline_helpers import load_pipeline
+
+# Replay a JSONL/BSON corpus through stream processor pipelines and measure throughput.
+#
+# code_snippets/documentSourceLoadFromFile.js loads a whole file into `$source: {documents: [...]}`,
+# so the corpus has to fit in memory and in one message. This harness streams the corpus in
+# chunks instead and runs the pipelines locally:
+#
+#   * stages this script can evaluate ($match, $validate, $addFields/$set, $project, $unset,
+#     $replaceRoot and tumbling/hopping windows with $group) run in Python, with per-stage timing
+#   * pipelines with other stages fall back to aggregation on a local mongod (--mongo-uri) by
+#     prefixing each chunk with `$documents`; per-stage time is the difference between
+#     running successive pipeline prefixes
+#   * $source is replaced by the corpus and $merge/$emit sinks only count their input
+#
+# Results can be saved with --output and compared with a previous run with --baseline, which
+# makes it usable as a regression check before rolling a pipeline change out:
+#
+#   python3 replay_bench.py --synthetic 200000
+#   python3 replay_bench.py --corpus events.jsonl --output baseline.json
+#   python3 replay_bench.py --corpus events.jsonl --baseline baseline.json --max-regression 10
+
+SINK_STAGES = {"$merge", "$emit"}
+WINDOW_STAGES = {"$tumblingWindow", "$hoppingWindow"}
+# Stages that only exist in Atlas Stream Processing, so a mongod cannot run them either
+STREAM_ONLY_STAGES = {"$tumblingWindow", "$hoppingWindow", "$sessionWindow", "$https", "$externalFunction",
+                      "$validate", "$source", "$merge", "$emit"}
+UNIT_SECONDS = {"ms": 0.001, "second": 1, "minute": 60, "hour": 3600, "day": 86400}
+MISSING = object()
+
+
+class UnsupportedStage(Exception):
+    """The local engine cannot evaluate a stage or expression."""
+
+
+def iter_jsonl(path):
+    """Yields one document per non-empty line; extended JSON ($date, $oid, ...) is decoded if pymongo is installed."""
+    try:
+        from bson import json_util
+        loads = json_util.loads
+    except ImportError:
+        loads = json.loads
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield loads(line)
+
+
+def iter_bson(path):
+    """Yields documents from a BSON file, such as a mongodump .bson file, one at a time."""
+    import bson
+    with open(path, "rb") as f:
+        yield from bson.decode_file_iter(f)
+
+
+def iter_synthetic(count, seed=None):
+    """Yields documents with the fields the quickstart pipelines use (msg, device_id, ICAO, ts)."""
+    rng = random.Random(seed)
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    messages = ["hi", "hello", "hello world", "status ok", "reading"]
+    for i in range(count):
+        yield {
+            "_id": i,
+            "ts": (start + timedelta(milliseconds=i * 10)).isoformat().replace("+00:00", "Z"),
+            "msg": rng.choice(messages),
+            "device_id": f"device_{rng.randrange(50)}",
+            "ICAO": f"{rng.randrange(16 ** 6):06X}",
+            "speed": rng.randint(-20, 160),
+            "obs": {"watts": rng.randint(0, 400), "temp": rng.randint(5, 40)},
+        }
+
+
+def chunked(documents, size):
+    chunk = []
+    for document in documents:
+        chunk.append(document)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def get_path(document, path):
+    value = document
+    for part in path.split("."):
+        if isinstance(value, dict) and part in value:
+            value = value[part]
+        else:
+            return MISSING
+    return value
+
+
+def set_path(document, path, value):
+    parts = path.split(".")
+    for part in parts[:-1]:
+        document = document.setdefault(part, {})
+    document[parts[-1]] = value
+
+
+def to_datetime(value):
+    if isinstance(value, datetime):
+        return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+    if isinstance(value, str):
+        return datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value / 1000, timezone.utc)
+    raise UnsupportedStage(f"cannot convert {value!r} to a date")
+
+
+def evaluate(expression, document):
+    """Evaluates an aggregation expression: field paths, literals and a small set of operators."""
+    if isinstance(expression, str):
+        if expression.startswith("$$"):
+            raise UnsupportedStage(f"variable {expression}")
+        if expression.startswith("$"):
+            value = get_path(document, expression[1:])
+            return None if value is MISSING else value
+        return expression
+    if isinstance(expression, list):
+        return [evaluate(item, document) for item in expression]
+    if not isinstance(expression, dict):
+        return expression
+    if len(expression) != 1 or not next(iter(expression)).startswith("$"):
+        return {key: evaluate(value, document) for key, value in expression.items()}
+
+    operator, argument = next(iter(expression.items()))
+    if operator == "$literal":
+        return argument
+    if operator == "$cond":
+        if isinstance(argument, list):
+            argument = dict(zip(["if", "then", "else"], argument))
+        return evaluate(argument["then"] if evaluate(argument["if"], document) else argument["else"], document)
+    if operator == "$switch":
+        for branch in argument["branches"]:
+            if evaluate(branch["case"], document):
+                return evaluate(branch["then"], document)
+        return evaluate(argument.get("default"), document)
+    if operator == "$expr":
+        return evaluate(argument, document)
+    if operator == "$dateFromString":
+        return to_datetime(evaluate(argument["dateString"], document))
+
+    values = evaluate(argument if isinstance(argument, list) else [argument], document)
+    if operator in COMPARISONS:
+        return compare(operator, values[0], values[1])
+    if operator == "$add":
+        return sum(values)
+    if operator == "$subtract":
+        return values[0] - values[1]
+    if operator == "$multiply":
+        result = 1
+        for value in values:
+            result *= value
+        return result
+    if operator == "$divide":
+        return values[0] / values[1]
+    if operator == "$concat":
+        return None if None in values else "".join(values)
+    if operator == "$toString":
+        return None if values[0] is None else str(values[0])
+    if operator == "$ifNull":
+        return next((value for value in values if value is not None), None)
+    if operator in ("$and", "$or"):
+        results = [bool(value) for value in values]
+        return all(results) if operator == "$and" else any(results)
+    if operator == "$not":
+        return not values[0]
+    raise UnsupportedStage(f"expression operator {operator}")
+
+
+def compare(operator, left, right):
+    if operator == "$eq":
+        return left == right
+    if operator == "$ne":
+        return left != right
+    try:
+        if operator == "$gt":
+            return left > right
+        if operator == "$gte":
+            return left >= right
+        if operator == "$lt":
+            return left < right
+        return left <= right
+    except TypeError:
+        return False  # Different types never match in this simplified comparison
+
+
+def type_order(value):
+    """Rank of the value's type in the BSON comparison order (null, numbers, strings, objects, arrays, ..., dates)."""
+    if value is None:
+        return 1
+    if isinstance(value, bool):
+        return 8
+    if isinstance(value, (int, float)):
+        return 2
+    if isinstance(value, str):
+        return 3
+    if isinstance(value, dict):
+        return 4
+    if isinstance(value, list):
+        return 5
+    if isinstance(value, bytes):
+        return 6
+    if isinstance(value, datetime):
+        return 9
+    return 7  # ObjectId and the other BSON types
+
+
+def bson_less(left, right):
+    """left < right in BSON order: by type first, then by value; values Python cannot order are kept as equal."""
+    left_order, right_order = type_order(left), type_order(right)
+    if left_order != right_order:
+        return left_order < right_order
+    try:
+        return left < right
+    except TypeError:
+        return False
+
+
+COMPARISONS = {"$eq", "$ne", "$gt", "$gte", "$lt", "$lte"}
+EXPRESSION_OPERATORS = COMPARISONS | {"$literal", "$cond", "$switch", "$expr", "$dateFromString", "$add", "$subtract",
+                                      "$multiply", "$divide", "$concat", "$toString", "$ifNull", "$and", "$or", "$not"}
+
+
+def check_expression(expression):
+    """Raises UnsupportedStage up front if `expression` uses an operator evaluate() does not implement."""
+    if isinstance(expression, list):
+        for item in expression:
+            check_expression(item)
+    elif isinstance(expression, dict):
+        for key, value in expression.items():
+            if key.startswith("$") and key not in EXPRESSION_OPERATORS:
+                raise UnsupportedStage(f"expression operator {key}")
+            if key != "$literal":
+                check_expression(value)
+    elif isinstance(expression, str) and expression.startswith("$$"):
+        raise UnsupportedStage(f"variable {expression}")
+
+
+QUERY_OPERATORS = COMPARISONS | {"$exists", "$in", "$nin", "$regex", "$options", "$not"}
+
+
+def check_query(query):
+    """Raises UnsupportedStage up front if `query` uses an operator matches() does not implement."""
+    for key, condition in query.items():
+        if key in ("$and", "$or", "$nor"):
+            for sub_query in condition:
+                check_query(sub_query)
+        elif key == "$expr":
+            check_expression(condition)
+        elif key.startswith("$"):
+            raise UnsupportedStage(f"query operator {key}")
+        elif isinstance(condition, dict):
+            for operator, argument in condition.items():
+                if operator.startswith("$") and operator not in QUERY_OPERATORS:
+                    raise UnsupportedStage(f"query operator {operator}")
+                if operator == "$not" and isinstance(argument, dict):
+                    check_query({key: argument})
+
+
+def matches(query, document):
+    """Evaluates a query document ($match / $validate validator) against a document."""
+    for key, condition in query.items():
+        if key == "$and":
+            if not all(matches(q, document) for q in condition):
+                return False
+        elif key == "$or":
+            if not any(matches(q, document) for q in condition):
+                return False
+        elif key == "$nor":
+            if any(matches(q, document) for q in condition):
+                return False
+        elif key == "$expr":
+            if not evaluate(condition, document):
+                return False
+        elif key.startswith("$"):
+            raise UnsupportedStage(f"query operator {key}")
+        elif not matches_field(get_path(document, key), condition):
+            return False
+    return True
+
+
+def matches_field(value, condition):
+    if not (isinstance(condition, dict) and condition and all(k.startswith("$") for k in condition)):
+        if isinstance(value, list):
+            return condition in value or value == condition
+        return (None if value is MISSING else value) == condition
+
+    for operator, argument in condition.items():
+        if operator == "$exists":
+            if (value is not MISSING) != bool(argument):
+                return False
+        elif operator == "$in":
+            if (None if value is MISSING else value) not in argument:
+                return False
+        elif operator == "$nin":
+            if (None if value is MISSING else value) in argument:
+                return False
+        elif operator == "$regex":
+            flags = re.IGNORECASE if "i" in condition.get("$options", "") else 0
+            if not isinstance(value, str) or not re.search(argument, value, flags):
+                return False
+        elif operator == "$options":
+            continue
+        elif operator == "$not":
+            if matches_field(value, argument):
+                return False
+        elif operator in COMPARISONS:
+            if value is MISSING or not compare(operator, value, argument):
+                if not (operator == "$ne" and value is MISSING):
+                    return False
+        else:
+            raise UnsupportedStage(f"query operator {operator}")
+    return True
+
+
+class Stage:
+    """A pipeline stage: process() takes and returns a list of documents, flush() drains state at the end."""
+
+    def __init__(self, name):
+        self.name = name
+
+    def process(self, documents):
+        return documents
+
+    def flush(self):
+        return []
+
+
+class MatchStage(Stage):
+    def __init__(self, name, query):
+        super().__init__(name)
+        check_query(query)
+        self.query = query
+
+    def process(self, documents):
+        return [document for document in documents if matches(self.query, document)]
+
+
+class AddFieldsStage(Stage):
+    def __init__(self, name, fields):
+        super().__init__(name)
+        check_expression(list(fields.values()))
+        self.fields = fields
+
+    def process(self, documents):
+        for document in documents:
+            for path, expression in self.fields.items():
+                set_path(document, path, evaluate(expression, document))
+        return documents
+
+
+class ProjectStage(Stage):
+    def __init__(self, name, projection):
+        super().__init__(name)
+        self.exclude = [path for path, value in projection.items() if value in (0, False)]
+        self.include = {path: value for path, value in projection.items() if value not in (0, False)}
+        check_expression([value for value in self.include.values() if value not in (1, True)])
+        if self.exclude and [path for path in self.include if path != "_id"]:
+            raise UnsupportedStage("$project mixing inclusion and exclusion")
+
+    def process(self, documents):
+        if not self.include:
+            return UnsetStage(self.name, self.exclude).process(documents)
+        projected = []
+        for document in documents:
+            result = {}
+            if "_id" in document and "_id" not in self.exclude:
+                result["_id"] = document["_id"]
+            for path, value in self.include.items():
+                value = get_path(document, path) if value in (1, True) else evaluate(value, document)
+                if value is not MISSING:
+                    set_path(result, path, value)
+            projected.append(result)
+        return projected
+
+
+class UnsetStage(Stage):
+    def __init__(self, name, paths):
+        super().__init__(name)
+        self.paths = [paths] if isinstance(paths, str) else paths
+
+    def process(self, documents):
+        for document in documents:
+            for path in self.paths:
+                *parents, leaf = path.split(".")
+                target = get_path(document, ".".join(parents)) if parents else document
+                if isinstance(target, dict):
+                    target.pop(leaf, None)
+        return documents
+
+
+class ReplaceRootStage(Stage):
+    def __init__(self, name, spec):
+        super().__init__(name)
+        self.new_root = spec.get("newRoot", spec.get("replacement"))
+        check_expression(self.new_root)
+
+    def process(self, documents):
+        return [evaluate(self.new_root, document) for document in documents]
+
+
+class ValidateStage(Stage):
+    """$validate drops (or sends to the DLQ) documents that fail the validator; both are counted as dropped."""
+
+    def __init__(self, name, spec):
+        super().__init__(name)
+        if "$jsonSchema" in spec.get("validator", {}):
+            raise UnsupportedStage("$validate with $jsonSchema")
+        self.query = spec.get("validator", {})
+        check_query(self.query)
+
+    def process(self, documents):
+        return [document for document in documents if matches(self.query, document)]
+
+
+class SinkStage(Stage):
+    """$merge/$emit: counts the documents that would be written."""
+
+
+ACCUMULATORS = {"$sum", "$avg", "$min", "$max", "$first", "$last", "$push", "$addToSet", "$count"}
+
+
+class GroupState:
+    """Streaming $group accumulators for one window, without keeping the documents."""
+
+    def __init__(self, spec):
+        self.id_expression = spec["_id"]
+        check_expression(self.id_expression)
+        self.fields = {}
+        for field, accumulator in spec.items():
+            if field == "_id":
+                continue
+            operator, expression = next(iter(accumulator.items()))
+            if operator not in ACCUMULATORS:
+                raise UnsupportedStage(f"accumulator {operator}")
+            check_expression(expression)
+            self.fields[field] = (operator, expression)
+        self.groups = {}
+
+    def add(self, document):
+        group_id = evaluate(self.id_expression, document)
+        key = json.dumps(group_id, sort_keys=True, default=str)
+        state = self.groups.get(key)
+        if state is None:
+            state = self.groups[key] = {"_id": group_id}
+        for field, (operator, expression) in self.fields.items():
+            value = 1 if operator == "$count" else evaluate(expression, document)
+            current = state.get(field, MISSING)
+            if operator in ("$sum", "$count"):
+                state[field] = (0 if current is MISSING else current) + (value if isinstance(value, (int, float)) else 0)
+            elif operator == "$avg":
+                total, count = (0, 0) if current is MISSING else current
+                if isinstance(value, (int, float)):
+                    total, count = total + value, count + 1
+                state[field] = (total, count)
+            elif operator in ("$min", "$max"):
+                # Like MongoDB, null only wins if every value is null
+                if current is MISSING or current is None:
+                    state[field] = value
+                elif value is not None and (bson_less(value, current) if operator == "$min" else bson_less(current, value)):
+                    state[field] = value
+            elif operator == "$first":
+                state[field] = value if current is MISSING else current
+            elif operator == "$last":
+                state[field] = value
+            elif operator == "$push":
+                if current is MISSING:
+                    current = state[field] = []
+                current.append(value)
+            elif operator == "$addToSet":
+                # (values in insertion order, their encodings) so membership is a set lookup
+                if current is MISSING:
+                    current = state[field] = ([], set())
+                encoded = json.dumps(value, sort_keys=True, default=str)
+                if encoded not in current[1]:
+                    current[1].add(encoded)
+                    current[0].append(value)
+
+    def results(self):
+        for state in self.groups.values():
+            for field, (operator, _) in self.fields.items():
+                if operator == "$avg":
+                    total, count = state[field]
+                    state[field] = total / count if count else None
+                elif operator == "$addToSet":
+                    state[field] = state[field][0]
+            yield state
+
+
+class WindowStage(Stage):
+    """Tumbling or hopping window over event time, with the inner pipeline split around one $group.
+
+    Inner stages before $group run as documents arrive, the $group keeps only accumulators,
+    and the stages after it run on the group results when the window closes. A window closes
+    once the largest event time seen passes its end; the rest close when the corpus ends.
+    """
+
+    def __init__(self, name, spec, time_field):
+        super().__init__(name)
+        self.size = interval_seconds(spec["interval"])
+        self.hop = interval_seconds(spec["hopSize"]) if "hopSize" in spec else self.size
+        self.time_field = time_field
+        inner = spec.get("pipeline", [])
+        group_index = next((i for i, stage in enumerate(inner) if "$group" in stage), None)
+        if group_index is None:
+            raise UnsupportedStage(f"{name} without $group")
+        self.before = [build_stage(stage, time_field) for stage in inner[:group_index]]
+        self.group_spec = inner[group_index]["$group"]
+        self.after = [build_stage(stage, time_field) for stage in inner[group_index + 1:]]
+        self.windows = {}  # window start (epoch seconds) -> GroupState
+        self.watermark = float("-inf")
+
+    def event_time(self, document):
+        value = get_path(document, self.time_field)
+        return to_datetime(value).timestamp() if value is not MISSING else time.time()
+
+    def process(self, documents):
+        for document in documents:
+            event_time = self.event_time(document)
+            self.watermark = max(self.watermark, event_time)
+            # The window is picked by the source event time; the inner stages' output is grouped
+            results = [document]
+            for stage in self.before:
+                results = stage.process(results)
+            if not results:
+                continue
+            start = (event_time // self.hop) * self.hop
+            while start > event_time - self.size:
+                if start not in self.windows:
+                    self.windows[start] = GroupState(self.group_spec)
+                for result in results:
+                    self.windows[start].add(result)
+                start -= self.hop
+        closed = [start for start in self.windows if start + self.size <= self.watermark]
+        return self.close(closed)
+
+    def flush(self):
+        return self.close(list(self.windows))
+
+    def close(self, starts):
+        output = []
+        for start in sorted(starts):
+            results = list(self.windows.pop(start).results())
+            for stage in self.after:
+                results = stage.process(results)
+            window = {"start": datetime.fromtimestamp(start, timezone.utc),
+                      "end": datetime.fromtimestamp(start + self.size, timezone.utc)}
+            for result in results:
+                result["_stream_meta"] = {"window": window}
+            output.extend(results)
+        return output
+
+
+def interval_seconds(interval):
+    return interval["size"] * UNIT_SECONDS[interval["unit"]]
+
+
+def build_stage(stage, time_field):
+    """Returns the local Stage for a pipeline stage document, or raises UnsupportedStage."""
+    name, spec = next(iter(stage.items()))
+    if name == "$match":
+        return MatchStage(name, spec)
+    if name in ("$addFields", "$set"):
+        return AddFieldsStage(name, spec)
+    if name == "$project":
+        return ProjectStage(name, spec)
+    if name == "$unset":
+        return UnsetStage(name, spec)
+    if name in ("$replaceRoot", "$replaceWith"):
+        return ReplaceRootStage(name, spec if name == "$replaceRoot" else {"newRoot": spec})
+    if name == "$validate":
+        return ValidateStage(name, spec)
+    if name in WINDOW_STAGES:
+        return WindowStage(name, spec, time_field)
+    if name in SINK_STAGES:
+        return SinkStage(name)
+    raise UnsupportedStage(f"stage {name}")
+
+
+def stage_label(index, stage):
+    return f"{index} {next(iter(stage))}"
+
+
+def timed_chunks(chunks, stat):
+    """Yields the chunks, adding the time spent reading and decoding them to `stat` (the $source stage)."""
+    chunks = iter(chunks)
+    while True:
+        start = time.perf_counter()
+        chunk = next(chunks, None)
+        stat["seconds"] += time.perf_counter() - start
+        if chunk is None:
+            return
+        stat["in"] += len(chunk)
+        stat["out"] += len(chunk)
+        yield chunk
+
+
+def run_local(pipeline, chunks, time_field):
+    """Runs the pipeline (without $source) in Python; returns (docs in, docs out, per-stage stats)."""
+    stages = [build_stage(stage, time_field) for stage in pipeline]
+    source = {"stage": "0 $source", "in": 0, "out": 0, "seconds": 0.0}
+    stats = [{"stage": stage_label(i + 1, stage), "in": 0, "out": 0, "seconds": 0.0} for i, stage in enumerate(pipeline)]
+    documents_in = documents_out = 0
+
+    def run_from(index, documents):
+        for i in range(index, len(stages)):
+            start = time.perf_counter()
+            stats[i]["in"] += len(documents)
+            documents = stages[i].process(documents)
+            stats[i]["out"] += len(documents)
+            stats[i]["seconds"] += time.perf_counter() - start
+        return len(documents)
+
+    for chunk in timed_chunks(chunks, source):
+        documents_in += len(chunk)
+        documents_out += run_from(0, chunk)
+    for i, stage in enumerate(stages):
+        start = time.perf_counter()
+        flushed = stage.flush()
+        stats[i]["out"] += len(flushed)
+        stats[i]["seconds"] += time.perf_counter() - start
+        if flushed:
+            documents_out += run_from(i + 1, flushed)
+    return documents_in, documents_out, [source] + stats
+
+
+def mongod_runnable(pipeline):
+    """Returns None if a mongod can run the pipeline (without $source and sinks), else the reason."""
+    for stage in pipeline:
+        name, spec = next(iter(stage.items()))
+        if name in SINK_STAGES:
+            continue
+        if name in STREAM_ONLY_STAGES:
+            return f"{name} only runs in Atlas Stream Processing"
+        if name == "$lookup" and isinstance(spec.get("from"), dict):
+            return "$lookup from a connection"
+    return None
+
+
+def run_mongod(pipeline, chunks, mongo_uri):
+    """Runs each chunk through `$documents` + pipeline on a local mongod.
+
+    Per-stage time is measured by also running every shorter prefix of the pipeline and
+    taking the differences, so this costs one aggregation per stage per chunk.
+    """
+    from pymongo import MongoClient
+    db = MongoClient(mongo_uri).get_database("replay_bench")
+    stages = [stage for stage in pipeline if next(iter(stage)) not in SINK_STAGES]
+    source = {"stage": "0 $source", "in": 0, "out": 0, "seconds": 0.0}
+    stats = [{"stage": stage_label(i + 1, stage), "in": 0, "out": 0, "seconds": 0.0} for i, stage in enumerate(stages)]
+    documents_in = documents_out = 0
+
+    for chunk in timed_chunks(chunks, source):
+        documents_in += len(chunk)
+        previous_seconds, previous_count = 0.0, len(chunk)
+        for i in range(len(stages)):
+            start = time.perf_counter()
+            count = sum(1 for _ in db.aggregate([{"$documents": chunk}] + stages[:i + 1]))
+            elapsed = time.perf_counter() - start
+            stats[i]["in"] += previous_count
+            stats[i]["out"] += count
+            stats[i]["seconds"] += max(0.0, elapsed - previous_seconds)
+            previous_seconds, previous_count = elapsed, count
+        documents_out += previous_count
+    return documents_in, documents_out, [source] + stats
+
+
+def load_definition(path):
+    """Reads a processor definition JSON file, a bare pipeline array, or an example_processors .js file.
+
+    Definitions without a name are named after the file.
+    """
+    name = os.path.splitext(os.path.basename(path))[0]
+    if path.endswith(".json"):
+        with open(path) as f:
+            definition = json.load(f)
+        if isinstance(definition, dict):
+            return definition
+        return {"name": name, "pipeline": definition}
+    return {"name": name, "pipeline": load_pipeline(path)}
+
+
+def time_field_for(definition, default):
+    """Uses the field named in `$source.timeField` ({"$dateFromString": {"dateString": "$ts"}} or "$ts") if there is one."""
+    source = next((stage["$source"] for stage in definition["pipeline"] if "$source" in stage), {})
+    time_field = source.get("timeField")
+    if isinstance(time_field, dict):
+        time_field = time_field.get("$dateFromString", {}).get("dateString")
+    if isinstance(time_field, str) and time_field.startswith("$"):
+        return time_field[1:]
+    return default
+
+
+def corpus_factory(args):
+    """Returns a function that opens the corpus from the start, so every pipeline and repeat sees the same documents."""
+    if args.synthetic:
+        return lambda: iter_synthetic(args.synthetic, seed=args.seed)
+    if args.corpus.endswith(".bson"):
+        return lambda: iter_bson(args.corpus)
+    return lambda: iter_jsonl(args.corpus)
+
+
+def benchmark(definition, open_corpus, args):
+    """Runs one pipeline `--repeat` times and returns the result of the fastest run."""
+    pipeline = [stage for stage in definition["pipeline"] if "$source" not in stage]
+    time_field = time_field_for(definition, args.time_field)
+    try:
+        for stage in pipeline:
+            build_stage(stage, time_field)
+        runner, engine = (lambda chunks: run_local(pipeline, chunks, time_field)), "local"
+    except UnsupportedStage as local_reason:
+        reason = mongod_runnable(pipeline)
+        if reason or not args.mongo_uri:
+            return {"name": definition["name"], "engine": "skipped",
+                    "reason": reason or f"{local_reason}; pass --mongo-uri to run it on a local mongod"}
+        runner, engine = (lambda chunks: run_mongod(pipeline, chunks, args.mongo_uri)), "mongod"
+
+    best = None
+    for _ in range(args.repeat):
+        # Copy documents so stages that modify them in place start from the corpus every run
+        chunks = chunked((dict(document) for document in open_corpus()), args.chunk_size)
+        start = time.perf_counter()
+        try:
+            documents_in, documents_out, stats = runner(chunks)
+        except (UnsupportedStage, ValueError, KeyError, TypeError) as e:
+            return {"name": definition["name"], "engine": "skipped", "reason": f"failed on the corpus: {e}"}
+        except Exception as e:  # pymongo errors from the mongod fallback
+            if engine != "mongod":
+                raise
+            return {"name": definition["name"], "engine": "skipped", "reason": f"mongod aggregation failed: {e}"}
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best["seconds"]:
+            best = {"name": definition["name"], "engine": engine, "documents_in": documents_in,
+                    "documents_out": documents_out, "seconds": elapsed,
+                    "docs_per_sec": documents_in / elapsed if elapsed else 0.0, "stages": stats}
+    return best
+
+
+def print_result(result, baseline):
+    if result["engine"] == "skipped":
+        print(f"{result['name']}: skipped ({result['reason']})")
+        return None
+    regression = None
+    line = (f"{result['name']} [{result['engine']}]: {result['documents_in']:,} in, {result['documents_out']:,} out, "
+            f"{result['seconds']:.2f}s, {result['docs_per_sec']:,.0f} docs/sec")
+    previous = baseline.get(result["name"])
+    if previous and previous.get("docs_per_sec"):
+        regression = (previous["docs_per_sec"] - result["docs_per_sec"]) / previous["docs_per_sec"] * 100
+        line += f" ({-regression:+.1f}% vs baseline)"
+    print(line)
+    for stage in result["stages"]:
+        per_document = stage["seconds"] / stage["in"] * 1e6 if stage["in"] else 0
+        print(f"    {stage['stage']:<22} in={stage['in']:>10,} out={stage['out']:>10,} "
+              f"time={stage['seconds'] * 1000:>9,.1f} ms  {per_document:>7.2f} us/doc")
+    return regression
+
+
+def main():
+    here = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Replay a JSONL/BSON corpus through stream processor pipelines and measure throughput.")
+    parser.add_argument("pipelines", nargs="*", help="Processor definition JSON or example_processors .js files. Defaults to quickstarts/0*.json.")
+    corpus = parser.add_mutually_exclusive_group(required=True)
+    corpus.add_argument("--corpus", help="JSONL (one document per line, extended JSON allowed) or .bson file to replay.")
+    corpus.add_argument("--synthetic", type=int, help="Replay this many generated documents instead of a file.")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="Documents read and processed per chunk. Defaults to 1000.")
+    parser.add_argument("--time-field", default="ts",
+                        help="Document field with the event time for windows, unless $source sets timeField. Defaults to ts.")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per pipeline; the fastest is reported. Defaults to 3.")
+    parser.add_argument("--mongo-uri", help="Local mongod to run pipelines the Python engine cannot, e.g. mongodb://localhost:27017.")
+    parser.add_argument("--seed", type=int, default=42, help="Seed for --synthetic. Defaults to 42.")
+    parser.add_argument("--output", help="Write the results as JSON to this file.")
+    parser.add_argument("--baseline", help="Results JSON from an earlier run to compare docs/sec against.")
+    parser.add_argument("--max-regression", type=float, default=10,
+                        help="Exit with status 1 if a pipeline is this many percent slower than the baseline. Defaults to 10.")
+    args = parser.parse_args()
+
+    paths = args.pipelines or sorted(glob.glob(os.path.join(here, "0*.json")))
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = {result["name"]: result for result in json.load(f)}
+
+    open_corpus = corpus_factory(args)
+    results = []
+    regressed = []
+    for path in paths:
+        result = benchmark(load_definition(path), open_corpus, args)
+        results.append(result)
+        regression = print_result(result, baseline)
+        if regression is not None and regression > args.max_regression:
+            regressed.append(result["name"])
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+    if regressed:
+        print(f"Slower than the baseline by more than {args.max_regression:g}%: {', '.join(regressed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+import os
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from requests.auth import HTTPDigestAuth
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Shared helpers for the Atlas Admin API scripts in this folder (startAll.py, stopAll.py).
+#
+# ATLAS_BASE_URL defaults to the real Atlas Admin API. Point it at a local mock
+# (see mock_admin_api.py) to exercise the scripts without touching a real workspace:
+#   ATLAS_BASE_URL=http://localhost:8080 python3 startAll.py --concurrency 16
+DEFAULT_BASE_URL = "https://cloud.mongodb.com"
+
+HEADERS = {
+    "Accept": "application/vnd.atlas.2024-05-30+json",
+    "Content-Type": "application/json",
+}
+
+
+def atlas_base_url():
+    """Returns the Admin API base URL, read at call time so values loaded from .env apply."""
+    return os.getenv("ATLAS_BASE_URL", DEFAULT_BASE_URL).rstrip("/")
+
+
+def processors_url(project_id, stream_instance):
+    """Returns the URL used to list the processors of a stream processing workspace."""
+    return f"{atlas_base_url()}/api/atlas/v2/groups/{project_id}/streams/{stream_instance}/processors"
+
+
+def processor_url(project_id, stream_instance, processor_name, action=None):
+    """Returns the URL of a single processor, optionally with an action suffix such as 'start' or 'stop'."""
+    url = f"{atlas_base_url()}/api/atlas/v2/groups/{project_id}/streams/{stream_instance}/processor/{processor_name}"
+    return f"{url}:{action}" if action else url
+
+
+def create_session(username, api_key, pool_size=10, rate_limit_retries=3):
+    """Creates a keep-alive session shared by every Admin API call in a run.
+
+    The session keeps up to `pool_size` TCP/TLS connections open, so concurrent calls
+    do not each pay for a new handshake. A single HTTPDigestAuth object is attached to
+    the session: once a worker thread has answered the digest challenge it reuses the
+    server nonce (incrementing the nonce count) instead of taking a 401 round trip on
+    every request.
+
+    Requests rejected with HTTP 429 are retried after the server's Retry-After delay
+    (or an exponential backoff when the header is missing). Once the retries are used
+    up the 429 response is returned to the caller as-is.
+
+    Args:
+        username: Atlas username (public API key).
+        api_key: Atlas API key (private API key).
+        pool_size: Maximum number of pooled connections, normally the worker count.
+        rate_limit_retries: How many times to retry a request rejected with HTTP 429.
+    """
+    session = requests.Session()
+    session.auth = HTTPDigestAuth(username, api_key)
+    session.headers.update(HEADERS)
+    retry = Retry(total=rate_limit_retries, connect=0, read=0, status_forcelist=[429],
+                  allowed_methods=None, respect_retry_after_header=True,
+                  backoff_factor=0.5, raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def run_fleet_action(action, processor_names, concurrency=1):
+    """Runs `action(name)` for each processor with at most `concurrency` calls in flight.
+
+    `action` should return True on success. Per-processor timing is printed as each
+    call finishes, followed by a summary for the whole fleet.
+
+    Returns:
+        A list of (name, succeeded, elapsed_seconds) tuples in completion order.
+    """
+    results = []
+    fleet_start = time.perf_counter()
+
+    def timed(name):
+        start = time.perf_counter()
+        succeeded = action(name)
+        return name, bool(succeeded), time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        futures = [executor.submit(timed, name) for name in processor_names]
+        for future in as_completed(futures):
+            name, succeeded, elapsed = future.result()
+            print(f"  {name}: {'ok' if succeeded else 'FAILED'} in {elapsed * 1000:.0f} ms")
+            results.append((name, succeeded, elapsed))
+
+    if results:
+        total = time.perf_counter() - fleet_start
+        timings = sorted(elapsed for _, _, elapsed in results)
+        failed = sum(1 for _, succeeded, _ in results if not succeeded)
+        print(f"Processed {len(results)} processors in {total:.2f} s "
+              f"(concurrency={concurrency}, failed={failed}, "
+              f"min={timings[0] * 1000:.0f} ms, "
+              f"median={timings[len(timings) // 2] * 1000:.0f} ms, "
+              f"max={timings[-1] * 1000:.0f} ms)")
+    return results
+
+
+def iter_stream_processors(session, project_id, stream_instance, items_per_page=100, concurrency=4):
+    """Yields every processor in the workspace, following the Admin API pagination.
+
+    The first page is fetched on its own to learn `totalCount`; the remaining pages are
+    then fetched concurrently and yielded in page order as soon as each one arrives, so
+    callers can start working before the whole inventory has been downloaded.
+
+    Args:
+        session: Session from create_session().
+        project_id: Atlas project ID.
+        stream_instance: Stream instance name.
+        items_per_page: Page size to request (the Admin API allows up to 500).
+        concurrency: Maximum number of pages fetched at the same time.
+
+    Raises:
+        requests.exceptions.RequestException if any page cannot be fetched.
+    """
+    url = processors_url(project_id, stream_instance)
+
+    def fetch_page(page_num):
+        params = {"itemsPerPage": items_per_page, "pageNum": page_num, "includeCount": "true"}
+        response = session.get(url, params=params)
+        response.raise_for_status()
+        return response.json()
+
+    first = fetch_page(1)
+    yield from first["results"]
+
+    total_count = first.get("totalCount", len(first["results"]))
+    page_count = -(-total_count // items_per_page)  # Ceiling division
+    if page_count <= 1:
+        return
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        futures = [executor.submit(fetch_page, page_num) for page_num in range(2, page_count + 1)]
+        for future in futures:
+            yield from future.result()["results"]
+
+
+class ProcessorInventory:
+    """Local cache of processor states that reports only what changed between polls.
+
+    poll() refetches the inventory once the cached copy is older than `ttl` seconds and
+    returns the difference against the previous copy, so a watchdog loop only has to act
+    on the processors whose state actually moved.
+
+    Example:
+        inventory = ProcessorInventory(session, project_id, stream_instance, ttl=30)
+        changed, removed = inventory.poll()   # First poll: every processor is "changed"
+    """
+
+    def __init__(self, session, project_id, stream_instance, ttl=0, items_per_page=100, concurrency=4):
+        self.session = session
+        self.project_id = project_id
+        self.stream_instance = stream_instance
+        self.ttl = ttl
+        self.items_per_page = items_per_page
+        self.concurrency = concurrency
+        self.states = {}
+        self.fetched_at = None
+
+    def is_fresh(self):
+        return self.fetched_at is not None and time.monotonic() - self.fetched_at < self.ttl
+
+    def poll(self):
+        """Returns (changed, removed): a {name: state} dict of new or changed processors
+        and a list of processor names that no longer exist. Both are empty while the
+        cache is still within its TTL.
+        """
+        if self.is_fresh():
+            return {}, []
+
+        latest = {
+            processor["name"]: processor["state"]
+            for processor in iter_stream_processors(self.session, self.project_id, self.stream_instance,
+                                                    self.items_per_page, self.concurrency)
+        }
+        changed = {name: state for name, state in latest.items() if self.states.get(name) != state}
+        removed = [name for name in self.states if name not in latest]
+        self.states = latest
+        self.fetched_at = time.monotonic()
+        return changed, removed
+
+    def set_state(self, name, state):
+        """Records a state change made by this script so the next poll does not report it again."""
+        self.states[name] = state
+
+    def forget(self, name):
+        """Drops a processor from the cache so the next poll reports it as changed (e.g. after a failed call)."""
+        self.states.pop(name, None)
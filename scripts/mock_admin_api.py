@@ -0,0 +1,279 @@
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+# A small local stand-in for the Atlas Admin API stream processor endpoints used by the
+# scripts in this folder. It keeps processor state in memory, answers with a digest
+# challenge like the real API, and counts TCP connections and 401 challenges so you can
+# see the effect of connection pooling and nonce reuse (GET /mock/counters).
+#
+#   python3 mock_admin_api.py --processors 300 --latency-ms 50
+#   ATLAS_BASE_URL=http://localhost:8080 python3 startAll.py --concurrency 16
+
+PROCESSORS_PATH = re.compile(r"^/api/atlas/v2/groups/([^/]+)/streams/([^/]+)/processors$")
+CREATE_PROCESSOR_PATH = re.compile(r"^/api/atlas/v2/groups/([^/]+)/streams/([^/]+)/processor$")
+PROCESSOR_PATH = re.compile(r"^/api/atlas/v2/groups/([^/]+)/streams/([^/]+)/processor/([^/:]+)$")
+PROCESSOR_ACTION_PATH = re.compile(r"^/api/atlas/v2/groups/([^/]+)/streams/([^/]+)/processor/([^/:]+):(start|stop)$")
+
+# Simulated pipeline for the verbose operator stats: (operator name, mean latency in microseconds)
+MOCK_PIPELINE = [
+    ("KafkaConsumerOperator", 6),
+    ("ValidateOperator", 11),
+    ("LookUpOperator", 850),
+    ("HttpsOperator", 4200),
+    ("MergeOperator", 1600),
+]
+MOCK_EVENTS_PER_SECOND = 500
+
+
+class MockAdminState:
+    """In-memory processor inventory plus request counters shared by all handler threads."""
+
+    def __init__(self, processor_count, latency_ms, rate_limit=0):
+        self.lock = threading.Lock()
+        self.latency = latency_ms / 1000.0
+        self.rate_limit = rate_limit
+        self.window_start = time.monotonic()
+        self.window_requests = 0
+        self.nonce = uuid.uuid4().hex
+        self.processors = {
+            f"processor_{i:04d}": {"name": f"processor_{i:04d}", "state": "STOPPED"}
+            for i in range(processor_count)
+        }
+        # Simulated memory profile per processor: a baseline plus a slow growth rate
+        self.memory_profiles = {
+            name: (random.uniform(50e6, 3e9), random.choice([0, 0, 0, random.uniform(1e3, 1e5)]))
+            for name in self.processors
+        }
+        self.started_at = {}
+        self.stopped_at = {}
+        self.counters = {"connections": 0, "requests": 0, "challenges": 0, "throttled": 0}
+
+    def add_processor(self, name, pipeline=None):
+        self.processors[name] = {"name": name, "state": "CREATED", "pipeline": pipeline or []}
+        self.memory_profiles[name] = (random.uniform(50e6, 3e9), 0)
+
+    def stats(self, name):
+        """Returns a stats document for a processor that has run, with a noisy, possibly growing memory usage.
+
+        A stopped processor keeps the counters and change stream resume token from when it stopped.
+        """
+        baseline, growth_per_second = self.memory_profiles[name]
+        until = self.stopped_at.get(name, time.monotonic())
+        running_for = max(0.0, until - self.started_at.get(name, until))
+        memory = baseline * random.uniform(0.8, 1.2) + growth_per_second * running_for
+        events = int(running_for * MOCK_EVENTS_PER_SECOND)
+        return {"name": name, "status": "running" if name not in self.stopped_at else "stopped",
+                "memoryUsageBytes": int(memory),
+                "changeStreamState": {"_data": f"8266E3105B{events:016X}"},
+                "operatorStats": self.operator_stats(running_for)}
+
+    def operator_stats(self, running_for):
+        """Cumulative per-operator counters in the shape of sp.NAME.stats({verbose: true})."""
+        operators = []
+        count = int(running_for * MOCK_EVENTS_PER_SECOND)
+        for name, latency_us in MOCK_PIPELINE:
+            # Every fifth message fails validation and goes to the DLQ
+            dlq = count // 5 if name == "ValidateOperator" else 0
+            p50 = latency_us * random.uniform(0.8, 1.2)
+            operators.append({
+                "name": name,
+                "dlqMessageCount": dlq,
+                "executionTimeMillis": int(count * latency_us / 1000),
+                "latency": {
+                    "p50": int(p50),
+                    "p99": int(p50 * random.uniform(2, 6)),
+                    "count": count,
+                    "sum": count * latency_us,
+                    "unit": "microseconds",
+                },
+                "inputMessageCount": count,
+                "outputMessageCount": count - dlq,
+            })
+            count -= dlq
+        return operators
+
+    def count(self, key):
+        with self.lock:
+            self.counters[key] += 1
+
+    def throttled(self):
+        """Returns True if the request exceeds the configured requests-per-second limit."""
+        if not self.rate_limit:
+            return False
+        with self.lock:
+            now = time.monotonic()
+            if now - self.window_start >= 1:
+                self.window_start, self.window_requests = now, 0
+            self.window_requests += 1
+            if self.window_requests > self.rate_limit:
+                self.counters["throttled"] += 1
+                return True
+            return False
+
+
+class MockAdminHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 so that clients can keep connections alive between requests
+    protocol_version = "HTTP/1.1"
+    state = None
+
+    def setup(self):
+        super().setup()
+        self.state.count("connections")
+
+    def log_message(self, format, *args):
+        pass  # Keep the console readable under load
+
+    def send_json(self, status, body):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def authorized(self):
+        """Issues a digest challenge unless the request already carries a digest Authorization header.
+        Authorized requests over the rate limit are rejected with HTTP 429 and a Retry-After header.
+        """
+        if self.headers.get("Authorization", "").startswith("Digest "):
+            if self.state.throttled():
+                self.send_response(429)
+                self.send_header("Retry-After", "1")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return False
+            return True
+        self.state.count("challenges")
+        self.send_response(401)
+        self.send_header("WWW-Authenticate",
+                         f'Digest realm="MMS Public API", nonce="{self.state.nonce}", qop="auth", algorithm=MD5')
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+        return False
+
+    def read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def do_GET(self):
+        if self.path == "/mock/counters":
+            # Unauthenticated helper endpoint for checking connection and challenge counts
+            with self.state.lock:
+                self.send_json(200, dict(self.state.counters))
+            return
+        self.state.count("requests")
+        if not self.authorized():
+            return
+        path, _, query = self.path.partition("?")
+        match = PROCESSOR_PATH.match(path)
+        if match:
+            time.sleep(self.state.latency)
+            with self.state.lock:
+                processor = self.state.processors.get(match.group(3))
+                if processor is None:
+                    self.send_json(404, {"error": 404, "detail": f"Processor {match.group(3)} not found"})
+                    return
+                body = dict(processor)
+                if processor["name"] in self.state.started_at:
+                    body["stats"] = self.state.stats(processor["name"])
+            self.send_json(200, body)
+            return
+        if not PROCESSORS_PATH.match(path):
+            self.send_json(404, {"error": 404, "detail": f"Unknown path {self.path}"})
+            return
+        # Paginate like the Admin API: itemsPerPage (default 100, max 500) and 1-based pageNum
+        params = parse_qs(query)
+        items_per_page = min(int(params.get("itemsPerPage", ["100"])[0]), 500)
+        page_num = int(params.get("pageNum", ["1"])[0])
+        time.sleep(self.state.latency)
+        with self.state.lock:
+            processors = list(self.state.processors.values())
+            start = (page_num - 1) * items_per_page
+            results = [dict(p) for p in processors[start:start + items_per_page]]
+        self.send_json(200, {"results": results, "totalCount": len(processors)})
+
+    def do_POST(self):
+        self.state.count("requests")
+        body = self.read_body()
+        if not self.authorized():
+            return
+        if CREATE_PROCESSOR_PATH.match(self.path):
+            definition = json.loads(body or b"{}")
+            time.sleep(self.state.latency)
+            with self.state.lock:
+                if definition.get("name") in self.state.processors:
+                    self.send_json(409, {"error": 409, "detail": f"Processor {definition.get('name')} already exists"})
+                    return
+                self.state.add_processor(definition["name"], definition.get("pipeline"))
+                body = dict(self.state.processors[definition["name"]])
+            self.send_json(200, body)
+            return
+        match = PROCESSOR_ACTION_PATH.match(self.path)
+        if not match:
+            self.send_json(404, {"error": 404, "detail": f"Unknown path {self.path}"})
+            return
+        name, action = match.group(3), match.group(4)
+        time.sleep(self.state.latency)
+        with self.state.lock:
+            processor = self.state.processors.get(name)
+            if processor is None:
+                self.send_json(404, {"error": 404, "detail": f"Processor {name} not found"})
+                return
+            processor["state"] = "STARTED" if action == "start" else "STOPPED"
+            if action == "start":
+                self.state.started_at[name] = time.monotonic()
+                self.state.stopped_at.pop(name, None)
+            elif name in self.state.started_at:
+                self.state.stopped_at[name] = time.monotonic()
+            if action == "start" and body:
+                processor["lastStartOptions"] = json.loads(body)
+        self.send_json(200, {})
+
+
+    def do_DELETE(self):
+        self.state.count("requests")
+        if not self.authorized():
+            return
+        match = PROCESSOR_PATH.match(self.path)
+        if not match:
+            self.send_json(404, {"error": 404, "detail": f"Unknown path {self.path}"})
+            return
+        time.sleep(self.state.latency)
+        with self.state.lock:
+            if self.state.processors.pop(match.group(3), None) is None:
+                self.send_json(404, {"error": 404, "detail": f"Processor {match.group(3)} not found"})
+                return
+        self.send_json(200, {})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local mock of the Atlas Admin API stream processor endpoints.")
+    parser.add_argument("--port", type=int, default=8080, help="Port to listen on. Defaults to 8080.")
+    parser.add_argument("--processors", type=int, default=100, help="Number of processors to create. Defaults to 100.")
+    parser.add_argument("--latency-ms", type=float, default=20,
+                        help="Artificial server latency per request in milliseconds. Defaults to 20.")
+    parser.add_argument("--rate-limit", type=int, default=0,
+                        help="Requests per second before answering HTTP 429 with Retry-After. Defaults to 0 (no limit).")
+    args = parser.parse_args()
+
+    MockAdminHandler.state = MockAdminState(args.processors, args.latency_ms, args.rate_limit)
+    server = ThreadingHTTPServer(("localhost", args.port), MockAdminHandler)
+    print(f"Mock Admin API listening on http://localhost:{args.port} with {args.processors} processors")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"Counters: {MockAdminHandler.state.counters}")
+
+
+if __name__ == "__main__":
+    main()
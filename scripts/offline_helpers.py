@@ -0,0 +1,87 @@
+import json
+import re
+from datetime import datetime
+
+# Small helpers shared by the offline tools in this repository: the benchmarks, advisors and load
+# generators here and under example_processors, quickstarts and ASP_tools.
+#
+# This module only uses the standard library, so a tool can import it (after adding this folder
+# to sys.path) without the requests/python-dotenv requirements of the Admin API scripts.
+
+
+def plain(value):
+    """Converts extended JSON values ({"$numberLong": "3751"}, {"$date": ...}) to plain Python values."""
+    if isinstance(value, dict):
+        if len(value) == 1:
+            key, inner = next(iter(value.items()))
+            if key in ("$numberLong", "$numberInt"):
+                return int(inner)
+            if key == "$numberDouble":
+                return float(inner)
+            if key == "$date":
+                return plain(inner)
+        return {key: plain(inner) for key, inner in value.items()}
+    if isinstance(value, list):
+        return [plain(inner) for inner in value]
+    return value
+
+
+def to_epoch(value):
+    """Returns epoch seconds for an ISO 8601 string or epoch milliseconds, else None."""
+    if isinstance(value, (int, float)):
+        return value / 1000
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+        except ValueError:
+            return None
+    return None
+
+
+def percentile(values, pct):
+    """Percentile of a list, pct from 0 to 100; 0.0 for an empty list.
+
+    Returns the sorted value at index round(pct / 100 * (n - 1)), i.e. the nearest order
+    statistic without interpolation.
+    """
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def js_to_json(text):
+    """Best-effort conversion of a mongosh object literal to JSON: bare and single-quoted keys and strings."""
+    text = re.sub(r"//[^\n]*", "", text)
+    text = re.sub(r"'([^'\\]*)'", lambda m: json.dumps(m.group(1)), text)
+    text = re.sub(r'([{,]\s*)(\$?[A-Za-z_]\w*)\s*:', r'\1"\2":', text)
+    return re.sub(r",(\s*[}\]])", r"\1", text)
+
+
+def load_pipeline(path):
+    """Returns the pipeline stages from a canonical JSON definition or an example_processors .js file.
+
+    In a .js file, every `name = { $stage: ... }` assignment is taken as a stage, in file order.
+    Assignments that cannot be converted (for example ones calling ISODate()) are skipped.
+    """
+    with open(path) as f:
+        text = f.read()
+    if path.endswith(".json"):
+        definition = json.loads(text)
+        return definition["pipeline"] if isinstance(definition, dict) else definition
+
+    stages = []
+    for match in re.finditer(r"^\s*(?:let |const |var )?\w+\s*=\s*\{", text, re.MULTILINE):
+        start = match.end() - 1
+        depth = 0
+        for end in range(start, len(text)):
+            depth += {"{": 1, "}": -1}.get(text[end], 0)
+            if depth == 0:
+                break
+        try:
+            stage = json.loads(js_to_json(text[start:end + 1]))
+        except ValueError:
+            continue
+        if len(stage) == 1 and next(iter(stage)).startswith("$"):
+            stages.append(stage)
+    return stages
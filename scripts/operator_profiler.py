@@ -0,0 +1,212 @@
+import requests
+import json
+import sys
+import time
+import os
+from dotenv import load_dotenv
+import argparse
+from atlas_admin import create_session, processor_url
+from offline_helpers import plain, to_epoch
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Finds the slow stage of a stream processor from its verbose operator stats, as described
+# in "Investigating Latency" in Performance_and_Sizing_Considerations.md.
+#
+# Snapshots of the stats are taken live from the Admin API, or loaded from JSON files saved
+# in mongosh with:
+#   fs.writeFileSync("snap1.json", EJSON.stringify(sp.PROCESSORNAME.stats({verbose: true})))
+# The counters in the stats are cumulative, so the report works on the differences between
+# consecutive snapshots: execution time, messages and DLQ messages per operator per interval.
+
+COUNTERS = ["inputMessageCount", "outputMessageCount", "dlqMessageCount", "executionTimeMillis"]
+BAR_WIDTH = 30
+
+
+def make_snapshot(document, taken_at=None):
+    """Returns (taken_at, operators) from a stats document, where operators maps stage key -> stats.
+
+    Stages are keyed by position and name ("3 HttpsOperator") so a pipeline with the same
+    operator twice keeps both. Without an explicit time, the latest latency window end is used.
+    """
+    document = plain(document)
+    stats = document.get("stats", document)
+    operators = {}
+    for index, operator in enumerate(stats.get("operatorStats") or []):
+        operators[f"{index} {operator.get('name', 'operator')}"] = operator
+    if taken_at is None:
+        taken_at = document.get("takenAt")
+    if taken_at is None:
+        ends = [to_epoch((op.get("latency") or {}).get("end")) for op in operators.values()]
+        ends = [end for end in ends if end is not None]
+        taken_at = max(ends) if ends else None
+    return taken_at, operators
+
+
+def load_snapshots(paths):
+    """Loads saved snapshot files (or every .json file in a directory), ordered by time."""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(os.path.join(path, name) for name in sorted(os.listdir(path)) if name.endswith(".json"))
+        else:
+            files.append(path)
+
+    snapshots = []
+    for path in files:
+        with open(path) as f:
+            taken_at, operators = make_snapshot(json.load(f))
+        if not operators:
+            print(f"Skipping {path}: no operatorStats (take the stats with verbose: true)")
+            continue
+        snapshots.append((taken_at if taken_at is not None else os.path.getmtime(path), operators))
+    return sorted(snapshots, key=lambda snapshot: snapshot[0])
+
+
+def take_snapshots(session, project_id, stream_instance, processor_name, interval, count, save_dir=None):
+    """Reads the processor's stats `count` times, `interval` seconds apart, optionally saving each one."""
+    snapshots = []
+    if save_dir:
+        os.makedirs(save_dir, exist_ok=True)
+    for i in range(count):
+        if i:
+            time.sleep(interval)
+        response = session.get(processor_url(project_id, stream_instance, processor_name))
+        response.raise_for_status()
+        document = response.json()
+        document["takenAt"] = time.time()
+        taken_at, operators = make_snapshot(document)
+        if not operators:
+            print(f"No operatorStats for '{processor_name}' (is it started?)")
+            continue
+        snapshots.append((taken_at, operators))
+        print(f"Snapshot {i + 1}/{count} of '{processor_name}': {len(operators)} operators")
+        if save_dir:
+            with open(os.path.join(save_dir, f"{processor_name}-{int(taken_at * 1000)}.json"), "w") as f:
+                json.dump(document, f)
+    return snapshots
+
+
+def counter_delta(current, previous, key):
+    """Difference of a cumulative counter; a counter that went down means the processor restarted."""
+    now = current.get(key) or 0
+    before = previous.get(key) or 0
+    return now - before if now >= before else now
+
+
+def interval_deltas(previous, current):
+    """Per-operator counter deltas, including the latency sum and count, between two snapshots."""
+    deltas = {}
+    for key, operator in current[1].items():
+        before = previous[1].get(key, {})
+        latency = operator.get("latency") or {}
+        latency_before = before.get("latency") or {}
+        delta = {counter: counter_delta(operator, before, counter) for counter in COUNTERS}
+        delta["latencyCount"] = counter_delta(latency, latency_before, "count")
+        delta["latencySum"] = counter_delta(latency, latency_before, "sum")
+        deltas[key] = delta
+    return deltas
+
+
+def bottleneck(snapshots):
+    """Returns (stage key, totals) for the stage with the most execution time over all snapshots."""
+    totals = {}
+    for previous, current in zip(snapshots, snapshots[1:]):
+        for key, delta in interval_deltas(previous, current).items():
+            total = totals.setdefault(key, dict.fromkeys(delta, 0))
+            for counter, value in delta.items():
+                total[counter] += value
+    if not totals:
+        return None, totals
+    return max(totals, key=lambda key: totals[key]["executionTimeMillis"]), totals
+
+
+def print_hot_path(snapshots):
+    """Prints each stage's share of execution time as a bar, like one level of a flame graph."""
+    slowest, totals = bottleneck(snapshots)
+    elapsed = snapshots[-1][0] - snapshots[0][0]
+    total_ms = sum(total["executionTimeMillis"] for total in totals.values()) or 1
+    last = snapshots[-1][1]
+
+    print(f"Hot path over {elapsed:.1f}s ({len(snapshots)} snapshots):")
+    print(f"{'Stage':<28} {'In/s':>9} {'Exec ms':>10} {'Share':>6} {'Mean us':>9} {'p50 us':>8} {'p99 us':>8} {'DLQ':>8}  ")
+    for key, total in totals.items():
+        share = total["executionTimeMillis"] / total_ms
+        latency = last.get(key, {}).get("latency") or {}
+        mean_us = total["latencySum"] / total["latencyCount"] if total["latencyCount"] else 0
+        bar = "#" * max(1 if share else 0, round(share * BAR_WIDTH))
+        print(f"{key:<28} {total['inputMessageCount'] / max(elapsed, 1e-9):>9,.0f} {total['executionTimeMillis']:>10,} "
+              f"{share * 100:>5.1f}% {mean_us:>9,.0f} {latency.get('p50', 0):>8,} {latency.get('p99', 0):>8,} "
+              f"{total['dlqMessageCount']:>8,}  {bar}")
+
+    if slowest is not None:
+        share = totals[slowest]["executionTimeMillis"] / total_ms * 100
+        print(f"Bottleneck: {slowest} ({share:.1f}% of execution time)")
+    dlq = [key for key, total in totals.items() if total["dlqMessageCount"]]
+    if dlq:
+        print(f"DLQ messages from: {', '.join(dlq)}")
+
+
+def print_p99_series(snapshots, columns):
+    """Prints p99 latency per stage for the last `columns` snapshots, oldest first."""
+    shown = snapshots[-columns:]
+    start = snapshots[0][0]
+    keys = list(snapshots[-1][1])
+    print("p99 latency per stage (microseconds):")
+    print(f"{'Stage':<28}" + "".join(f"{f'+{taken_at - start:.0f}s':>10}" for taken_at, _ in shown))
+    for key in keys:
+        cells = []
+        for _, operators in shown:
+            p99 = (operators.get(key, {}).get("latency") or {}).get("p99")
+            cells.append(f"{p99:>10,}" if p99 is not None else f"{'-':>10}")
+        print(f"{key:<28}" + "".join(cells))
+
+
+def main():
+    # Argument parsing
+    parser = argparse.ArgumentParser(description="Profile stream processor operators from verbose stats snapshots.")
+    parser.add_argument("snapshots", nargs="*", help="Saved stats JSON files or directories of them. Omit to read live with --processor.")
+    parser.add_argument("--processor", help="Name of the processor to take live snapshots of through the Admin API.")
+    parser.add_argument("--interval", type=float, default=10, help="Seconds between live snapshots. Defaults to 10.")
+    parser.add_argument("--count", type=int, default=6, help="Number of live snapshots. Defaults to 6.")
+    parser.add_argument("--save-dir", help="Directory to save live snapshots in, for profiling them again later.")
+    parser.add_argument("--columns", type=int, default=12, help="Snapshots shown in the p99 time series. Defaults to 12.")
+    args = parser.parse_args()
+
+    if args.snapshots:
+        snapshots = load_snapshots(args.snapshots)
+    elif args.processor:
+        # Retrieve configuration from environment variables
+        username = os.getenv("ATLAS_USERNAME")
+        api_key = os.getenv("ATLAS_API_KEY")
+        project_id = os.getenv("ATLAS_PROJECT_ID")
+        stream_instance = os.getenv("ATLAS_STREAM_INSTANCE")
+
+        # Validate that all required environment variables are set
+        if not all([username, api_key, project_id, stream_instance]):
+            print("Error: Missing required environment variables.")
+            print("Please set ATLAS_USERNAME, ATLAS_API_KEY, ATLAS_PROJECT_ID, and ATLAS_STREAM_INSTANCE.")
+            sys.exit(1)
+
+        session = create_session(username, api_key)
+        try:
+            snapshots = take_snapshots(session, project_id, stream_instance, args.processor,
+                                       args.interval, args.count, args.save_dir)
+        except requests.exceptions.RequestException as e:
+            print(f"Failed to read stats for '{args.processor}': {e}")
+            sys.exit(1)
+    else:
+        parser.error("give saved snapshot files or --processor")
+
+    if len(snapshots) < 2:
+        print("At least two snapshots with operatorStats are needed to compute deltas.")
+        sys.exit(1)
+
+    print_hot_path(snapshots)
+    print()
+    print_p99_series(snapshots, args.columns)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+import heapq
+import math
+import random
+import sys
+import argparse
+from offline_helpers import load_pipeline, percentile
+from operator_profiler import bottleneck, load_snapshots
+
+# Proposes `parallelism` values for the stages of a processor that support it, from the
+# processor definition and two or more verbose stats snapshots (see operator_profiler.py).
+#
+# Each stage is modelled as a queue with `parallelism` workers:
+#   * service time per message = mean operator latency observed at the current parallelism
+#   * visit ratio = messages reaching the stage / messages read by $source (DLQ and $match
+#     stages in front of it lower the ratio)
+#   * capacity in source messages/sec = parallelism / (service time * visit ratio)
+# The throughput of the processor is the capacity of its slowest stage. Parallelism is
+# handed out one unit at a time to the parallel stage that is the current bottleneck, until
+# the cap is reached or the bottleneck is a stage that cannot be parallelized.
+#
+# The discrete-event simulator replays the same model with random service times, so a
+# proposed (or any --what-if) allocation can be checked offline before redeploying.
+
+# Stages that accept a parallelism value, and the operator names they show up as in the stats
+PARALLEL_STAGES = {"$merge": "merge", "$lookup": "lookup", "$https": "https"}
+# Standard normal quantile for p99, used to fit a lognormal service time to p50 and p99
+Z99 = 2.326
+
+
+def build_model(pipeline, totals):
+    """Matches parallel pipeline stages to operator stats and returns one model entry per operator.
+
+    Each entry has the stage key, service time (seconds), visit ratio, current parallelism
+    and the pipeline stage name if the operator can be parallelized.
+    """
+    parallel = [(next(iter(stage)), stage[next(iter(stage))]) for stage in pipeline
+                if next(iter(stage)) in PARALLEL_STAGES]
+    source_count = next(iter(totals.values()))["inputMessageCount"] or 1
+    model = []
+    for key, total in totals.items():
+        operator_name = key.split(" ", 1)[1].lower()
+        stage_name = None
+        parallelism = 1
+        if parallel and PARALLEL_STAGES[parallel[0][0]] in operator_name:
+            stage_name, spec = parallel.pop(0)
+            parallelism = int(spec.get("parallelism", 1)) if isinstance(spec, dict) else 1
+        service_time = total["latencySum"] / total["latencyCount"] / 1e6 if total["latencyCount"] else 0
+        model.append({
+            "key": key,
+            "stage": stage_name,
+            "service_time": service_time,
+            "visit_ratio": total["inputMessageCount"] / source_count,
+            "parallelism": parallelism,
+        })
+    return model
+
+
+def capacity(entry, parallelism=None):
+    """Source messages/sec the stage can keep up with."""
+    work = entry["service_time"] * entry["visit_ratio"]
+    return (parallelism or entry["parallelism"]) / work if work else math.inf
+
+
+def erlang_c_wait(arrival_rate, service_time, servers):
+    """Mean queueing delay (seconds) of an M/M/c queue, or inf if it is overloaded."""
+    if arrival_rate <= 0 or service_time <= 0:
+        return 0.0
+    load = arrival_rate * service_time
+    if load >= servers:
+        return math.inf
+    term = 1.0
+    total = 1.0
+    for k in range(1, servers):
+        term *= load / k
+        total += term
+    term *= load / servers
+    waiting = term / (1 - load / servers)
+    probability_wait = waiting / (total + waiting)
+    return probability_wait * service_time / (servers - load)
+
+
+def allocate(model, max_parallelism):
+    """Gives each parallel stage 1 worker, then adds workers to the bottleneck stage while the cap allows.
+
+    Returns {stage key: parallelism} and the reason allocation stopped.
+    """
+    allocation = {entry["key"]: 1 for entry in model if entry["stage"]}
+    used = len(allocation)
+    if used > max_parallelism:
+        return allocation, f"the {used} parallel stages already need more than the cap of {max_parallelism}"
+    while True:
+        slowest = min(model, key=lambda entry: capacity(entry, allocation.get(entry["key"], 1)))
+        if not slowest["stage"]:
+            return allocation, f"the bottleneck {slowest['key']} cannot be parallelized"
+        if used >= max_parallelism:
+            return allocation, f"the cap of {max_parallelism} is used up"
+        allocation[slowest["key"]] += 1
+        used += 1
+
+
+def simulate(model, allocation, arrival_rate, messages, seed=None, spread=None):
+    """Discrete-event simulation of the pipeline as a chain of multi-worker FIFO queues.
+
+    Messages arrive as a Poisson stream at `arrival_rate` per second. Service times are
+    lognormal with the modelled mean; `spread` maps stage key -> p99/p50 ratio (default 3).
+    A message leaves the pipeline early (filtered or sent to the DLQ) with the probability
+    implied by the drop in visit ratio between stages.
+
+    Returns (messages/sec reaching the end of the pipeline, end-to-end latencies in seconds,
+    utilization per stage).
+    """
+    rng = random.Random(seed)
+    stages = len(model)
+    workers = [allocation.get(entry["key"], 1) for entry in model]
+    sigmas = [math.log(max((spread or {}).get(entry["key"], 3.0), 1.0001)) / Z99 for entry in model]
+    mus = [math.log(entry["service_time"]) - sigma ** 2 / 2 if entry["service_time"] else None
+           for entry, sigma in zip(model, sigmas)]
+    continue_probability = [1.0] + [
+        min(1.0, model[i]["visit_ratio"] / model[i - 1]["visit_ratio"]) if model[i - 1]["visit_ratio"] else 0.0
+        for i in range(1, stages)
+    ]
+    busy = [0] * stages
+    busy_time = [0.0] * stages
+    waiting = [[] for _ in range(stages)]  # FIFO queues, kept as lists with a read index
+    heads = [0] * stages
+    events = []  # (time, sequence, stage, arrival time of the message)
+    sequence = 0
+    latencies = []
+    clock = 0.0
+
+    def service(stage):
+        return rng.lognormvariate(mus[stage], sigmas[stage]) if mus[stage] is not None else 0.0
+
+    def enter(stage, now, arrived_at):
+        nonlocal sequence
+        if rng.random() >= continue_probability[stage]:
+            return
+        if busy[stage] < workers[stage]:
+            busy[stage] += 1
+            duration = service(stage)
+            busy_time[stage] += duration
+            sequence += 1
+            heapq.heappush(events, (now + duration, sequence, stage, arrived_at))
+        else:
+            waiting[stage].append(arrived_at)
+
+    arrivals = 0
+    next_arrival = rng.expovariate(arrival_rate)
+    while arrivals < messages or events:
+        if arrivals < messages and (not events or next_arrival <= events[0][0]):
+            clock = next_arrival
+            arrivals += 1
+            enter(0, clock, clock)
+            next_arrival = clock + rng.expovariate(arrival_rate)
+            continue
+        clock, _, stage, arrived_at = heapq.heappop(events)
+        busy[stage] -= 1
+        if heads[stage] < len(waiting[stage]):
+            queued = waiting[stage][heads[stage]]
+            heads[stage] += 1
+            busy[stage] += 1
+            duration = service(stage)
+            busy_time[stage] += duration
+            sequence += 1
+            heapq.heappush(events, (clock + duration, sequence, stage, queued))
+        if stage + 1 < stages:
+            enter(stage + 1, clock, arrived_at)
+        else:
+            latencies.append(clock - arrived_at)
+
+    utilization = [busy_time[i] / (workers[i] * clock) if clock else 0.0 for i in range(stages)]
+    return len(latencies) / clock if clock else 0.0, latencies, utilization
+
+
+def print_model(model, allocation, arrival_rate):
+    print(f"{'Stage':<28} {'Service us':>10} {'Visits':>7} {'Current':>8} {'Proposed':>9} "
+          f"{'Capacity/s':>11} {'Util':>6} {'Queue ms':>9}")
+    for entry in model:
+        proposed = allocation.get(entry["key"], 1)
+        stage_rate = arrival_rate * entry["visit_ratio"]
+        utilization = stage_rate * entry["service_time"] / proposed
+        wait = erlang_c_wait(stage_rate, entry["service_time"], proposed)
+        print(f"{entry['key']:<28} {entry['service_time'] * 1e6:>10,.0f} {entry['visit_ratio']:>7.2f} "
+              f"{entry['parallelism'] if entry['stage'] else '-':>8} {proposed if entry['stage'] else '-':>9} "
+              f"{capacity(entry, proposed):>11,.0f} {utilization * 100:>5.0f}% "
+              f"{'overload' if math.isinf(wait) else f'{wait * 1000:.2f}':>9}")
+
+
+def main():
+    # Argument parsing
+    parser = argparse.ArgumentParser(description="Propose $merge/$lookup/$https parallelism from verbose processor stats.")
+    parser.add_argument("pipeline", help="Processor definition: canonical JSON (quickstarts/*.json) or an example_processors .js file.")
+    parser.add_argument("snapshots", nargs="+", help="Saved verbose stats JSON files or directories of them (see operator_profiler.py).")
+    parser.add_argument("--max-parallelism", type=int, required=True,
+                        help="Cumulative parallelism allowed across all stages for your tier (see the Atlas Stream Processing documentation).")
+    parser.add_argument("--rate", type=float,
+                        help="Source messages/sec to evaluate queueing at. Defaults to the rate observed in the snapshots.")
+    parser.add_argument("--simulate", type=int, default=0, metavar="MESSAGES",
+                        help="Check the current and proposed allocations with a discrete-event simulation of this many messages.")
+    parser.add_argument("--what-if", action="append", default=[], metavar="STAGE=N",
+                        help="Also simulate this parallelism for a stage, e.g. --what-if '2 LookUpOperator=6'. Repeatable.")
+    parser.add_argument("--seed", type=int, help="Random seed for the simulation.")
+    args = parser.parse_args()
+
+    snapshots = load_snapshots(args.snapshots)
+    if len(snapshots) < 2:
+        print("At least two snapshots with operatorStats are needed to compute deltas.")
+        sys.exit(1)
+    _, totals = bottleneck(snapshots)
+    model = build_model(load_pipeline(args.pipeline), totals)
+    if not any(entry["stage"] for entry in model):
+        print(f"No {', '.join(PARALLEL_STAGES)} stage in {args.pipeline} matches an operator in the stats.")
+        sys.exit(1)
+
+    elapsed = snapshots[-1][0] - snapshots[0][0]
+    observed_rate = next(iter(totals.values()))["inputMessageCount"] / elapsed if elapsed > 0 else 0
+    arrival_rate = args.rate or observed_rate
+    current = {entry["key"]: entry["parallelism"] for entry in model if entry["stage"]}
+    allocation, reason = allocate(model, args.max_parallelism)
+
+    throughput_now = min(capacity(entry, current.get(entry["key"], 1)) for entry in model)
+    throughput_proposed = min(capacity(entry, allocation.get(entry["key"], 1)) for entry in model)
+    print(f"Observed source rate: {observed_rate:,.0f} msgs/sec over {elapsed:.0f}s; evaluating at {arrival_rate:,.0f} msgs/sec")
+    print_model(model, allocation, arrival_rate)
+    print(f"Estimated max throughput: {throughput_now:,.0f} msgs/sec now, {throughput_proposed:,.0f} msgs/sec proposed "
+          f"(stopped because {reason})")
+    for entry in model:
+        if entry["stage"]:
+            print(f"  {entry['stage']} ({entry['key']}): parallelism {entry['parallelism']} -> {allocation[entry['key']]}")
+
+    if args.simulate or args.what_if:
+        scenarios = [("current", current), ("proposed", allocation)]
+        for what_if in args.what_if:
+            key, _, value = what_if.rpartition("=")
+            if key not in current:
+                parser.error(f"--what-if stage must be one of: {', '.join(current)}")
+            if not value.isdigit() or int(value) < 1:
+                parser.error(f"--what-if parallelism must be a positive integer, got {what_if!r}")
+            scenarios.append((what_if, dict(current, **{key: int(value)})))
+        if arrival_rate <= 0:
+            print("The snapshots show no source messages, so there is no rate to simulate at; pass --rate.")
+            sys.exit(1)
+        spread = {}
+        for key, operator in snapshots[-1][1].items():
+            latency = operator.get("latency") or {}
+            if latency.get("p50"):
+                spread[key] = latency.get("p99", 0) / latency["p50"]
+
+        print()
+        print(f"Simulating {args.simulate or 20000:,} messages at {arrival_rate:,.0f} msgs/sec:")
+        for name, scenario in scenarios:
+            throughput, latencies, utilization = simulate(model, scenario, arrival_rate, args.simulate or 20000,
+                                                          seed=args.seed, spread=spread)
+            if not latencies:
+                print(f"  {name:<24} no message reached the end of the pipeline")
+                continue
+            busiest = max(range(len(model)), key=lambda i: utilization[i])
+            print(f"  {name:<24} sink rate={throughput:,.0f} msgs/sec "
+                  f"p50={percentile(latencies, 50) * 1000:.2f} ms p99={percentile(latencies, 99) * 1000:.2f} ms "
+                  f"busiest={model[busiest]['key']} ({utilization[busiest] * 100:.0f}%)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+import argparse
+import hashlib
+import json
+import math
+import sys
+from collections import Counter
+from parallelism_advisor import load_pipeline, percentile
+
+# Shows whether the `partitionBy` key of a parallel stage ($lookup in
+# example_processors/lookup/parallelPartitionBy.js) spreads work over its lanes, before it
+# goes to production. Events with the same key are processed in order on one lane, so a key
+# with share p of the events caps the speedup of any parallelism at 1 / p.
+#
+#   1. evaluates the stage's partitionBy field path on a sample of source documents (JSONL
+#      file, generator output on stdin, or the $source documents in the pipeline)
+#   2. counts the keys exactly, or with a count-min sketch plus a heavy-hitter list when the
+#      sample has more than --exact-limit distinct keys
+#   3. hashes the keys onto 1..--max-parallelism lanes and reports the busiest lane's share,
+#      the speedup over one lane and, with --service-ms, per-lane utilization at --rate and
+#      the queueing delay from replaying the sample through the lanes
+#   4. recommends the parallelism past which more lanes stop paying off and, if a few hot
+#      keys cap the speedup, a salted partitionBy expression that splits only those keys
+#
+# Lanes are picked with a stable hash of the key. ASP's own key-to-lane mapping may differ, so
+# with only a handful of keys, which of them collide on a lane is indicative only.
+#
+#   python3 partition_skew.py ../example_processors/lookup/parallelPartitionBy.js --sample events.jsonl
+#   python3 ../example_processors/joinlatedatablog/sensorGenerator.py --generate /dev/stdout | \
+#       python3 partition_skew.py pipeline.json --sample - --partition-by '$sensorIdGroup' --service-ms 2 --rate 3000
+
+# A parallelism is recommended once it reaches this share of the best speedup in range
+GOOD_ENOUGH = 0.9
+
+
+def key_text(value):
+    return json.dumps(value, sort_keys=True, default=str)
+
+
+def stable_hash(text, seed=0):
+    return int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8, salt=seed.to_bytes(8, "little")).digest(), "little")
+
+
+class CountMinSketch:
+    """Approximate counts in width x depth counters; estimates never undercount."""
+
+    def __init__(self, width, depth):
+        self.width = width
+        self.rows = [[0] * width for _ in range(depth)]
+
+    def add(self, key):
+        estimate = None
+        for seed, row in enumerate(self.rows):
+            cell = stable_hash(key, seed) % self.width
+            row[cell] += 1
+            estimate = row[cell] if estimate is None else min(estimate, row[cell])
+        return estimate
+
+
+class HeavyHitters:
+    """Keeps the keys with the largest count-min estimates, for samples too large to count exactly."""
+
+    def __init__(self, k, width, depth):
+        self.k = k
+        self.sketch = CountMinSketch(width, depth)
+        self.candidates = {}
+
+    def add(self, key):
+        estimate = self.sketch.add(key)
+        if key in self.candidates or len(self.candidates) < 4 * self.k:
+            self.candidates[key] = estimate
+            return
+        smallest = min(self.candidates.values())
+        if estimate > smallest:
+            self.candidates[key] = estimate
+            # Drop the weaker half at once, so the min() above runs rarely
+            keep = sorted(self.candidates.items(), key=lambda item: item[1], reverse=True)[:2 * self.k]
+            self.candidates = dict(keep)
+
+    def top(self):
+        return sorted(self.candidates.items(), key=lambda item: item[1], reverse=True)[:self.k]
+
+
+def partition_field(pipeline, override):
+    """Returns (stage name, field path) of the first stage with partitionBy, or of --partition-by."""
+    expression = override
+    stage_name = "--partition-by"
+    if expression is None:
+        for stage in pipeline:
+            name, spec = next(iter(stage.items()))
+            if isinstance(spec, dict) and "partitionBy" in spec:
+                expression, stage_name = spec["partitionBy"], name
+                break
+    if expression is None:
+        raise ValueError("no stage with partitionBy in the pipeline; pass --partition-by")
+    if not (isinstance(expression, str) and expression.startswith("$") and not expression.startswith("$$")):
+        raise ValueError(f"only field paths such as \"$device\" are supported as partitionBy, got {json.dumps(expression)}")
+    return stage_name, expression[1:]
+
+
+def get_path(document, path):
+    value = document
+    for part in path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+    return value
+
+
+def iter_sample(path, pipeline):
+    if path is None:
+        source = pipeline[0].get("$source", {}) if pipeline else {}
+        if "documents" not in source:
+            raise ValueError("no --sample given and the pipeline's $source has no documents")
+        yield from source["documents"]
+        return
+    try:
+        from bson import json_util
+        loads = json_util.loads
+    except ImportError:
+        loads = json.loads
+    with (sys.stdin if path == "-" else open(path, encoding="utf-8")) as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith("{"):  # Skips the status lines some generators print
+                yield loads(line)
+
+
+def count_keys(documents, field, args):
+    """Returns (total, [(key, count)] most common first, exact flag, key order or None)."""
+    exact = Counter()
+    order = []
+    total = 0
+    heavy = None
+    for document in documents:
+        key = key_text(get_path(document, field))
+        total += 1
+        if heavy is None:
+            exact[key] += 1
+            order.append(key)
+            if len(exact) > args.exact_limit:
+                # Too many distinct keys to keep: switch to the sketch and drop the exact state
+                heavy = HeavyHitters(args.top, args.sketch_width, args.sketch_depth)
+                for seen, count in exact.items():
+                    for _ in range(count):
+                        heavy.add(seen)
+                exact, order = None, None
+        else:
+            heavy.add(key)
+    if heavy is None:
+        return total, exact.most_common(), True, order
+    return total, heavy.top(), False, None
+
+
+def lane_loads(counts, total, exact, lanes, salts=None):
+    """Events per lane when keys are hashed onto `lanes` lanes; salted keys are split evenly over their salts."""
+    loads = [0.0] * lanes
+    assigned = 0
+    for key, count in counts:
+        pieces = (salts or {}).get(key, 1)
+        for salt in range(pieces):
+            loads[stable_hash(f"{key}#{salt}" if pieces > 1 else key) % lanes] += count / pieces
+        assigned += count
+    if not exact:
+        # Keys below the heavy hitters are many and small: spread their remaining mass evenly
+        for lane in range(lanes):
+            loads[lane] += max(0, total - assigned) / lanes
+    return loads
+
+
+def replay(order, lanes, rate, service_time):
+    """Feeds the sample in order at `rate` through FIFO lanes; returns the queueing delays."""
+    lane_of = {}
+    free_at = [0.0] * lanes
+    waits = []
+    for i, key in enumerate(order):
+        lane = lane_of.setdefault(key, stable_hash(key) % lanes)
+        arrival = i / rate
+        start = max(arrival, free_at[lane])
+        free_at[lane] = start + service_time
+        waits.append(start - arrival)
+    return waits
+
+
+def salted_expression(field, hot_keys, salts, salt_field):
+    """A partitionBy expression that splits only the hot keys into `salts` sub-keys."""
+    salted = {"$concat": [{"$toString": f"${field}"}, "#",
+                          {"$toString": {"$mod": [{"$abs": {"$toHashedIndexKey": f"${salt_field}"}}, salts]}}]}
+    return {"$cond": [{"$in": [f"${field}", [json.loads(key) for key in hot_keys]]}, salted, f"${field}"]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyze partitionBy key skew and lane spread for parallel stages.")
+    parser.add_argument("pipeline", help="Processor definition: canonical JSON or an example_processors .js file.")
+    parser.add_argument("--sample", help="JSONL sample of source documents, or - for stdin. Defaults to the $source documents.")
+    parser.add_argument("--partition-by", help="Field path to analyze instead of the pipeline's partitionBy, e.g. '$device'.")
+    parser.add_argument("--max-parallelism", type=int, default=16, help="Largest parallelism to evaluate. Defaults to 16.")
+    parser.add_argument("--top", type=int, default=10, help="Heavy hitters to show. Defaults to 10.")
+    parser.add_argument("--exact-limit", type=int, default=100000,
+                        help="Distinct keys counted exactly before switching to the count-min sketch. Defaults to 100000.")
+    parser.add_argument("--sketch-width", type=int, default=2048, help="Count-min sketch width. Defaults to 2048.")
+    parser.add_argument("--sketch-depth", type=int, default=4, help="Count-min sketch depth. Defaults to 4.")
+    parser.add_argument("--service-ms", type=float, help="Per-event time in the stage (e.g. $lookup latency), for utilization.")
+    parser.add_argument("--rate", type=float, help="Events/sec into the stage, for utilization. Needs --service-ms.")
+    parser.add_argument("--salt-field", default="_id", help="Field that varies per event, used to salt hot keys. Defaults to _id.")
+    args = parser.parse_args()
+
+    pipeline = load_pipeline(args.pipeline)
+    try:
+        stage_name, field = partition_field(pipeline, args.partition_by)
+        total, counts, exact, order = count_keys(iter_sample(args.sample, pipeline), field, args)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    if not total:
+        print("The sample has no documents.")
+        sys.exit(1)
+
+    print(f"{stage_name} partitionBy ${field}: {total:,} events, "
+          + (f"{len(counts):,} distinct keys" if exact else f"heavy hitters from a {args.sketch_depth}x{args.sketch_width} "
+             f"count-min sketch (counts may be up to ~{math.e / args.sketch_width * total:,.0f} high)"))
+    print("-------------------------------------------------")
+    print(f"{'Key':<30} {'Events':>10} {'Share':>7}")
+    for key, count in counts[:args.top]:
+        share = count / total
+        print(f"{key[:30]:<30} {count:>10,} {share * 100:>6.1f}% {'#' * int(share * 50)}")
+    missing = dict(counts).get("null", 0)
+    if missing:
+        print(f"{missing:,} events have no ${field}; they all share one lane")
+
+    # Lane spread for each parallelism
+    print("-------------------------------------------------")
+    print(f"{'Lanes':>5} {'Busiest lane':>13} {'Speedup':>8} {'Efficiency':>11}" + (f" {'Max util':>9} {'p99 wait ms':>12}"
+                                                                                    if args.service_ms and args.rate else ""))
+    speedups = {}
+    for lanes in range(1, args.max_parallelism + 1):
+        loads = lane_loads(counts, total, exact, lanes)
+        speedups[lanes] = total / max(loads)
+        line = f"{lanes:>5} {max(loads) / total * 100:>12.1f}% {speedups[lanes]:>7.2f}x {speedups[lanes] / lanes * 100:>10.0f}%"
+        if args.service_ms and args.rate:
+            utilization = max(loads) / total * args.rate * args.service_ms / 1000
+            wait = "-"
+            if order is not None:
+                wait = f"{percentile(replay(order, lanes, args.rate, args.service_ms / 1000), 99) * 1000:.1f}"
+            line += f" {utilization * 100:>8.0f}% {wait:>12}"
+        print(line)
+
+    best = max(speedups.values())
+    recommended = min(lanes for lanes, speedup in speedups.items() if speedup >= GOOD_ENOUGH * best)
+    top_share = counts[0][1] / total
+    print("-------------------------------------------------")
+    print(f"Recommended parallelism: {recommended} ({speedups[recommended]:.2f}x of a possible {best:.2f}x; "
+          f"the hottest key alone caps the speedup at {1 / top_share:.1f}x)")
+    if args.service_ms and args.rate:
+        needed = math.ceil(args.rate * args.service_ms / 1000 / 0.7)
+        if needed > speedups[recommended]:
+            print(f"At {args.rate:,.0f} events/sec and {args.service_ms:g} ms per event the stage needs a "
+                  f"{needed}x speedup to stay below 70% utilization")
+
+    # Salting: split every key that holds more than one lane's fair share at the largest parallelism
+    lanes = args.max_parallelism
+    hot = [(key, count) for key, count in counts if count / total > 1 / lanes]
+    if hot and speedups[lanes] < GOOD_ENOUGH * lanes:
+        salts = {key: math.ceil(count / total * lanes) for key, count in hot}
+        salted = total / max(lane_loads(counts, total, exact, lanes, salts))
+        print(f"{len(hot)} hot key(s) hold more than 1/{lanes} of the events. Splitting them into "
+              f"{max(salts.values())} salted sub-keys raises the speedup at parallelism {lanes} from "
+              f"{speedups[lanes]:.2f}x to {salted:.2f}x. Events of a hot key are then no longer processed in order.")
+        print(f"partitionBy (salted by ${args.salt_field}):", json.dumps(salted_expression(field, [key for key, _ in hot], max(salts.values()), args.salt_field)))
+
+
+if __name__ == "__main__":
+    main()
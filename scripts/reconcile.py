@@ -0,0 +1,159 @@
+import requests
+import json
+import random
+import sys
+import time
+import os
+from dotenv import load_dotenv
+import argparse
+from atlas_admin import ProcessorInventory, create_session, run_fleet_action
+from offline_helpers import percentile
+from startAll import start_stream_processor
+from stopAll import stop_stream_processor
+
+# Load environment variables from .env file
+load_dotenv()
+
+VALID_STATES = ("STARTED", "STOPPED")
+
+
+def load_desired_state(path):
+    """Reads a desired-state file and returns {name: {"state": ..., "startAtOperationTime": ...}}.
+
+    The file is a JSON object keyed by processor name. A value is either the target
+    state as a string, or an object with a `state` and an optional
+    `startAtOperationTime` (ISO 8601, used when the processor has to be started):
+
+        {
+            "solar_rollup": "STARTED",
+            "kafka_tail": "STOPPED",
+            "orders_cs": {"state": "STARTED", "startAtOperationTime": "2025-01-21T19:25:18.262Z"}
+        }
+
+    Processors that are not listed are left alone.
+    """
+    with open(path) as f:
+        raw = json.load(f)
+
+    desired = {}
+    for name, value in raw.items():
+        spec = {"state": value} if isinstance(value, str) else dict(value)
+        if spec.get("state") not in VALID_STATES:
+            raise ValueError(f"Processor '{name}' has state {spec.get('state')!r}, expected one of {VALID_STATES}")
+        desired[name] = spec
+    return desired
+
+
+def retry_after_seconds(error, default):
+    """Returns the Retry-After delay of an HTTP 429 error, or `default` for any other error."""
+    response = getattr(error, "response", None)
+    if response is not None and response.status_code == 429:
+        try:
+            return float(response.headers.get("Retry-After", default))
+        except ValueError:
+            return default
+    return default
+
+
+def main():
+    # Retrieve configuration from environment variables
+    username = os.getenv("ATLAS_USERNAME")
+    api_key = os.getenv("ATLAS_API_KEY")
+    project_id = os.getenv("ATLAS_PROJECT_ID")
+    stream_instance = os.getenv("ATLAS_STREAM_INSTANCE")
+
+    # Validate that all required environment variables are set
+    if not all([username, api_key, project_id, stream_instance]):
+        print("Error: Missing required environment variables.")
+        print("Please set ATLAS_USERNAME, ATLAS_API_KEY, ATLAS_PROJECT_ID, and ATLAS_STREAM_INSTANCE.")
+        sys.exit(1)
+
+    # Argument parsing
+    parser = argparse.ArgumentParser(description="Converge MongoDB Atlas Stream Processors to a desired state.")
+    parser.add_argument("desired_state", help="JSON file mapping processor name to STARTED/STOPPED (see load_desired_state).")
+    parser.add_argument("--concurrency", type=int, default=4,
+                        help="Number of start/stop calls in flight at once. Defaults to 4.")
+    parser.add_argument("--min-interval", type=float, default=2,
+                        help="Seconds between checks while the workspace is converging. Defaults to 2.")
+    parser.add_argument("--max-interval", type=float, default=60,
+                        help="Upper bound for the check interval once the workspace is converged. Defaults to 60.")
+    parser.add_argument("--jitter", type=float, default=0.2,
+                        help="Random +/- fraction applied to every interval so several reconcilers do not poll in lockstep. Defaults to 0.2.")
+    parser.add_argument("--once", action="store_true",
+                        help="Exit as soon as the workspace has converged instead of watching for drift.")
+    args = parser.parse_args()
+
+    desired = load_desired_state(args.desired_state)
+    session = create_session(username, api_key, pool_size=args.concurrency)
+    inventory = ProcessorInventory(session, project_id, stream_instance)
+
+    # When each processor was first seen out of its desired state, for convergence latency
+    diverged_since = {}
+    interval = args.min_interval
+    tick = 0
+
+    while True:
+        tick += 1
+        tick_start = time.monotonic()
+
+        try:
+            inventory.poll()
+        except (requests.exceptions.RequestException, ValueError, KeyError) as e:
+            # Back off on errors, and wait at least as long as the server asked on HTTP 429
+            interval = min(args.max_interval, max(interval * 2, retry_after_seconds(e, interval)))
+            print(f"tick={tick} error listing processors: {e}; retrying in {interval:.1f}s")
+            time.sleep(interval)
+            continue
+
+        # Record convergence for processors that now match their desired state
+        converged_latencies = []
+        for name in list(diverged_since):
+            if inventory.states.get(name) == desired[name]["state"]:
+                converged_latencies.append(tick_start - diverged_since.pop(name))
+
+        missing = [name for name in desired if name not in inventory.states]
+        divergent = [name for name, spec in desired.items()
+                     if name in inventory.states and inventory.states[name] != spec["state"]]
+        for name in divergent:
+            diverged_since.setdefault(name, tick_start)
+
+        # Only call the API for processors that are actually out of their desired state
+        failed = 0
+        if divergent:
+            def converge(name):
+                spec = desired[name]
+                if spec["state"] == "STARTED":
+                    return start_stream_processor(username, api_key, project_id, stream_instance, name,
+                                                  spec.get("startAtOperationTime"), session=session)
+                return stop_stream_processor(username, api_key, project_id, stream_instance, name, session=session)
+
+            for name, succeeded, _ in run_fleet_action(converge, divergent, args.concurrency):
+                if not succeeded:
+                    failed += 1
+
+        # Adaptive backoff: poll quickly while converging, slow down while nothing changes
+        if divergent:
+            interval = args.min_interval
+        else:
+            interval = min(args.max_interval, interval * 2)
+        if failed:
+            interval = min(args.max_interval, interval * 2)
+        sleep_for = interval * random.uniform(1 - args.jitter, 1 + args.jitter)
+
+        metrics = (f"tick={tick} desired={len(desired)} divergent={len(divergent)} "
+                   f"missing={len(missing)} failed={failed}")
+        if converged_latencies:
+            metrics += (f" converged={len(converged_latencies)}"
+                        f" convergence_p50={percentile(converged_latencies, 50):.1f}s"
+                        f" convergence_max={max(converged_latencies):.1f}s")
+        print(f"{metrics} next_check={sleep_for:.1f}s")
+        if missing:
+            print(f"Processors in the desired state file but not in the workspace: {missing}")
+
+        if args.once and not divergent and not diverged_since:
+            break
+        time.sleep(sleep_for)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,45 +1,39 @@
 import requests
-from requests.auth import HTTPDigestAuth
 import json
 import sys
 import os
 from dotenv import load_dotenv
 import argparse
+from atlas_admin import create_session, iter_stream_processors, processor_url, run_fleet_action
 
 # Load environment variables from .env file
 load_dotenv()
 
-def get_atlas_stream_processors(username, api_key, project_id, stream_instance):
-    """Retrieves stream processors and returns a list of (name, state) tuples."""
-    url = f"https://cloud.mongodb.com/api/atlas/v2/groups/{project_id}/streams/{stream_instance}/processors"
-    headers = {
-        "Accept": "application/vnd.atlas.2024-05-30+json",
-        "Content-Type": "application/json",
-    }
-    auth = HTTPDigestAuth(username, api_key)
+def get_atlas_stream_processors(username, api_key, project_id, stream_instance, session=None):
+    """Retrieves stream processors and returns a list of (name, state) tuples.
+
+    Every page of the Admin API listing is read, so large workspaces are not truncated.
+    """
+    session = session or create_session(username, api_key)
 
     try:
-        response = requests.get(url, headers=headers, auth=auth)
-        response.raise_for_status()
-        data = response.json()
         # Extract processor name and state
-        return [(processor['name'], processor['state']) for processor in data['results']]
+        return [(processor['name'], processor['state'])
+                for processor in iter_stream_processors(session, project_id, stream_instance)]
     except requests.exceptions.RequestException as e:
         print(f"An error occurred during the request: {e}")
-        if 'response' in locals():  # Check if response exists
-            print(f"Response content: {response.text}")
+        if e.response is not None:  # Check if response exists
+            print(f"Response content: {e.response.text}")
         return None
     except (ValueError, KeyError) as e:
         print(f"Error processing JSON response: {e}")
-        if 'response' in locals():
-            print(f"Response content: {response.text}")
         return None
     except Exception as e:
         print(f"Unexpected Error {e}")
         return None
 
 
-def start_stream_processor(username, api_key, project_id, stream_instance, processor_name, start_at_time=None):
+def start_stream_processor(username, api_key, project_id, stream_instance, processor_name, start_at_time=None, session=None):
     """Starts a specific stream processor, optionally at a specific time.
 
     Args:
@@ -50,13 +44,14 @@ def start_stream_processor(username, api_key, project_id, stream_instance, proce
         processor_name: Name of the processor to start.
         start_at_time: Optional ISO 8601 date string.  If provided, change stream source
             processors will be started at this time.  Format: YYYY-MM-DDTHH:MM:SS.sssZ
+        session: Optional shared session from create_session().  Reusing one session keeps
+            connections and the digest nonce alive across calls.
+
+    Returns:
+        True if the processor was started, False otherwise.
     """
-    url = f"https://cloud.mongodb.com/api/atlas/v2/groups/{project_id}/streams/{stream_instance}/processor/{processor_name}:start"
-    headers = {
-        "Accept": "application/vnd.atlas.2024-05-30+json",
-        "Content-Type": "application/json",
-    }
-    auth = HTTPDigestAuth(username, api_key)
+    url = processor_url(project_id, stream_instance, processor_name, "start")
+    session = session or create_session(username, api_key)
 
     data = {}
     if start_at_time:
@@ -64,14 +59,17 @@ def start_stream_processor(username, api_key, project_id, stream_instance, proce
 
     try:
         # Use json.dumps() to serialize the data only when there's data to send
-        response = requests.post(url, headers=headers, auth=auth, data=json.dumps(data) if data else None)
+        response = session.post(url, data=json.dumps(data) if data else None)
         response.raise_for_status()
         print(f"Processor '{processor_name}' started successfully.")
+        return True
     except requests.exceptions.RequestException as e:
         print(f"Error starting processor '{processor_name}': {e}")
-        print(f"Response content: {response.text}")
+        if 'response' in locals():
+            print(f"Response content: {response.text}")
     except Exception as e:
         print(f"Unexpected Error starting processor: {e}")
+    return False
 
 
 
@@ -92,21 +90,29 @@ def main():
     parser = argparse.ArgumentParser(description="Start MongoDB Atlas Stream Processors.")
     parser.add_argument("--startAtOperationTime", type=str,
                         help="Optional ISO 8601 date string to start change stream source processors at. Format: YYYY-MM-DDTHH:MM:SS.sssZ")
+    parser.add_argument("--concurrency", type=int, default=1,
+                        help="Number of processors to start in parallel over one shared keep-alive session. Defaults to 1 (one at a time).")
     args = parser.parse_args()
     # --- End Argument Parsing ---
 
-    processors = get_atlas_stream_processors(username, api_key, project_id, stream_instance)
+    session = create_session(username, api_key, pool_size=args.concurrency)
+    processors = get_atlas_stream_processors(username, api_key, project_id, stream_instance, session=session)
 
     if processors:
         print(f"Found processors: {processors}")
+        to_start = []
         for name, state in processors:
             if state != "STARTED": # Check state before starting
-                start_stream_processor(username, api_key, project_id, stream_instance, name, args.startAtOperationTime)
+                to_start.append(name)
             else:
                 print(f"Processor '{name}' is already STARTED, skipping.") # Print message indicating a skip
+
+        run_fleet_action(
+            lambda name: start_stream_processor(username, api_key, project_id, stream_instance, name,
+                                                args.startAtOperationTime, session=session),
+            to_start, args.concurrency)
     else:
         print("Failed to retrieve stream processors.")
 
-
 if __name__ == "__main__":
     main()
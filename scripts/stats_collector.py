@@ -0,0 +1,212 @@
+import requests
+import re
+import struct
+import sys
+import time
+import os
+from dotenv import load_dotenv
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from atlas_admin import create_session, iter_stream_processors, processor_url
+from offline_helpers import percentile
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Samples memoryUsageBytes of every running processor over time and recommends a tier from
+# the peak, instead of the single reading used by ASP_tools/tier_sizer/tier_sizer.js.
+# See Performance_and_Sizing_Considerations.md: memory has to be sampled many times to
+# find the maximum a processor needs.
+
+# Same thresholds and tiers as tier_sizer.js.
+# Recommend the smallest tier where the processor uses at most 70% of the tier memory.
+RECOMMENDATION_PERCENT_THRESHOLD = 0.70
+# Stream Processing reserves 20% of memory; a processor above 80% of its tier is terminated.
+MEMORY_LIMIT_THRESHOLD = 0.80
+
+SP_TIERS = [
+    ("SP2", 536870912),
+    ("SP5", 1073741824),
+    ("SP10", 2147483648),
+    ("SP30", 8589934592),
+    ("SP50", 34359738368),
+]
+
+# Samples are appended to one file per processor as fixed 16 byte records:
+# sample time (float64 epoch seconds) and memoryUsageBytes (int64), little endian.
+SAMPLE = struct.Struct("<dq")
+
+# Growth is only projected forward once the samples span at least this long;
+# a slope fitted to a few minutes of noisy readings says nothing about the next day.
+MIN_GROWTH_SPAN_SECONDS = 3600
+
+
+def sample_path(directory, processor_name):
+    safe_name = re.sub(r"[^A-Za-z0-9_.-]", "_", processor_name)
+    return os.path.join(directory, f"{safe_name}.mem")
+
+
+def append_sample(directory, processor_name, sampled_at, memory_usage_bytes):
+    with open(sample_path(directory, processor_name), "ab") as f:
+        f.write(SAMPLE.pack(sampled_at, memory_usage_bytes))
+
+
+def read_samples(path):
+    """Returns the (sampled_at, memory_usage_bytes) samples recorded in a .mem file."""
+    with open(path, "rb") as f:
+        data = f.read()
+    usable = len(data) - len(data) % SAMPLE.size  # Ignore a partially written last record
+    return list(SAMPLE.iter_unpack(data[:usable]))
+
+
+def get_memory_usage(session, project_id, stream_instance, processor_name):
+    """Returns the processor's current memoryUsageBytes, or None if it has no stats (e.g. stopped)."""
+    response = session.get(processor_url(project_id, stream_instance, processor_name))
+    response.raise_for_status()
+    stats = response.json().get("stats") or {}
+    value = stats.get("memoryUsageBytes")
+    return int(value) if value is not None else None
+
+
+def collect(session, project_id, stream_instance, directory, interval, duration, concurrency):
+    """Polls every STARTED processor every `interval` seconds for `duration` seconds."""
+    os.makedirs(directory, exist_ok=True)
+    deadline = time.monotonic() + duration
+    sample_count = 0
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        while True:
+            tick = time.monotonic()
+            try:
+                names = [p["name"] for p in iter_stream_processors(session, project_id, stream_instance)
+                         if p["state"] == "STARTED"]
+            except (requests.exceptions.RequestException, ValueError, KeyError) as e:
+                print(f"Failed to list stream processors: {e}")
+                names = []
+
+            sampled_at = time.time()
+            futures = {name: executor.submit(get_memory_usage, session, project_id, stream_instance, name)
+                       for name in names}
+            for name, future in futures.items():
+                try:
+                    memory_usage = future.result()
+                except requests.exceptions.RequestException as e:
+                    print(f"Failed to read stats for '{name}': {e}")
+                    continue
+                if memory_usage is not None:
+                    append_sample(directory, name, sampled_at, memory_usage)
+                    sample_count += 1
+            print(f"Sampled {len(futures)} processors ({sample_count} samples so far)")
+
+            if tick + interval >= deadline:
+                break
+            time.sleep(max(0, tick + interval - time.monotonic()))
+
+
+def growth_bytes_per_hour(samples):
+    """Least-squares slope of memory usage over time, in bytes per hour."""
+    if len(samples) < 2:
+        return 0.0
+    times = [t for t, _ in samples]
+    values = [v for _, v in samples]
+    mean_t = sum(times) / len(times)
+    mean_v = sum(values) / len(values)
+    variance = sum((t - mean_t) ** 2 for t in times)
+    if variance == 0:
+        return 0.0
+    slope = sum((t - mean_t) * (v - mean_v) for t, v in samples) / variance
+    return slope * 3600
+
+
+def get_tier_recommendation(memory_usage_bytes):
+    """Returns (tier name, tier bytes) of the smallest tier at or below the 70% threshold, or None."""
+    for name, tier_bytes in SP_TIERS:
+        if memory_usage_bytes <= tier_bytes * RECOMMENDATION_PERCENT_THRESHOLD:
+            return name, tier_bytes
+    return None
+
+
+def report(directory, horizon_hours):
+    """Prints peak/p95/growth per processor and a tier recommendation from the recorded samples."""
+    print(f"Stream Processor Memory & Tier Recommendations (Targeting <= {RECOMMENDATION_PERCENT_THRESHOLD * 100:.0f}% "
+          f"of tier memory, projected {horizon_hours:g}h ahead):")
+    print("-------------------------------------------------")
+    print("Processor, Samples, Peak, p95, Growth/hour, Projected Peak, Recommended Tier, % Used of Tier")
+
+    for file_name in sorted(os.listdir(directory)):
+        if not file_name.endswith(".mem"):
+            continue
+        name = file_name[:-len(".mem")]
+        samples = read_samples(os.path.join(directory, file_name))
+        if not samples:
+            print(f"{name}, 0, N/A, N/A, N/A, N/A, No stats available, N/A")
+            continue
+
+        values = [v for _, v in samples]
+        peak = max(values)
+        p95 = percentile(values, 95)
+        growth = growth_bytes_per_hour(samples)
+        # Size for the larger of the observed peak and where steady growth would take it
+        projected = peak
+        if samples[-1][0] - samples[0][0] >= MIN_GROWTH_SPAN_SECONDS:
+            projected = max(peak, p95 + max(0.0, growth) * horizon_hours)
+
+        recommendation = get_tier_recommendation(projected)
+        if recommendation:
+            tier_name, tier_bytes = recommendation
+            percent_used = f"{projected / tier_bytes * 100:.1f}%"
+        else:
+            tier_name, percent_used = "No suitable tier (Larger than SP50)", "N/A"
+        print(f"{name}, {len(samples)}, {peak:,} bytes, {p95:,} bytes, {growth:,.0f} bytes, "
+              f"{projected:,.0f} bytes, {tier_name}, {percent_used}")
+
+        # Name the largest tier the observed peak would already get the processor terminated on
+        over_limit = [tier for tier, tier_bytes in SP_TIERS if peak > tier_bytes * MEMORY_LIMIT_THRESHOLD]
+        if over_limit:
+            print(f"  warning: peak exceeds the {MEMORY_LIMIT_THRESHOLD * 100:.0f}% memory limit of "
+                  f"{over_limit[-1]} and smaller tiers")
+
+
+def main():
+    # Argument parsing
+    parser = argparse.ArgumentParser(description="Sample stream processor memory over time and recommend tiers.")
+    parser.add_argument("--dir", default="processor_stats", help="Directory for the recorded sample files. Defaults to processor_stats.")
+    parser.add_argument("--interval", type=float, default=60, help="Seconds between samples. Defaults to 60.")
+    parser.add_argument("--duration", type=float, default=3600, help="Seconds to collect for. Defaults to 3600.")
+    parser.add_argument("--concurrency", type=int, default=8, help="Stats requests in flight. Defaults to 8.")
+    parser.add_argument("--horizon-hours", type=float, default=24,
+                        help="Hours of observed memory growth to size for. Growth is only projected once "
+                             "the samples span an hour. Defaults to 24.")
+    parser.add_argument("--replay", action="store_true",
+                        help="Do not poll; only print the report from the samples already in --dir.")
+    args = parser.parse_args()
+
+    if args.replay and not os.path.isdir(args.dir):
+        print(f"Error: No recorded samples directory '{args.dir}'. Record samples first (without --replay) "
+              f"or point --dir at an existing directory.")
+        sys.exit(1)
+
+    if not args.replay:
+        # Retrieve configuration from environment variables
+        username = os.getenv("ATLAS_USERNAME")
+        api_key = os.getenv("ATLAS_API_KEY")
+        project_id = os.getenv("ATLAS_PROJECT_ID")
+        stream_instance = os.getenv("ATLAS_STREAM_INSTANCE")
+
+        # Validate that all required environment variables are set
+        if not all([username, api_key, project_id, stream_instance]):
+            print("Error: Missing required environment variables.")
+            print("Please set ATLAS_USERNAME, ATLAS_API_KEY, ATLAS_PROJECT_ID, and ATLAS_STREAM_INSTANCE.")
+            sys.exit(1)
+
+        session = create_session(username, api_key, pool_size=args.concurrency)
+        try:
+            collect(session, project_id, stream_instance, args.dir, args.interval, args.duration, args.concurrency)
+        except KeyboardInterrupt:
+            print("Stopped collecting.")
+
+    report(args.dir, args.horizon_hours)
+
+
+if __name__ == "__main__":
+    main()
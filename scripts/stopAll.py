@@ -1,63 +1,36 @@
 import requests
-from requests.auth import HTTPDigestAuth
 import json
 import sys
 import time
 import os
 from dotenv import load_dotenv
 import argparse
+from atlas_admin import ProcessorInventory, create_session, processor_url, run_fleet_action
 
 # Load environment variables from .env file
 load_dotenv()
 
-def get_atlas_stream_processors(username, api_key, project_id, stream_instance):
-    """Retrieves stream processors and returns a list of (name, state) tuples."""
-    url = f"https://cloud.mongodb.com/api/atlas/v2/groups/{project_id}/streams/{stream_instance}/processors"
-    headers = {
-        "Accept": "application/vnd.atlas.2024-05-30+json",
-        "Content-Type": "application/json",
-    }
-    auth = HTTPDigestAuth(username, api_key)
+def stop_stream_processor(username, api_key, project_id, stream_instance, processor_name, session=None):
+    """Stops a specific stream processor.
 
-    try:
-        response = requests.get(url, headers=headers, auth=auth)
-        response.raise_for_status()
-        data = response.json()
-        # Extract processor name and state
-        return [(processor['name'], processor['state']) for processor in data['results']]
-    except requests.exceptions.RequestException as e:
-        print(f"An error occurred during the request: {e}")
-        if 'response' in locals():  # Check if response exists
-            print(f"Response content: {response.text}")
-        return None
-    except (ValueError, KeyError) as e:
-        print(f"Error processing JSON response: {e}")
-        if 'response' in locals():
-            print(f"Response content: {response.text}")
-        return None
-    except Exception as e:
-        print(f"Unexpected Error {e}")
-        return None
-
-
-def stop_stream_processor(username, api_key, project_id, stream_instance, processor_name):
-    """Stops a specific stream processor."""
-    url = f"https://cloud.mongodb.com/api/atlas/v2/groups/{project_id}/streams/{stream_instance}/processor/{processor_name}:stop"
-    headers = {
-        "Accept": "application/vnd.atlas.2024-05-30+json",
-        "Content-Type": "application/json",
-    }
-    auth = HTTPDigestAuth(username, api_key)
+    Returns:
+        True if the processor was stopped, False otherwise.
+    """
+    url = processor_url(project_id, stream_instance, processor_name, "stop")
+    session = session or create_session(username, api_key)
 
     try:
-        response = requests.post(url, headers=headers, auth=auth)
+        response = session.post(url)
         response.raise_for_status()
         print(f"Processor '{processor_name}' stopped successfully.")
+        return True
     except requests.exceptions.RequestException as e:
         print(f"Error stopping processor '{processor_name}': {e}")
-        print(f"Response content: {response.text}")
+        if 'response' in locals():
+            print(f"Response content: {response.text}")
     except Exception as e:
         print(f"Unexpected Error stopping processor: {e}")
+    return False
 
 
 
@@ -77,23 +50,47 @@ def main():
     # Argument parsing
     parser = argparse.ArgumentParser(description="Stop MongoDB Atlas Stream Processors.")
     parser.add_argument("--sleep", type=int, help="Sleep time in seconds between checks.  If omitted, the script runs only once.")
+    parser.add_argument("--concurrency", type=int, default=1,
+                        help="Number of processors to stop in parallel over one shared keep-alive session. Defaults to 1 (one at a time).")
+    parser.add_argument("--cache-ttl", type=float, default=0,
+                        help="Seconds to reuse the cached processor inventory before listing it again. Defaults to 0 (list on every check).")
     args = parser.parse_args()
 
+    # One session for the life of the script, so --sleep loops keep their connections warm
+    session = create_session(username, api_key, pool_size=args.concurrency)
+
     sleep_time = args.sleep
 
     # Determine if the script should run in a loop or just once
     run_loop = sleep_time is not None
 
+    # Only processors whose state changed since the previous check are acted on
+    inventory = ProcessorInventory(session, project_id, stream_instance, ttl=args.cache_ttl)
+
     while True:
-        processors = get_atlas_stream_processors(username, api_key, project_id, stream_instance)
-
-        if processors:
-            print(f"Found processors: {processors}")  # Print the (name, state) tuples
-            for name, state in processors:
-                if state == "STARTED":
-                    stop_stream_processor(username, api_key, project_id, stream_instance, name)
-        else:
-            print("Failed to retrieve stream processors.")
+        # Within --cache-ttl poll() returns the cached inventory without listing it again
+        fetched = not inventory.is_fresh()
+        try:
+            changed, removed = inventory.poll()
+        except (requests.exceptions.RequestException, ValueError, KeyError) as e:
+            print(f"Failed to retrieve stream processors: {e}")
+            changed, removed = None, []
+
+        if changed:
+            print(f"Changed processors: {changed}")  # Print the {name: state} changes
+            to_stop = [name for name, state in changed.items() if state == "STARTED"]
+            results = run_fleet_action(
+                lambda name: stop_stream_processor(username, api_key, project_id, stream_instance, name, session=session),
+                to_stop, args.concurrency)
+            for name, succeeded, _ in results:
+                if succeeded:
+                    inventory.set_state(name, "STOPPED")
+                else:
+                    inventory.forget(name)  # Retry on the next check
+        elif changed is not None and fetched:
+            print("No processor state changes.")
+        if removed:
+            print(f"Removed processors: {removed}")
 
         if not run_loop:
             break  # Exit after one iteration if no sleep time is specified
@@ -0,0 +1,241 @@
+import requests
+import json
+import sys
+import time
+import os
+from dotenv import load_dotenv
+import argparse
+from atlas_admin import atlas_base_url, create_session, processor_url, run_fleet_action
+from stopAll import stop_stream_processor
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Replaces change stream processors with new versions without losing or replaying events,
+# automating the terraform/updateCSProcessors steps in one tight sequence per swap:
+#
+#   1. stop old -> read its resume token (stats.changeStreamState)
+#   2. create new with the token as $source.config.startAfter, the way
+#      terraform/updateCSProcessors/scripts/updateprocessor.tf injects it, then start it
+#   3. optionally delete the old processors
+#
+# If anything after the stop fails, the old processor is started again so the stream keeps
+# flowing, and a new processor that was created but failed to start is deleted again so the
+# swap can simply be retried. If the old processor reports no resume token the swap is aborted
+# the same way, unless --allow-no-token accepts starting the new processor from "now" (losing
+# the events written in between).
+#
+# The handover gap (from the stop call until the new processor is started) is measured for
+# every swap. With --overlap the token is read and the new processor started before the old
+# one is stopped, so there is no gap at all; events between the token and the stop are then
+# processed by both, which is only safe with an idempotent sink such as $merge on _id.
+
+
+def load_swaps(path):
+    """Reads a swap plan: a JSON list of {"old", "new", "pipeline"[, "options"]} objects.
+
+    `pipeline` is either the pipeline itself or the path of a JSON file containing it
+    (for example terraform/updateCSProcessors/new_processor.js), relative to the plan file.
+    """
+    with open(path) as f:
+        swaps = json.load(f)
+    for swap in swaps:
+        if isinstance(swap["pipeline"], str):
+            with open(os.path.join(os.path.dirname(os.path.abspath(path)), swap["pipeline"])) as f:
+                swap["pipeline"] = json.load(f)
+    return swaps
+
+
+class HandoverError(Exception):
+    pass
+
+
+def create_stream_processor(session, project_id, stream_instance, name, pipeline, options=None):
+    """Creates a processor in the CREATED (not running) state. Raises on failure."""
+    url = f"{atlas_base_url()}/api/atlas/v2/groups/{project_id}/streams/{stream_instance}/processor"
+    body = {"name": name, "pipeline": pipeline}
+    if options:
+        body["options"] = options
+    response = session.post(url, data=json.dumps(body))
+    response.raise_for_status()
+
+
+def with_start_after(pipeline, token):
+    """Returns a copy of a change stream pipeline with $source.config.startAfter = token."""
+    if not pipeline or "$source" not in pipeline[0]:
+        raise HandoverError("the new pipeline does not start with $source")
+    source = dict(pipeline[0]["$source"])
+    source["config"] = dict(source.get("config") or {}, startAfter=token)
+    return [{"$source": source}] + list(pipeline[1:])
+
+
+def delete_stream_processor(session, project_id, stream_instance, name):
+    try:
+        response = session.delete(processor_url(project_id, stream_instance, name))
+        response.raise_for_status()
+        print(f"Processor '{name}' deleted.")
+        return True
+    except requests.exceptions.RequestException as e:
+        print(f"Error deleting processor '{name}': {e}")
+        return False
+
+
+def get_resume_token(session, project_id, stream_instance, name):
+    """Returns the processor's change stream resume token (stats.changeStreamState), or None."""
+    response = session.get(processor_url(project_id, stream_instance, name))
+    response.raise_for_status()
+    return (response.json().get("stats") or {}).get("changeStreamState")
+
+
+def start_stream_processor(session, project_id, stream_instance, name):
+    response = session.post(processor_url(project_id, stream_instance, name, "start"))
+    response.raise_for_status()
+
+
+def start_replacement(session, project_id, stream_instance, swap, token, allow_no_token):
+    """Creates the new processor resuming after `token` and starts it.
+
+    If the start fails, the new processor is deleted again so a retry of the swap does not
+    fail on "already exists"; the HandoverError says whether it was left behind.
+    """
+    if token is None and not allow_no_token:
+        raise HandoverError(f"'{swap['old']}' reported no changeStreamState (use --allow-no-token to start from now)")
+    pipeline = swap["pipeline"] if token is None else with_start_after(swap["pipeline"], token)
+    create_stream_processor(session, project_id, stream_instance, swap["new"], pipeline, swap.get("options"))
+    try:
+        start_stream_processor(session, project_id, stream_instance, swap["new"])
+    except requests.exceptions.RequestException as e:
+        if delete_stream_processor(session, project_id, stream_instance, swap["new"]):
+            raise HandoverError(f"starting '{swap['new']}' failed ({e}); it was deleted again") from e
+        raise HandoverError(f"starting '{swap['new']}' failed ({e}); it is left CREATED, "
+                            f"delete it before retrying") from e
+
+
+def hand_over(session, project_id, stream_instance, swap, overlap=False, allow_no_token=False):
+    """Moves one old processor's change stream position to its replacement.
+
+    Returns (timings, problem): the handover gap and step timings in seconds, or None and a
+    description of the state the processors were left in.
+    """
+    old, new = swap["old"], swap["new"]
+    timings = {}
+    if overlap:
+        try:
+            start = time.perf_counter()
+            token = get_resume_token(session, project_id, stream_instance, old)
+            timings["token"] = time.perf_counter() - start
+            start_replacement(session, project_id, stream_instance, swap, token, allow_no_token)
+            timings["start"] = time.perf_counter() - start - timings["token"]
+        except (requests.exceptions.RequestException, HandoverError) as e:
+            print(f"Error swapping '{old}' -> '{new}': {e}")
+            return None, f"'{old}' still running, '{new}' not started: {e}"
+        stopped = time.perf_counter()
+        if not stop_stream_processor(None, None, project_id, stream_instance, old, session=session):
+            print(f"Stopping '{old}' failed: BOTH '{old}' and '{new}' are running")
+            return None, f"BOTH '{old}' and '{new}' running"
+        timings["stop"] = time.perf_counter() - stopped
+        timings["gap"] = 0.0
+    else:
+        gap_start = time.perf_counter()
+        if not stop_stream_processor(None, None, project_id, stream_instance, old, session=session):
+            return None, f"stopping '{old}' failed, '{new}' not created"
+        timings["stop"] = time.perf_counter() - gap_start
+        try:
+            token = get_resume_token(session, project_id, stream_instance, old)
+            timings["token"] = time.perf_counter() - gap_start - timings["stop"]
+            start_replacement(session, project_id, stream_instance, swap, token, allow_no_token)
+        except (requests.exceptions.RequestException, HandoverError) as e:
+            # Put the old processor back so the stream keeps flowing; it resumes from its checkpoint
+            print(f"Error swapping '{old}' -> '{new}': {e}. Restarting '{old}'")
+            try:
+                start_stream_processor(session, project_id, stream_instance, old)
+            except requests.exceptions.RequestException as restart_error:
+                print(f"Restarting '{old}' failed: {restart_error}")
+                return None, f"'{old}' STOPPED and could not be restarted; {e}"
+            return None, f"'{old}' restarted; {e}"
+        timings["gap"] = time.perf_counter() - gap_start
+        timings["start"] = timings["gap"] - timings["stop"] - timings["token"]
+
+    if token is None:
+        print(f"Warning: '{old}' reported no changeStreamState; '{new}' started from now (--allow-no-token)")
+    print(f"Processor '{new}' started after '{old}' (gap {timings['gap'] * 1000:.0f} ms)")
+    return timings, None
+
+
+def main():
+    # Retrieve configuration from environment variables
+    username = os.getenv("ATLAS_USERNAME")
+    api_key = os.getenv("ATLAS_API_KEY")
+    project_id = os.getenv("ATLAS_PROJECT_ID")
+    stream_instance = os.getenv("ATLAS_STREAM_INSTANCE")
+
+    # Validate that all required environment variables are set
+    if not all([username, api_key, project_id, stream_instance]):
+        print("Error: Missing required environment variables.")
+        print("Please set ATLAS_USERNAME, ATLAS_API_KEY, ATLAS_PROJECT_ID, and ATLAS_STREAM_INSTANCE.")
+        sys.exit(1)
+
+    # --- Argument Parsing ---
+    parser = argparse.ArgumentParser(description="Replace change stream processors using a resume token handoff.")
+    parser.add_argument("--plan", help="JSON swap plan: a list of {\"old\", \"new\", \"pipeline\"[, \"options\"]} objects.")
+    parser.add_argument("--old", help="Name of the processor to replace (single swap).")
+    parser.add_argument("--new", help="Name of the replacement processor (single swap).")
+    parser.add_argument("--pipeline", help="JSON file with the replacement pipeline (single swap).")
+    parser.add_argument("--concurrency", type=int, default=1,
+                        help="Number of swaps to run in parallel over one shared keep-alive session. Defaults to 1.")
+    parser.add_argument("--overlap", action="store_true",
+                        help="Start the new processor before stopping the old one (no gap, possible duplicates).")
+    parser.add_argument("--allow-no-token", action="store_true",
+                        help="Start the new processor from now if the old one reports no resume token, instead of aborting.")
+    parser.add_argument("--delete-old", action="store_true",
+                        help="Delete the old processors after a successful swap. By default they are kept stopped for rollback.")
+    args = parser.parse_args()
+    # --- End Argument Parsing ---
+
+    if args.plan:
+        swaps = load_swaps(args.plan)
+    elif args.old and args.new and args.pipeline:
+        with open(args.pipeline) as f:
+            swaps = [{"old": args.old, "new": args.new, "pipeline": json.load(f)}]
+    else:
+        parser.error("give --plan, or --old, --new and --pipeline")
+
+    session = create_session(username, api_key, pool_size=args.concurrency)
+    by_old = {swap["old"]: swap for swap in swaps}
+    for swap in swaps:
+        if not swap["pipeline"] or "$source" not in swap["pipeline"][0]:
+            parser.error(f"the pipeline for '{swap['new']}' does not start with $source")
+
+    print(f"Handing over {len(swaps)} processors{' with overlap' if args.overlap else ''}")
+    timings, problems = {}, {}
+
+    def swap_one(old):
+        timings[old], problems[old] = hand_over(session, project_id, stream_instance, by_old[old], args.overlap,
+                                                args.allow_no_token)
+        return timings[old] is not None
+
+    swapped = [old for old, succeeded, _ in run_fleet_action(swap_one, list(by_old), args.concurrency) if succeeded]
+
+    if swapped:
+        gaps = sorted(timings[old]["gap"] for old in swapped)
+        print(f"Handover gap over {len(gaps)} swaps: min={gaps[0] * 1000:.0f} ms "
+              f"median={gaps[len(gaps) // 2] * 1000:.0f} ms max={gaps[-1] * 1000:.0f} ms")
+        for step in ("stop", "token", "start"):
+            values = sorted(timings[old][step] for old in swapped)
+            print(f"  {step:<5} median={values[len(values) // 2] * 1000:.0f} ms max={values[-1] * 1000:.0f} ms")
+
+    if args.delete_old and swapped:
+        print(f"Deleting {len(swapped)} old processors")
+        run_fleet_action(lambda old: delete_stream_processor(session, project_id, stream_instance, old),
+                         swapped, args.concurrency)
+
+    failed = [old for old in by_old if old not in swapped]
+    if failed:
+        print(f"{len(failed)} swaps did not complete:")
+        for old in failed:
+            print(f"  {old}: {problems.get(old) or 'not attempted'}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,439 @@
+import argparse
+import hashlib
+import json
+import math
+import random
+import sys
+import time
+from array import array
+from offline_helpers import percentile, plain, to_epoch
+
+try:
+    import bson
+
+    def encode(value):
+        return bson.encode({"v": value})
+except ImportError:
+    def encode(value):
+        return json.dumps(value, default=str).encode()
+
+# Replays an event stream through the window patterns of code_snippets/dedupe_whole_doc.js and
+# code_snippets/distinct_count.js and measures how much state each window holds, next to
+# approximate alternatives, to judge the memory/accuracy trade-off before restructuring windows.
+#
+# Both snippets keep every distinct value until the window closes: dedupe groups by $$ROOT (the
+# whole document) and distinct count collects the values with $addToSet. That state is what
+# memoryUsageBytes grows with on high-cardinality streams.
+#
+#   distinct  exact    $addToSet then $size (the snippet; its $group-twice alternative holds the same keys)
+#             hll-P    HyperLogLog with 2^P one-byte registers, for each --hll-precision P
+#   dedupe    exact    $group by $$ROOT, then $sum of --sum-field per --group-field (the snippet)
+#             hashed   $group by {$toHashedIndexKey: "$$ROOT"} keeping only the two fields the
+#                      second $group needs with $first; runs in ASP as is
+#             bloom    Bloom filter sized for --expected-items at --fp-rate
+#             cuckoo   cuckoo filter with 16-bit fingerprints and buckets of 4
+#
+# The Bloom and cuckoo filters have no ASP operator; they show what dedupe in a producer or in
+# a service in front of the processor would hold instead. A false positive drops a unique
+# document, so their error shows up as undercounted sums.
+#
+# State sizes are modelled: BSON size of each kept value plus ENTRY_OVERHEAD bytes per entry for
+# the hash table, or the size of the sketch. Compare them between engines rather than to
+# memoryUsageBytes directly.
+#
+# Events are JSON lines; tumbling windows follow --time-field (ISO date, {"$date": ...} or epoch
+# ms), or arrival order at --rate events/sec if the events have no time. --generate writes a
+# synthetic device stream with duplicates instead.
+#
+#   python3 window_state_bench.py distinct events.jsonl --field device_id --window-seconds 30
+#   python3 window_state_bench.py dedupe events.jsonl --group-field entity --sum-field count --window-seconds 5
+#   python3 window_state_bench.py distinct --generate 2000000 --devices 500000 --rate 20000 --hll-precision 10,12,14
+
+# Bytes a stored entry adds to its value in a hash-based group (pointers, hash, allocation)
+ENTRY_OVERHEAD = 48
+
+
+def hash64(data, seed=0):
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8, salt=seed.to_bytes(8, "little")).digest(), "little")
+
+
+class ExactDistinct:
+    """$addToSet: every distinct value is kept."""
+
+    def __init__(self):
+        self.values = set()
+        self.bytes = 0
+
+    def add(self, encoded):
+        if encoded not in self.values:
+            self.values.add(encoded)
+            self.bytes += len(encoded) + ENTRY_OVERHEAD
+
+    def count(self):
+        return len(self.values)
+
+
+class HyperLogLog:
+    """Distinct count estimate in 2^p registers; standard error about 1.04 / sqrt(2^p)."""
+
+    def __init__(self, p):
+        self.p = p
+        self.m = 1 << p
+        self.registers = bytearray(self.m)
+        self.bytes = self.m
+        self.alpha = 0.7213 / (1 + 1.079 / self.m)
+
+    def add(self, encoded):
+        h = hash64(encoded)
+        index = h >> (64 - self.p)
+        rest = h & ((1 << (64 - self.p)) - 1)
+        rank = (64 - self.p) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def count(self):
+        estimate = self.alpha * self.m * self.m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * self.m and zeros:
+            # Small-range correction: linear counting on the empty registers
+            estimate = self.m * math.log(self.m / zeros)
+        return round(estimate)
+
+
+class ExactDedupe:
+    """$group by $$ROOT: every distinct document is kept whole."""
+
+    def __init__(self):
+        self.seen = set()
+        self.bytes = 0
+
+    def first_time(self, encoded, digest, summary_bytes):
+        if encoded in self.seen:
+            return False
+        self.seen.add(encoded)
+        self.bytes += len(encoded) + ENTRY_OVERHEAD
+        return True
+
+
+class HashedDedupe:
+    """$group by $toHashedIndexKey of $$ROOT, keeping $first of the group and sum fields only."""
+
+    def __init__(self):
+        self.seen = set()
+        self.bytes = 0
+
+    def first_time(self, encoded, digest, summary_bytes):
+        if digest in self.seen:
+            return False
+        self.seen.add(digest)
+        self.bytes += 8 + summary_bytes + ENTRY_OVERHEAD
+        return True
+
+
+class BloomDedupe:
+    """Bloom filter with the bit count and hash count that give fp_rate at expected_items."""
+
+    def __init__(self, expected_items, fp_rate):
+        self.size = max(64, int(-expected_items * math.log(fp_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / expected_items * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.bytes = len(self.bits)
+
+    def first_time(self, encoded, digest, summary_bytes):
+        # Double hashing: the k positions are h1 + i * h2
+        h1, h2 = digest & 0xFFFFFFFF, (digest >> 32) | 1
+        present = True
+        for i in range(self.hashes):
+            position = (h1 + i * h2) % self.size
+            byte, bit = position >> 3, 1 << (position & 7)
+            if not self.bits[byte] & bit:
+                present = False
+                self.bits[byte] |= bit
+        return not present
+
+
+class CuckooDedupe:
+    """Cuckoo filter: 16-bit fingerprints in buckets of 4, each with two candidate buckets."""
+
+    SLOTS = 4
+    MAX_KICKS = 500
+
+    def __init__(self, expected_items, seed=0):
+        buckets = 1
+        while buckets * self.SLOTS * 0.95 < expected_items:
+            buckets <<= 1
+        self.mask = buckets - 1
+        self.table = array("H", [0]) * (buckets * self.SLOTS)
+        self.bytes = len(self.table) * self.table.itemsize
+        self.rng = random.Random(seed)
+        self.overflows = 0
+        # Once an insert has failed the table is too full for kicks to find room; later inserts
+        # that find both buckets full are counted as overflows without kicking
+        self.saturated = False
+
+    def alternate(self, bucket, fingerprint):
+        return (bucket ^ hash64(fingerprint.to_bytes(2, "little"))) & self.mask
+
+    def slots(self, bucket):
+        return range(bucket * self.SLOTS, (bucket + 1) * self.SLOTS)
+
+    def first_time(self, encoded, digest, summary_bytes):
+        fingerprint = (digest >> 48) or 1
+        first = digest & self.mask
+        second = self.alternate(first, fingerprint)
+        for bucket in (first, second):
+            if any(self.table[slot] == fingerprint for slot in self.slots(bucket)):
+                return False
+        for bucket in (first, second):
+            for slot in self.slots(bucket):
+                if not self.table[slot]:
+                    self.table[slot] = fingerprint
+                    return True
+        if self.saturated:
+            self.overflows += 1
+            return True
+        # Both buckets are full: relocate fingerprints until one finds room
+        bucket = self.rng.choice((first, second))
+        for _ in range(self.MAX_KICKS):
+            slot = bucket * self.SLOTS + self.rng.randrange(self.SLOTS)
+            fingerprint, self.table[slot] = self.table[slot], fingerprint
+            bucket = self.alternate(bucket, fingerprint)
+            for slot in self.slots(bucket):
+                if not self.table[slot]:
+                    self.table[slot] = fingerprint
+                    return True
+        # The filter is full; the evicted fingerprint is lost, so one earlier document can pass again
+        self.overflows += 1
+        self.saturated = True
+        return True
+
+
+def engines_for(args):
+    """Returns {name: factory} of the engines to compare for the mode."""
+    if args.mode == "distinct":
+        engines = {"exact": ExactDistinct}
+        for p in args.hll_precision:
+            engines[f"hll-{p}"] = lambda p=p: HyperLogLog(p)
+        return engines
+    return {"exact": ExactDedupe, "hashed": HashedDedupe,
+            "bloom": lambda: BloomDedupe(args.expected_items, args.fp_rate),
+            "cuckoo": lambda: CuckooDedupe(args.expected_items, args.seed or 0)}
+
+
+def get_path(document, path):
+    value = document
+    for part in path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+    return value
+
+
+def read_events(path, args):
+    """Yields (event time in seconds, document) from a JSONL file, stdin ("-") or the generator."""
+    if args.generate:
+        yield from generate(args)
+        return
+    with (sys.stdin if path == "-" else open(path, encoding="utf-8")) as f:
+        index = 0
+        for line in f:
+            line = line.strip()
+            if not line.startswith("{"):
+                continue
+            document = plain(json.loads(line))
+            at = to_epoch(get_path(document, args.time_field)) if args.time_field else None
+            yield (at if at is not None else index / args.rate), document
+            index += 1
+
+
+def generate(args):
+    """A device stream ({device_id, entity, count}) where --dup-rate of the events repeat a recent one."""
+    rng = random.Random(args.seed)
+    recent = []
+    for i in range(args.generate):
+        if recent and rng.random() < args.dup_rate:
+            document = rng.choice(recent)
+        else:
+            device = rng.randrange(args.devices)
+            document = {"device_id": f"device-{device:07d}", "entity": device % 100,
+                        "count": rng.randrange(1, 50), "seq": i}
+            recent.append(document)
+            if len(recent) > 1000:
+                recent.pop(rng.randrange(len(recent)))
+        yield i / args.rate, document
+
+
+class Window:
+    """One tumbling window: every engine's state, plus the exact answer to score them against."""
+
+    def __init__(self, start, factories):
+        self.start = start
+        self.events = 0
+        self.engines = {name: factory() for name, factory in factories.items()}
+        self.sums = {name: {} for name in self.engines}
+        self.passed = {name: 0 for name in self.engines}
+
+    def add(self, document, args, timings):
+        self.events += 1
+        if args.mode == "distinct":
+            encoded = encode(get_path(document, args.field))
+            for name, engine in self.engines.items():
+                started = time.perf_counter()
+                engine.add(encoded)
+                timings[name] += time.perf_counter() - started
+            return
+        encoded = encode(document)
+        group, amount = get_path(document, args.group_field), get_path(document, args.sum_field)
+        summary_bytes = len(encode(group)) + len(encode(amount))
+        key = json.dumps(group, default=str)
+        started = time.perf_counter()
+        digest = hash64(encoded)
+        hashing = time.perf_counter() - started
+        for name, engine in self.engines.items():
+            started = time.perf_counter()
+            if engine.first_time(encoded, digest, summary_bytes):
+                self.passed[name] += 1
+                self.sums[name][key] = self.sums[name].get(key, 0) + (amount if isinstance(amount, (int, float)) else 0)
+            timings[name] += time.perf_counter() - started + (hashing if name != "exact" else 0)
+
+    def close(self, args):
+        """Returns {engine: (result, state bytes, relative error or None)} for this window."""
+        results = {}
+        if args.mode == "distinct":
+            truth = self.engines["exact"].count()
+            for name, engine in self.engines.items():
+                estimate = engine.count()
+                results[name] = (estimate, engine.bytes, (estimate - truth) / truth if truth else 0.0)
+            return results
+        truth = self.sums["exact"]
+        for name, engine in self.engines.items():
+            sums = self.sums[name]
+            # Largest relative error over the groups' sums
+            error = max((abs(sums.get(key, 0) - value) / abs(value) for key, value in truth.items() if value),
+                        default=0.0)
+            results[name] = (self.passed[name], engine.bytes, error)
+        return results
+
+
+def run(args):
+    factories = engines_for(args)
+    timings = {name: 0.0 for name in factories}
+    windows = {}
+    closed = []
+    watermark = float("-inf")
+    late = overflows = 0
+    for at, document in read_events(args.events, args):
+        start = math.floor(at / args.window_seconds) * args.window_seconds
+        watermark = max(watermark, at)
+        if start + args.window_seconds + args.allowed_lateness <= watermark and start not in windows:
+            late += 1
+            continue
+        windows.setdefault(start, Window(start, factories)).add(document, args, timings)
+        for ready in [s for s in windows if s + args.window_seconds + args.allowed_lateness <= watermark]:
+            window = windows.pop(ready)
+            closed.append((window.start, window.events, window.close(args)))
+            overflows += getattr(window.engines.get("cuckoo"), "overflows", 0)
+    for start in sorted(windows):
+        closed.append((start, windows[start].events, windows[start].close(args)))
+        overflows += getattr(windows[start].engines.get("cuckoo"), "overflows", 0)
+    return closed, timings, late, overflows
+
+
+def print_report(closed, timings, late, overflows, args):
+    names = list(closed[0][2]) if closed else []
+    result_label = "distinct" if args.mode == "distinct" else "kept"
+    print(f"{len(closed)} windows of {args.window_seconds:g}s, {sum(events for _, events, _ in closed):,} events"
+          + (f", {late} late events dropped" if late else ""))
+    print("-------------------------------------------------")
+    print(f"{'Window':>10} {'Events':>9} " + " ".join(f"{name + ' ' + result_label:>16} {'KB':>9}" for name in names))
+    shown = closed if len(closed) <= args.show_windows else closed[:args.show_windows]
+    for start, events, results in shown:
+        cells = []
+        for name in names:
+            value, size, error = results[name]
+            label = f"{value:,}"
+            if name != "exact":
+                label += f" {error * 100:+.1f}%" if args.mode == "distinct" else f" {error * 100:.1f}%"
+            cells.append(f"{label:>16} {size / 1024:>9,.1f}")
+        print(f"{start:>10.0f} {events:>9,} " + " ".join(cells))
+    if len(closed) > len(shown):
+        print(f"... {len(closed) - len(shown)} more windows")
+
+    print("-------------------------------------------------")
+    error_label = "relative error of the count" if args.mode == "distinct" else "largest relative error of a group's sum"
+    print(f"{'Engine':<10} {'State p50 KB':>13} {'State max KB':>13} {'vs exact':>9} {'Mean err':>9} {'Max err':>9} "
+          f"{'Events/sec':>11}   (error = {error_label})")
+    total_events = sum(events for _, events, _ in closed)
+    exact_max = max(results["exact"][1] for _, _, results in closed)
+    summary = {}
+    for name in names:
+        sizes = [results[name][1] for _, _, results in closed]
+        errors = [abs(results[name][2]) for _, _, results in closed]
+        summary[name] = {
+            "state_p50_bytes": percentile(sizes, 50),
+            "state_max_bytes": max(sizes),
+            "mean_error": sum(errors) / len(errors),
+            "max_error": max(errors),
+            "events_per_sec": total_events / timings[name] if timings[name] else None,
+        }
+        s = summary[name]
+        print(f"{name:<10} {s['state_p50_bytes'] / 1024:>13,.1f} {s['state_max_bytes'] / 1024:>13,.1f} "
+              f"{s['state_max_bytes'] / exact_max * 100 if exact_max else 0:>8.1f}% {s['mean_error'] * 100:>8.2f}% "
+              f"{s['max_error'] * 100:>8.2f}% {s['events_per_sec'] or 0:>11,.0f}")
+    if args.mode == "dedupe":
+        if overflows:
+            print(f"cuckoo was full {overflows:,} times; each time an earlier document could pass as new again")
+        oversized = [results["exact"][0] for _, _, results in closed if results["exact"][0] > args.expected_items]
+        if oversized:
+            print(f"WARNING: {len(oversized)} of {len(closed)} windows held more than --expected-items "
+                  f"({args.expected_items:,}) distinct documents, up to {max(oversized):,}. The bloom and cuckoo "
+                  f"results for them are not meaningful; rerun with --expected-items {max(oversized)} or more.")
+        else:
+            print(f"bloom and cuckoo are sized for {args.expected_items:,} distinct documents per window; "
+                  f"windows holding more than that lose accuracy quickly")
+    return summary
+
+
+def parse_precisions(text):
+    precisions = [int(p) for p in text.split(",")]
+    if any(not 4 <= p <= 18 for p in precisions):
+        raise argparse.ArgumentTypeError("HyperLogLog precision must be between 4 and 18")
+    return precisions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure window state of dedupe and distinct-count patterns against approximate alternatives.")
+    parser.add_argument("mode", choices=["distinct", "dedupe"], help="distinct_count.js or dedupe_whole_doc.js pattern.")
+    parser.add_argument("events", nargs="?", default="-", help="JSONL events, or - for stdin (the default).")
+    parser.add_argument("--window-seconds", type=float, default=30, help="Tumbling window size. Defaults to 30.")
+    parser.add_argument("--allowed-lateness", type=float, default=0, help="Seconds a window stays open past its end. Defaults to 0.")
+    parser.add_argument("--time-field", help="Field with the event time. Defaults to arrival order at --rate.")
+    parser.add_argument("--rate", type=float, default=1000, help="Events/sec when the events have no time. Defaults to 1000.")
+    parser.add_argument("--field", default="device_id", help="distinct: field to count distinct values of. Defaults to device_id.")
+    parser.add_argument("--hll-precision", type=parse_precisions, default=[12],
+                        help="distinct: comma-separated HyperLogLog precisions. Defaults to 12.")
+    parser.add_argument("--group-field", default="entity", help="dedupe: field of the second $group. Defaults to entity.")
+    parser.add_argument("--sum-field", default="count", help="dedupe: field summed per group. Defaults to count.")
+    parser.add_argument("--expected-items", type=int, default=100000,
+                        help="dedupe: distinct documents per window the filters are sized for. Defaults to 100000.")
+    parser.add_argument("--fp-rate", type=float, default=0.001, help="dedupe: Bloom filter false positive rate. Defaults to 0.001.")
+    parser.add_argument("--generate", type=int, default=0, help="Use this many synthetic device events instead of a file.")
+    parser.add_argument("--devices", type=int, default=100000, help="Distinct devices in generated events. Defaults to 100000.")
+    parser.add_argument("--dup-rate", type=float, default=0.2, help="Share of generated events that repeat a recent one. Defaults to 0.2.")
+    parser.add_argument("--seed", type=int, help="Random seed for the generator.")
+    parser.add_argument("--show-windows", type=int, default=20, help="Windows to list. Defaults to 20.")
+    parser.add_argument("--output", help="Write the per-engine summary as JSON to this file.")
+    args = parser.parse_args()
+
+    closed, timings, late, overflows = run(args)
+    if not closed:
+        print("No events.")
+        sys.exit(1)
+    summary = print_report(closed, timings, late, overflows, args)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()